@@ -0,0 +1,163 @@
+import argparse
+import csv
+import io
+import sys
+import time
+
+import diagnostico
+import exportacao
+import motor_calculo as motor
+import series_bcb
+from calculo_lote import centavos
+from resultado_compacto import centavos_int
+
+# --- REAJUSTE DE ALUGUEL EM LOTE (CARTEIRA DE CONTRATOS) ---
+# Uso: python aluguel_lote.py contratos.csv --saida reajustes.csv [--ano 2025] [--pacote series.calcjus]
+# Colunas: id, valor, indice (IGP-M, IPCA, INPC, TJSP... ou código SGS) e data_reajuste, ou
+# inicio_contrato + --ano (o reajuste cai no aniversário do contrato naquele ano).
+# Os contratos são agrupados por (índice, mês do reajuste): cada fator de 12 meses é calculado
+# uma única vez por grupo, na janela do mês (motor.janela_reajuste_aluguel), e cada série é consultada uma única vez (armazém/pacote compartilhado),
+# cobrindo a união das janelas dos contratos. Com --saida .xlsx/.parquet (ou --formato) a saída
+# tem colunas tipadas: centavos inteiros e o fator de 12 meses exato (ver exportacao).
+
+COLUNAS_SAIDA = ["id", "indice", "data_reajuste", "periodo", "valor_antigo", "fator", "novo_valor", "erro"]
+ESQUEMA_TIPADO = [("id", "texto"), ("indice", "texto"), ("data_reajuste", "data"), ("inicio_periodo", "data"),
+                  ("valor_antigo_centavos", "centavos"), ("fator", "decimal"), ("novo_valor_centavos", "centavos"), ("erro", "texto")]
+BLOCO_EXPORTACAO = 50_000
+NOMES_INDICES = {cod: nome.split(" - ")[0] for nome, cod in motor.mapa_indices_completo.items()}
+
+def aniversario(inicio_contrato, ano):
+    # 29/02 cai em 28/02 nos anos não bissextos
+    try:
+        return inicio_contrato.replace(year=ano)
+    except ValueError:
+        return inicio_contrato.replace(year=ano, day=28)
+
+def ler_contratos(registros, ano=None):
+    # registros: dicionários do csv.DictReader -> ([(id, valor, codigo, data_reajuste)], [erros])
+    contratos, invalidos = [], []
+    for i, bruto in enumerate(registros, start=1):
+        try:
+            data_reajuste = motor.ler_data(bruto.get("data_reajuste"))
+            if data_reajuste is None:
+                inicio = motor.ler_data(bruto.get("inicio_contrato"))
+                if inicio is None or ano is None:
+                    raise ValueError("informe data_reajuste ou inicio_contrato com o ano do reajuste")
+                data_reajuste = aniversario(inicio, ano)
+            contratos.append((str(bruto.get("id", "")), motor.to_decimal(bruto.get("valor")),
+                              motor.ler_indice(bruto.get("indice")), data_reajuste))
+        except Exception as e:
+            invalidos.append(f"linha {i}: {e}")
+    return contratos, invalidos
+
+def grupo(cod, dt_reaj):
+    # Chave do grupo: índice e janela de 12 meses do mês do reajuste
+    return (cod, *motor.janela_reajuste_aluguel(dt_reaj))
+
+def fatores_por_grupo(contratos, calc_tjsp, armazem=None, offline=False):
+    # {(codigo, inicio, fim): fator ou None} por grupo(), com uma consulta por série para todos os grupos
+    grupos = {grupo(cod, dt_reaj) for _, _, cod, dt_reaj in contratos}
+    uniao = {}
+    for janela in grupos:
+        if not motor.janela_valida(janela): continue
+        cod = janela[0]
+        atual = uniao.get(cod)
+        uniao[cod] = (min(atual[0], janela[1]), max(atual[1], janela[2])) if atual else janela[1:]
+    janelas = [(cod, inicio, fim) for cod, (inicio, fim) in uniao.items()]
+    series = dict(zip(uniao, series_bcb.obter_series(janelas, armazem=armazem, offline=offline)))
+
+    fatores = {}
+    with diagnostico.etapa("fatores"):
+        for janela in grupos:
+            cod, dt_ini, dt_fim = janela
+            fatores[janela] = motor.fator_indice(cod, motor.serie_da_janela(series, janela), calc_tjsp, dt_ini, dt_fim)
+    return fatores, series
+
+def reajustar_contratos(contratos, calc_tjsp, armazem=None, offline=False):
+    # Linhas de saída (COLUNAS_SAIDA) na ordem dos contratos, fatores por grupo e séries usadas
+    fatores, series = fatores_por_grupo(contratos, calc_tjsp, armazem, offline)
+    textos = {}
+    for chave, fator in fatores.items():
+        cod, dt_ini, dt_fim = chave
+        textos[chave] = (NOMES_INDICES.get(cod, str(cod)), f"{dt_ini.strftime('%d/%m/%Y')} a {dt_fim.strftime('%d/%m/%Y')}",
+                         motor.formatar_decimal_str(fator) if fator else "")
+    linhas = []
+    with diagnostico.etapa("calculo_linhas"):
+        for caso_id, valor, cod, dt_reaj in contratos:
+            chave = grupo(cod, dt_reaj)
+            fator = fatores[chave]
+            indice, periodo, fator_txt = textos[chave]
+            # Mesma conta de motor.calcular_reajuste_aluguel (valor atual x fator de 12 meses)
+            linhas.append({"id": caso_id, "indice": indice, "data_reajuste": dt_reaj.strftime("%d/%m/%Y"), "periodo": periodo,
+                           "valor_antigo": centavos(valor), "fator": fator_txt,
+                           "novo_valor": centavos(valor * fator) if fator else "",
+                           "erro": "" if fator else "índice sem dados para o período"})
+    diagnostico.contar("linhas_processadas", len(contratos))
+    return linhas, fatores, series
+
+def blocos_tipados(contratos, fatores, tamanho=BLOCO_EXPORTACAO):
+    # Colunas de ESQUEMA_TIPADO na ordem dos contratos, com o fator exato do grupo
+    for inicio in range(0, len(contratos), tamanho):
+        colunas = [[] for _ in ESQUEMA_TIPADO]
+        for caso_id, valor, cod, dt_reaj in contratos[inicio:inicio + tamanho]:
+            chave = grupo(cod, dt_reaj)
+            fator = fatores[chave]
+            linha = (caso_id, NOMES_INDICES.get(cod, str(cod)), dt_reaj, chave[1],
+                     centavos_int(valor), fator or None, centavos_int(valor * fator) if fator else None,
+                     "" if fator else "índice sem dados para o período")
+            for coluna, valor_coluna in zip(colunas, linha):
+                coluna.append(valor_coluna)
+        yield colunas
+
+def escrever_reajustes(linhas, destino):
+    escritor = csv.DictWriter(destino, fieldnames=COLUNAS_SAIDA)
+    escritor.writeheader()
+    escritor.writerows(linhas)
+
+def csv_reajustes(linhas):
+    saida = io.StringIO()
+    escrever_reajustes(linhas, saida)
+    return saida.getvalue()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CalcJus Pro - reajuste de aluguel em lote")
+    parser.add_argument("contratos", help="CSV com um contrato por linha")
+    parser.add_argument("--saida", default="reajustes.csv", help="CSV de saída com o novo valor de cada contrato")
+    parser.add_argument("--ano", type=int, default=None, help="Ano do reajuste para contratos com inicio_contrato")
+    parser.add_argument("--tabela-tjsp", default="tabela_tjsp.csv", help="CSV da Tabela Prática TJSP")
+    parser.add_argument("--pacote", default=series_bcb.CAMINHO_PACOTE, help="Pacote offline de séries (pacote_series)")
+    parser.add_argument("--formato", choices=list(exportacao.FORMATOS), default=None,
+                        help="Saída com colunas tipadas (centavos inteiros, fator exato); padrão: pela extensão de --saida")
+    args = parser.parse_args(argv)
+    formato = args.formato or exportacao.formato_pela_extensao(args.saida)
+
+    inicio = time.perf_counter()
+    with open(args.contratos, mode='r', encoding='utf-8') as f:
+        contratos, invalidos = ler_contratos(csv.DictReader(f), args.ano)
+    for msg in invalidos:
+        print(f"Contrato ignorado ({msg})", file=sys.stderr)
+
+    armazem, calc_tjsp = None, None
+    if args.pacote:
+        import pacote_series
+        try:
+            armazem = pacote_series.abrir_pacote(args.pacote)
+        except (pacote_series.ErroPacote, OSError) as e:
+            print(f"Pacote de séries inválido: {e}", file=sys.stderr)
+            return 1
+        calc_tjsp = armazem.calculadora_tjsp()
+    calc_tjsp = calc_tjsp or motor.CalculadoraTJSP(arquivo_padrao=args.tabela_tjsp)
+
+    linhas, fatores, _ = reajustar_contratos(contratos, calc_tjsp, armazem)
+    if formato:
+        exportacao.exportar(formato, ESQUEMA_TIPADO, blocos_tipados(contratos, fatores), args.saida)
+    else:
+        with open(args.saida, mode='w', encoding='utf-8', newline='') as f:
+            escrever_reajustes(linhas, f)
+    erros = sum(bool(l["erro"]) for l in linhas)
+    print(f"{len(linhas)} contratos reajustados em {len(fatores)} grupos ({erros} sem índice, {len(invalidos)} ignorados) "
+          f"em {time.perf_counter() - inicio:.2f} s.")
+    return 1 if erros or invalidos else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
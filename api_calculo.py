@@ -0,0 +1,324 @@
+import argparse
+import bisect
+import json
+import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from datetime import date, datetime
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import diagnostico
+import motor_calculo as motor
+import series_bcb
+from calculo_lote import centavos, pre_carregar_series
+
+# --- API HTTP (JSON) ---
+# Expõe os cálculos do app (calcular_caso: Indenização nos três regimes, Honorários, Pensão e
+# Aluguel) e o Art. 523 para o sistema de gestão de processos.
+# Uso: python api_calculo.py --porta 8080 --processos 4 [--pacote series.calcjus]
+#      python api_calculo.py --sgs-simulado   (BCB trocado pelo sgs_simulado, para testes de carga)
+#
+# Rotas:
+#   POST /calcular            um caso (mesmos campos do calculo_lote: tipo, valor, indice, inicio...)
+#   POST /calcular/<tipo>     idem, com o tipo na rota (indenizacao, honorarios, pensao, aluguel)
+#                             pensão aceita "pagamentos": [{"data", "valor"}] (extrato imputado, ver imputacao)
+#   POST /lote                {"casos": [...]}: as séries são consultadas uma vez para todos os casos
+#   POST /art523              {"subtotal": "1000.00", "multa_523": true, "hon_523": true}
+#   GET  /saude               estado do worker e origem das séries
+#   GET  /metricas            Prometheus: latência por rota (histograma) + agregados do diagnostico
+#   GET  /metricas.json       latência por rota (p50/p95/p99 das últimas requisições)
+#
+# Com --processos N o socket é aberto uma vez e N processos (fork) atendem a mesma porta, cada
+# um com threads; o armazém de séries (SQLite em disco) ou o pacote offline é compartilhado entre
+# eles. As métricas são por processo e levam o rótulo worker.
+
+MAX_CORPO = 16 * 1024 * 1024
+MAX_CASOS_LOTE = 5000
+LIMITES_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+AMOSTRAS_LATENCIA = 2048
+
+class ErroRequisicao(Exception):
+    def __init__(self, status, mensagem):
+        super().__init__(mensagem)
+        self.status = status
+
+# --- MÉTRICAS DE LATÊNCIA ---
+
+class LatenciaRotas:
+    # Histograma cumulativo por rota (Prometheus) e janela das últimas amostras para percentis
+
+    def __init__(self, limites=LIMITES_LATENCIA, amostras=AMOSTRAS_LATENCIA):
+        self.limites = limites
+        self.amostras = amostras
+        self._rotas = {}
+        self._trava = threading.Lock()
+
+    def registrar(self, rota, status, segundos):
+        with self._trava:
+            r = self._rotas.get(rota)
+            if r is None:
+                r = self._rotas[rota] = {"baldes": [0] * len(self.limites), "total": 0, "soma": 0.0,
+                                         "erros": 0, "recentes": deque(maxlen=self.amostras)}
+            k = bisect.bisect_left(self.limites, segundos)
+            if k < len(self.limites): r["baldes"][k] += 1
+            r["total"] += 1
+            r["soma"] += segundos
+            r["erros"] += status >= 500
+            r["recentes"].append(segundos)
+
+    def resumo(self):
+        with self._trava:
+            rotas = {rota: (r["total"], r["erros"], r["soma"], sorted(r["recentes"])) for rota, r in self._rotas.items()}
+        resumo = {}
+        for rota, (total, erros, soma, recentes) in rotas.items():
+            percentil = lambda p: recentes[min(len(recentes) - 1, int(p * len(recentes)))] * 1000 if recentes else None
+            resumo[rota] = {"requisicoes": total, "erros_5xx": erros, "media_ms": soma / total * 1000 if total else None,
+                            "p50_ms": percentil(0.50), "p95_ms": percentil(0.95), "p99_ms": percentil(0.99)}
+        return resumo
+
+    def texto_prometheus(self, worker):
+        with self._trava:
+            rotas = {rota: (list(r["baldes"]), r["total"], r["soma"], r["erros"]) for rota, r in sorted(self._rotas.items())}
+        linhas = ["# HELP calcjus_api_latencia_segundos Latência das requisições da API por rota.",
+                  "# TYPE calcjus_api_latencia_segundos histogram"]
+        for rota, (baldes, total, soma, _) in rotas.items():
+            rotulos = f'rota="{rota}",worker="{worker}"'
+            acumulado = 0
+            for limite, qtd in zip(self.limites, baldes):
+                acumulado += qtd
+                linhas.append(f'calcjus_api_latencia_segundos_bucket{{{rotulos},le="{limite}"}} {acumulado}')
+            linhas.append(f'calcjus_api_latencia_segundos_bucket{{{rotulos},le="+Inf"}} {total}')
+            linhas.append(f"calcjus_api_latencia_segundos_sum{{{rotulos}}} {soma:.6f}")
+            linhas.append(f"calcjus_api_latencia_segundos_count{{{rotulos}}} {total}")
+        linhas.append("# TYPE calcjus_api_erros_total counter")
+        linhas += [f'calcjus_api_erros_total{{rota="{rota}",worker="{worker}"}} {erros}' for rota, (_, _, _, erros) in rotas.items()]
+        return "\n".join(linhas) + "\n"
+
+# --- CÁLCULO ---
+# Estado por processo (criado depois do fork): Tabela TJSP e armazém/pacote de séries
+
+_estado = {"worker": 0, "tabela_tjsp": "tabela_tjsp.csv", "calc_tjsp": None}
+_trava_estado = threading.Lock()
+latencias = LatenciaRotas()
+
+def calculadora_tjsp():
+    with _trava_estado:
+        if _estado["calc_tjsp"] is None:
+            armazem = series_bcb.armazem_padrao()
+            _estado["calc_tjsp"] = (armazem.calculadora_tjsp() if series_bcb.CAMINHO_PACOTE
+                                    else motor.CalculadoraTJSP(arquivo_padrao=_estado["tabela_tjsp"]))
+        return _estado["calc_tjsp"]
+
+def _json_linha(linha):
+    # Linhas formatadas do motor; "_num" vira valor_num (texto exato) e data_sort sai
+    registro = {k: v for k, v in linha.items() if k not in ("_num", "data_sort")}
+    registro["valor_num"] = str(linha["_num"])
+    return registro
+
+def _json_resultado(res, fontes):
+    art523 = res.get("art523") or {}
+    saida = {"id": res["id"], "tipo": res["tipo"], "total": centavos(res["total"]),
+             "multa_523": centavos(art523.get("multa", Decimal('0.00'))),
+             "honorarios_523": centavos(art523.get("hon_exec", Decimal('0.00'))),
+             "total_geral": centavos(art523.get("final", res["total"])),
+             "linhas": [_json_linha(l) for l in res["linhas"]], "fontes": fontes}
+    if res.get("erro"): saida["erro"] = res["erro"]
+    return saida
+
+def _fontes(series, codigos):
+    fontes = {}
+    for cod in codigos:
+        situacao = series_bcb.situacao_serie(series.get(cod))
+        fontes[str(cod)] = series_bcb.descrever_situacao(situacao) if situacao else "indisponível (BCB fora do ar e sem cópia local)"
+    return fontes
+
+def calcular_casos(brutos):
+    # Registros JSON -> resultados JSON na mesma ordem; um caso inválido não derruba os demais
+    casos, saidas = [], []
+    for i, bruto in enumerate(brutos):
+        try:
+            if not isinstance(bruto, dict): raise ValueError("o caso deve ser um objeto JSON")
+            caso = motor.normalizar_caso(bruto)
+            casos.append((i, caso, motor.janelas_caso(caso)))
+        except Exception as e:
+            saidas.append((i, {"id": str(bruto.get("id", "")) if isinstance(bruto, dict) else "", "erro": f"caso inválido: {e}"}))
+    series = pre_carregar_series([janelas for _, _, janelas in casos])
+    calc_tjsp = calculadora_tjsp()
+    with diagnostico.etapa("calculo_linhas"):
+        for i, caso, janelas in casos:
+            codigos = {j[0] for j in janelas}
+            try:
+                res = motor.calcular_caso(caso, series, calc_tjsp)
+            except Exception as e:
+                res = {"id": caso["id"], "tipo": caso["tipo"], "linhas": [], "total": Decimal('0.00'), "art523": None, "erro": str(e)}
+            saidas.append((i, _json_resultado(res, _fontes(series, codigos))))
+    return [saida for _, saida in sorted(saidas, key=lambda s: s[0])]
+
+def calcular_art523(corpo):
+    subtotal = motor.to_decimal(corpo.get("subtotal"))
+    art523 = motor.calcular_art523(subtotal, motor.ler_booleano(corpo.get("multa_523")), motor.ler_booleano(corpo.get("hon_523")))
+    return {chave: centavos(valor) for chave, valor in art523.items()}
+
+def saude():
+    armazem = series_bcb.armazem_padrao()
+    return {"ok": True, "worker": _estado["worker"], "pid": os.getpid(),
+            "series": armazem.descrever() if series_bcb.CAMINHO_PACOTE else f"BCB SGS ({series_bcb.URL_SGS.split('/dados')[0]})",
+            "bcb_fora_do_ar": armazem.bcb_fora_do_ar()}
+
+# --- SERVIDOR ---
+
+def _padrao_json(valor):
+    if isinstance(valor, Decimal): return str(valor)
+    if isinstance(valor, (date, datetime)): return valor.isoformat()
+    raise TypeError(f"{type(valor).__name__} não é serializável")
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _responder(self, status, corpo, tipo="application/json"):
+        conteudo = corpo if isinstance(corpo, bytes) else (
+            corpo.encode("utf-8") if isinstance(corpo, str) else json.dumps(corpo, ensure_ascii=False, default=_padrao_json).encode("utf-8"))
+        self.send_response(status)
+        self.send_header("Content-Type", tipo + "; charset=utf-8")
+        self.send_header("Content-Length", str(len(conteudo)))
+        self.end_headers()
+        self.wfile.write(conteudo)
+        return status
+
+    def _corpo(self, descricao="o corpo"):
+        # Todas as rotas POST recebem um objeto JSON; lista ou escalar vira 400, não AttributeError
+        tamanho = int(self.headers.get("Content-Length") or 0)
+        if tamanho > MAX_CORPO: raise ErroRequisicao(413, f"corpo maior que {MAX_CORPO} bytes")
+        try:
+            corpo = json.loads(self.rfile.read(tamanho) or b"{}")
+        except ValueError as e:
+            raise ErroRequisicao(400, f"JSON inválido: {e}")
+        if not isinstance(corpo, dict): raise ErroRequisicao(400, f"{descricao} deve ser um objeto JSON")
+        return corpo
+
+    def _atender(self, metodo):
+        inicio = time.perf_counter()
+        rota = urlparse(self.path).path.rstrip("/") or "/"
+        rotulo = rota
+        try:
+            if metodo == "GET" and rota == "/saude":
+                status = self._responder(200, saude())
+            elif metodo == "GET" and rota == "/metricas":
+                status = self._responder(200, latencias.texto_prometheus(_estado["worker"]) + diagnostico.texto_prometheus(),
+                                         "text/plain; version=0.0.4")
+            elif metodo == "GET" and rota == "/metricas.json":
+                status = self._responder(200, {"worker": _estado["worker"], "rotas": latencias.resumo()})
+            elif metodo == "POST" and (rota == "/calcular" or rota.startswith("/calcular/")):
+                corpo = self._corpo("o caso")
+                tipo = rota[len("/calcular/"):] if rota.startswith("/calcular/") else None
+                if tipo is not None and tipo not in motor.TIPOS_CASO: raise ErroRequisicao(404, f"tipo desconhecido: {tipo}")
+                if tipo: corpo = dict(corpo, tipo=tipo)
+                with diagnostico.medir_calculo(f"api_{tipo or corpo.get('tipo') or 'indenizacao'}"):
+                    resultado = calcular_casos([corpo])[0]
+                status = self._responder(400 if resultado.get("erro", "").startswith("caso inválido") else 200, resultado)
+            elif metodo == "POST" and rota == "/lote":
+                casos = self._corpo('o lote ({"casos": [...]})').get("casos")
+                if not isinstance(casos, list): raise ErroRequisicao(400, 'informe {"casos": [...]}')
+                if len(casos) > MAX_CASOS_LOTE: raise ErroRequisicao(413, f"no máximo {MAX_CASOS_LOTE} casos por requisição")
+                with diagnostico.medir_calculo("api_lote"):
+                    resultados = calcular_casos(casos)
+                status = self._responder(200, {"resultados": resultados, "erros": sum("erro" in r for r in resultados)})
+            elif metodo == "POST" and rota == "/art523":
+                status = self._responder(200, calcular_art523(self._corpo()))
+            else:
+                rotulo = "outras"
+                status = self._responder(404, {"erro": "rota inexistente"})
+        except ErroRequisicao as e:
+            if e.status == 404: rotulo = "outras"
+            status = self._responder(e.status, {"erro": str(e)})
+        except Exception as e:
+            status = self._responder(500, {"erro": f"{type(e).__name__}: {e}"})
+        latencias.registrar(rotulo, status, time.perf_counter() - inicio)
+
+    def do_GET(self):
+        self._atender("GET")
+
+    def do_POST(self):
+        self._atender("POST")
+
+class ServidorAPI(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+def servir(servidor, processos):
+    # Um processo por worker, todos aceitando conexões no mesmo socket (fork, sem Windows)
+    if processos <= 1 or not hasattr(os, "fork"):
+        servidor.serve_forever()
+        return
+    filhos = []
+    for k in range(processos):
+        pid = os.fork()
+        if pid == 0:
+            _estado["worker"] = k
+            signal.signal(signal.SIGTERM, lambda *_: os._exit(0))
+            try:
+                servidor.serve_forever()
+            finally:
+                os._exit(0)
+        filhos.append(pid)
+    # SIGTERM no processo principal também encerra os workers
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        for pid in filhos:
+            os.waitpid(pid, 0)
+    finally:
+        for pid in filhos:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CalcJus Pro - API HTTP de cálculo")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8080)
+    parser.add_argument("--processos", type=int, default=os.cpu_count() or 1, help="Workers (processos) atendendo a porta")
+    parser.add_argument("--tabela-tjsp", default="tabela_tjsp.csv", help="CSV da Tabela Prática TJSP")
+    parser.add_argument("--pacote", default=series_bcb.CAMINHO_PACOTE, help="Pacote offline de séries (pacote_series)")
+    parser.add_argument("--sgs-simulado", action="store_true",
+                        help="Sobe o sgs_simulado local e usa um cache de séries temporário (sem rede)")
+    args = parser.parse_args(argv)
+
+    _estado["tabela_tjsp"] = args.tabela_tjsp
+    if args.pacote:
+        import pacote_series
+        try:
+            pacote_series.PacoteSeries(args.pacote)
+        except (pacote_series.ErroPacote, OSError) as e:
+            print(f"Pacote de séries inválido: {e}", file=sys.stderr)
+            return 1
+        series_bcb.CAMINHO_PACOTE = args.pacote
+    simulado = None
+    if args.sgs_simulado:
+        from sgs_simulado import ServidorSGSSimulado
+        simulado = ServidorSGSSimulado().iniciar()
+        series_bcb.configurar_sgs(simulado.url, tempfile.mkdtemp(prefix="calcjus_api_"))
+
+    servidor = ServidorAPI((args.host, args.porta), Handler)
+    print(f"API CalcJus em http://{args.host}:{servidor.server_address[1]} com {max(args.processos, 1)} processo(s)"
+          + (f", SGS simulado em {simulado.url}" if simulado else ""), flush=True)
+    try:
+        servir(servidor, args.processos)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        if simulado: simulado.parar()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,19 +1,29 @@
-import streamlit as st
-import pandas as pd
-import requests
-import calendar
 import csv
 import io
-from datetime import date, datetime, timedelta
-from dateutil.relativedelta import relativedelta
-from fpdf import FPDF
-from decimal import Decimal, ROUND_HALF_UP, getcontext
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+import json
+import os
+import uuid
+import streamlit as st
+import pandas as pd
+from datetime import date
+from decimal import Decimal, getcontext
+import series_bcb
+import diagnostico
+import exportacao
+import imputacao
+import tarefas
+import cache_resultados
+import motor_calculo as motor
+from series_bcb import calcular_fator_memoria
+from motor_vetorizado import calcular_indenizacao_em_blocos, comparar_indenizacao, comparar_pensao
+from cronograma import PERIODICIDADES, gerar_cronograma, janelas_cronograma, calcular_cronograma
+from resultado_compacto import IndenizacaoCompacta, PensaoCompacta, linha_pensao_compacta
+from motor_calculo import (
+    CalculadoraTJSP, to_decimal, formatar_moeda, mapa_indices_completo,
+)
 
 # --- 1. CONFIGURAÇÃO FINANCEIRA E GLOBAL ---
 getcontext().prec = 28
-DOIS_DECIMAIS = Decimal('0.01')
 
 st.set_page_config(page_title="CalcJus Pro 4.9 (Controle Juros Misto)", layout="wide", page_icon="⚖️")
 
@@ -45,6 +55,8 @@ st.sidebar.divider()
 with st.sidebar.expander("🛠️ Ferramentas Admin"):
     if st.button("Limpar Cache de Índices"):
         st.cache_data.clear()
+        series_bcb.armazem_padrao().limpar()
+        cache_resultados.cache_padrao().limpar()
         st.rerun()
     modo_simulacao = st.toggle("Simular Queda do BCB", value=False)
     if "simular_erro_bcb" not in st.session_state:
@@ -54,280 +66,280 @@ with st.sidebar.expander("🛠️ Ferramentas Admin"):
          st.cache_data.clear()
          st.rerun()
     if st.session_state.simular_erro_bcb:
-        st.sidebar.error("ERRO BCB ATIVO")
+        st.sidebar.error("ERRO BCB ATIVO (usando cópia local)")
+if series_bcb.CAMINHO_PACOTE:
+    st.sidebar.info(f"📦 Séries e Tabela TJSP do {series_bcb.armazem_padrao().descrever()}, sem acesso ao BCB.")
+elif series_bcb.armazem_padrao().bcb_fora_do_ar():
+    st.sidebar.warning("BCB indisponível: cálculos usam a última cópia válida das séries.")
+painel_diagnostico = st.sidebar.expander("📈 Diagnóstico")
 
 # --- 2. ESTADO DA SESSÃO ---
-state_vars = {
-    'total_indenizacao': Decimal('0.00'),
-    'total_honorarios': Decimal('0.00'),
-    'total_pensao': Decimal('0.00'),
-    'df_indenizacao': pd.DataFrame(),
-    'df_honorarios': pd.DataFrame(),
-    'df_pensao_input': pd.DataFrame(columns=["Vencimento", "Valor Devido (R$)", "Valor Pago (R$)"]),
-    'df_pensao_final': pd.DataFrame(),
-    'dados_aluguel': None,
-    'params_relatorio': {
-        'regime_desc': 'Padrão',
-        'tipo_regime': 'Padrão',
-        'indice_nome': 'Índice',
-        'data_corte': None,
-        'data_citacao': None,
-        'data_calculo': date.today(),
-        'juros_fase1': True
+# Valores iniciais montados só na primeira execução da sessão (não a cada rerun)
+def estado_inicial():
+    return {
+        'total_indenizacao': Decimal('0.00'),
+        'total_honorarios': Decimal('0.00'),
+        'total_pensao': Decimal('0.00'),
+        'df_indenizacao': IndenizacaoCompacta.vazia(),
+        'df_honorarios': pd.DataFrame(),
+        'df_pensao_input': pd.DataFrame(columns=["Vencimento", "Valor Devido (R$)", "Valor Pago (R$)"]),
+        'df_pensao_final': PensaoCompacta([]),
+        'imputacao_pensao': None,
+        'pensao_incremental': motor.PensaoIncremental(linha_pensao_compacta),
+        'dados_aluguel': None,
+        'ultimo_diagnostico': None,
+        'fontes_dados': {},
+        'id_sessao': uuid.uuid4().hex,
+        'tarefas': {},
+        'exibir_resultado': {},
+        'params_relatorio': {
+            'regime_desc': 'Padrão',
+            'tipo_regime': 'Padrão',
+            'indice_nome': 'Índice',
+            'data_corte': None,
+            'data_citacao': None,
+            'data_calculo': date.today(),
+            'juros_fase1': True
+        }
     }
-}
-
-for var, default in state_vars.items():
-    if var not in st.session_state:
-        st.session_state[var] = default
-
-# --- CLASSE PARA LER CSV ---
-class CalculadoraTJSP:
-    def __init__(self, arquivo_prioritario=None, arquivo_padrao='tabela_tjsp.csv'):
-        self.indices = {}
-        if arquivo_prioritario is not None:
-            self.carregar_dados(arquivo_prioritario, eh_upload=True)
-        else:
-            self.carregar_dados(arquivo_padrao, eh_upload=False)
-
-    def carregar_dados(self, arquivo, eh_upload=False):
-        try:
-            leitor = None
-            if eh_upload:
-                arquivo.seek(0)
-                conteudo = arquivo.getvalue().decode('utf-8')
-                f = io.StringIO(conteudo)
-                leitor = csv.DictReader(f)
-            else:
-                try:
-                    with open(arquivo, mode='r', encoding='utf-8') as f:
-                        conteudo = f.read()
-                    f_io = io.StringIO(conteudo)
-                    leitor = csv.DictReader(f_io)
-                except FileNotFoundError:
-                    return 
-
-            if leitor:
-                for linha in leitor:
-                    if 'fator' in linha and linha['fator']:
-                        self.indices[linha['mes_ano']] = float(linha['fator'])
-                        
-        except Exception as e:
-            print(f"Erro ao ler CSV TJSP: {e}")
-
-    def obter_fator(self, data_obj):
-        chave = f"{data_obj.month:02d}/{data_obj.year}"
-        return self.indices.get(chave)
-
-    def calcular_fator_composto(self, data_venc, data_atualiz):
-        idx_base = self.obter_fator(data_venc)
-        idx_final = self.obter_fator(data_atualiz)
-        if not idx_base or not idx_final: return None
-        return Decimal(str(idx_final)) / Decimal(str(idx_base))
-
-calc_tjsp = CalculadoraTJSP(arquivo_prioritario=arquivo_tjsp_upload)
-
-# --- 3. FUNÇÕES UTILITÁRIAS ---
-
-def to_decimal(valor):
-    if not valor: return Decimal('0.00')
-    try:
-        if isinstance(valor, (float, int, Decimal)):
-            return Decimal(str(valor))
-        if isinstance(valor, str):
-            valor = valor.strip()
-            if ',' in valor:
-                valor = valor.replace('.', '').replace(',', '.')
-            return Decimal(str(valor))
-    except:
-        return Decimal('0.00')
-
-def formatar_moeda(valor):
-    try:
-        if not isinstance(valor, Decimal):
-            valor = to_decimal(valor)
-        valor_ajustado = valor.quantize(DOIS_DECIMAIS, rounding=ROUND_HALF_UP)
-        texto = f"R$ {valor_ajustado:,.2f}"
-        return texto.replace(",", "X").replace(".", ",").replace("X", ".")
-    except:
-        return "R$ 0,00"
-
-def formatar_decimal_str(valor):
-    return f"{valor:.6f}"
-
-# --- 4. CONEXÃO BCB OTIMIZADA ---
-
-@st.cache_data(ttl=3600, show_spinner=False)
-def obter_dados_bcb_cache(codigo_serie, data_inicio, data_fim):
-    if st.session_state.simular_erro_bcb: return None
-    if codigo_serie == -1: return pd.DataFrame()
-
-    if data_fim <= data_inicio or data_inicio > date.today():
-        return pd.DataFrame()
-
-    d1 = data_inicio.strftime("%d/%m/%Y")
-    d2 = data_fim.strftime("%d/%m/%Y")
-    url = f"https://api.bcb.gov.br/dados/serie/bcdata.sgs.{codigo_serie}/dados?formato=json&dataInicial={d1}&dataFinal={d2}"
-    
-    session = requests.Session()
-    retry = Retry(total=3, backoff_factor=1, status_forcelist=[500, 502, 503, 504])
-    adapter = HTTPAdapter(max_retries=retry)
-    session.mount('https://', adapter)
 
+if 'params_relatorio' not in st.session_state:
+    for var, default in estado_inicial().items():
+        if var not in st.session_state:
+            st.session_state[var] = default
+
+@st.cache_resource(show_spinner=False, max_entries=16)
+def calculadora_tjsp(conteudo_upload, versao_padrao):
+    # Uma instância por processo para cada upload (conteúdo) ou versão (mtime) da tabela padrão;
+    # com pacote offline, a tabela padrão é a do pacote
+    if conteudo_upload is None and series_bcb.CAMINHO_PACOTE:
+        return series_bcb.armazem_padrao().calculadora_tjsp()
+    return CalculadoraTJSP(arquivo_prioritario=io.BytesIO(conteudo_upload) if conteudo_upload is not None else None)
+
+def versao_tabela_padrao(caminho='tabela_tjsp.csv'):
     try:
-        response = session.get(url, timeout=10)
-        if response.status_code == 200:
-            dados = response.json()
-            if not dados: return pd.DataFrame()
-            
-            df = pd.DataFrame(dados)
-            df['data_dt'] = pd.to_datetime(df['data'], format='%d/%m/%Y').dt.date
-            
-            def converter_fator(x):
-                val_str = x.replace(',', '.') if isinstance(x, str) else str(x)
-                return Decimal('1') + (Decimal(val_str) / Decimal('100'))
-            
-            df['fator_multi'] = df['valor'].apply(converter_fator)
-            return df[['data_dt', 'fator_multi']]
-        return pd.DataFrame()
-    except Exception:
-        return pd.DataFrame()
-
-def calcular_fator_memoria(df_serie, dt_ini, dt_fim):
-    if df_serie is None or df_serie.empty: return None
-    mask = (df_serie['data_dt'] >= dt_ini) & (df_serie['data_dt'] <= dt_fim)
-    subset = df_serie.loc[mask]
-    if subset.empty: return None
-    fator = Decimal('1.0')
-    for val in subset['fator_multi']:
-        fator *= val
-    return fator
-
-def buscar_fator_bcb(codigo_serie, data_inicio, data_fim):
+        return os.path.getmtime(caminho)
+    except OSError:
+        return None
+
+try:
+    calc_tjsp = calculadora_tjsp(arquivo_tjsp_upload.getvalue() if arquivo_tjsp_upload is not None else None, versao_tabela_padrao())
+except motor.ErroTabelaTJSP as e:
+    st.sidebar.error(f"Tabela TJSP enviada é inválida ({e}). Usando a tabela padrão.")
+    calc_tjsp = calculadora_tjsp(None, versao_tabela_padrao())
+
+# --- 3. CONEXÃO BCB OTIMIZADA ---
+
+def obter_dados_bcb_cache(codigo_serie, data_inicio, data_fim, offline=None):
+    return obter_dados_bcb_varios([(codigo_serie, data_inicio, data_fim)], offline)[0]
+
+def obter_dados_bcb_varios(janelas, offline=None):
+    # Baixa as séries [(codigo, inicio, fim)] em paralelo; falhas sem cópia local viram DataFrame vazio.
+    # Com a queda simulada, só a cópia local (desatualizada) é usada. Tarefas em segundo plano
+    # não enxergam a sessão e passam offline explicitamente.
+    if offline is None: offline = st.session_state.simular_erro_bcb
+    validas = [j for j in janelas if motor.janela_valida(j)]
+    baixadas = dict(zip(validas, series_bcb.obter_series(validas, offline=offline)))
+    return [baixadas[j] if baixadas.get(j) is not None else pd.DataFrame() for j in janelas]
+
+def situacoes_locais(janelas, offline=None):
+    # Situação de cada janela quando todas saem do armazém local sem baixar nada (janela inválida
+    # -> None, como em obter_dados_bcb_varios); None se alguma ainda iria ao BCB
+    if offline is None: offline = st.session_state.simular_erro_bcb
+    validas = [j for j in janelas if motor.janela_valida(j)]
+    situacoes = series_bcb.situacoes_locais(validas, offline=offline)
+    if situacoes is None: return None
+    por_janela = dict(zip(validas, situacoes))
+    return [por_janela.get(j) for j in janelas]
+
+def buscar_fator_bcb(codigo_serie, data_inicio, data_fim, calculo=None):
     if codigo_serie == -1: 
         return calc_tjsp.calcular_fator_composto(data_inicio, data_fim)
     df = obter_dados_bcb_cache(codigo_serie, data_inicio, data_fim)
+    if calculo: registrar_fontes(calculo, {codigo_serie: df})
     if df is None or df.empty: return None
     return calcular_fator_memoria(df, data_inicio, data_fim)
 
-# --- 5. GERAÇÃO DE PDF ---
-class PDFRelatorio(FPDF):
-    def header(self):
-        self.set_font('Arial', 'B', 12)
-        self.set_text_color(0, 0, 0)
-        self.cell(0, 5, 'RELATÓRIO DE CÁLCULO JUDICIAL', 0, 1, 'C')
-        self.ln(2)
-        self.set_draw_color(0, 0, 0)
-        self.line(10, 18, 287, 18) 
-        self.ln(10)
-
-    def footer(self):
-        self.set_y(-15)
-        self.set_font('Arial', 'I', 7)
-        self.set_text_color(128, 128, 128)
-        self.cell(0, 5, f'Pagina {self.page_no()}/{{nb}} | Gerado via CalcJus Pro em {datetime.now().strftime("%d/%m/%Y %H:%M")}', 0, 0, 'C')
-
-    def safe_cell(self, w, h, txt, border=0, ln=0, align='', fill=False):
-        try:
-            txt_safe = str(txt).encode('latin-1', 'replace').decode('latin-1')
-            self.cell(w, h, txt_safe, border, ln, align, fill)
-        except:
-            self.cell(w, h, "?", border, ln, align, fill)
-
-    def safe_multi_cell(self, w, h, txt, border=0, align='J', fill=False):
-        try:
-            txt_safe = str(txt).encode('latin-1', 'replace').decode('latin-1')
-            self.multi_cell(w, h, txt_safe, border, align, fill)
-        except:
-            self.multi_cell(w, h, "Erro texto.", border, align, fill)
-
-def gerar_pdf_relatorio(dados_ind, dados_hon, dados_pen, dados_aluguel, totais, config):
-    pdf = PDFRelatorio(orientation='L', unit='mm', format='A4')
-    pdf.alias_nb_pages()
-    pdf.add_page()
-    
-    # MEMORIAL
-    pdf.set_font("Arial", "B", 10)
-    pdf.set_fill_color(240, 240, 240)
-    pdf.safe_cell(0, 7, " 1. PARÂMETROS E METODOLOGIA (MEMORIAL DESCRITIVO)", 0, 1, 'L', True)
-    pdf.ln(2)
-    dt_calc = config.get('data_calculo', date.today()).strftime('%d/%m/%Y')
-    texto_explicativo = f"DATA BASE DO CÁLCULO: {dt_calc}\n\n"
-    tipo_regime = config.get('tipo_regime', 'Padrao')
-    
-    if "Misto" in tipo_regime:
-        dt_corte = config.get('data_corte').strftime("%d/%m/%Y") if config.get('data_corte') else "-"
-        com_juros_txt = " + Juros de Mora de 1% a.m." if config.get('juros_fase1', True) else " (Sem Juros)"
-        texto_explicativo += (f"METODOLOGIA APLICADA (Regime Misto - EC 113/21):\n1. FASE PRÉ-SELIC (Até {dt_corte}): Correção monetária pelo índice original{com_juros_txt}.\n2. FASE SELIC (De {dt_corte} até {dt_calc}): A Taxa SELIC incidiu exclusivamente sobre o PRINCIPAL CORRIGIDO. Os juros de mora acumulados na Fase 1 foram somados ao final.")
-    elif "SELIC" in tipo_regime:
-        texto_explicativo += "METODOLOGIA APLICADA: Taxa SELIC Pura (Correção + Juros em fator único), conforme EC 113/21."
+NOMES_SERIES = {cod: nome.split(" - ")[0] for nome, cod in mapa_indices_completo.items()}
+
+def registrar_fontes(calculo, series):
+    # Guarda a data dos dados de cada série usada ({codigo: DataFrame ou a situação já lida}) para
+    # a tela e o memorial do PDF
+    fontes = {}
+    for cod, serie in series.items():
+        situacao = serie if isinstance(serie, dict) else series_bcb.situacao_serie(serie)
+        fontes[cod] = series_bcb.descrever_situacao(situacao) if situacao else "indisponível (BCB fora do ar e sem cópia local)"
+        if not situacao:
+            st.error(f"Série {NOMES_SERIES.get(cod, cod)} indisponível: BCB fora do ar e sem cópia local. As parcelas sem índice ficam de fora.")
+        elif situacao.get("desatualizada"):
+            st.warning(f"BCB indisponível: {NOMES_SERIES.get(cod, cod)} calculado com a última cópia válida das séries.")
+    st.session_state.fontes_dados[calculo] = fontes
+
+def mostrar_fontes(calculo):
+    for cod, texto in st.session_state.fontes_dados.get(calculo, {}).items():
+        st.caption(f"📅 {NOMES_SERIES.get(cod, cod)}: {texto}")
+
+def botoes_exportar(chave, nome_arquivo, esquema, blocos):
+    # Um download por formato com as colunas tipadas; o arquivo só é montado (blocos()) no clique,
+    # fora do script, num temporário em disco (exportar_arquivo), e o clique não reroda a página
+    formatos = exportacao.formatos_disponiveis()
+    for coluna, formato in zip(st.columns(len(formatos)), formatos):
+        _, extensao, mime = exportacao.FORMATOS[formato]
+        coluna.download_button(f"⬇️ Tabela (.{extensao})", data=lambda formato=formato: exportacao.exportar_arquivo(formato, esquema, blocos()),
+                               file_name=f"{nome_arquivo}.{extensao}", mime=mime, key=f"exportar_{chave}_{formato}", on_click="ignore")
+
+def obter_series_comparacao(janelas):
+    # Une as janelas [(codigo, inicio, fim)] por código e baixa todas as séries de uma vez
+    uniao = {}
+    for cod, ini, fim in janelas:
+        atual = uniao.get(cod)
+        uniao[cod] = (min(atual[0], ini), max(atual[1], fim)) if atual else (ini, fim)
+    codigos = list(uniao)
+    baixadas = obter_dados_bcb_varios([(cod, *uniao[cod]) for cod in codigos])
+    return dict(zip(codigos, baixadas))
+
+def mostrar_comparacao(vencimentos, totais_por_cod):
+    # Resumo por índice, tabela lado a lado por vencimento e gráfico
+    nomes = {cod: NOMES_SERIES.get(cod, cod) for cod in totais_por_cod}
+    somas = {cod: sum((t for t in totais if t is not None), Decimal('0.00')) for cod, totais in totais_por_cod.items()}
+    com_dados = {cod for cod, totais in totais_por_cod.items() if any(t is not None for t in totais)}
+    menor = min((somas[cod] for cod in com_dados), default=Decimal('0.00'))
+    resumo = pd.DataFrame([{"Índice": nomes[cod], "Total": formatar_moeda(soma),
+                            "Diferença p/ menor": formatar_moeda(soma - menor) if cod in com_dados else "-",
+                            "Parcelas sem índice": sum(t is None for t in totais_por_cod[cod])} for cod, soma in somas.items()])
+    st.dataframe(resumo, use_container_width=True, hide_index=True)
+    grafico = pd.DataFrame({nomes[cod]: [float(t) if t is not None else None for t in totais] for cod, totais in totais_por_cod.items()},
+                           index=pd.Index(vencimentos, name="Vencimento"))
+    st.line_chart(grafico)
+    lado_a_lado = pd.DataFrame({"Vencimento": [v.strftime("%d/%m/%Y") for v in vencimentos]})
+    for cod, totais in totais_por_cod.items():
+        lado_a_lado[nomes[cod]] = [formatar_moeda(t) if t is not None else "-" for t in totais]
+    st.dataframe(lado_a_lado, use_container_width=True, hide_index=True)
+
+# --- TAREFAS EM SEGUNDO PLANO ---
+# Indenização e Pensão rodam na fila de tarefas do processo (tarefas.py): a sessão guarda só o
+# id, o progresso é redesenhado por um fragmento a cada segundo e o resultado entra na sessão
+# quando a tarefa termina. As funções das tarefas não usam st.* (rodam fora do script).
+
+def enviar_tarefa(calculo, funcao, *args):
+    # Um cálculo por tipo e sessão: o anterior ainda em andamento é cancelado
+    tarefa = tarefas.fila_padrao().enviar(st.session_state.id_sessao, calculo, funcao, *args,
+                                          substitui=st.session_state.tarefas.get(calculo))
+    st.session_state.tarefas[calculo] = tarefa.id
+    st.session_state.exibir_resultado[calculo] = False
+
+@st.fragment(run_every=1.0)
+def progresso_tarefa(calculo):
+    tarefa = tarefas.fila_padrao().obter(st.session_state.tarefas.get(calculo))
+    if tarefa is None or tarefa.finalizada():
+        # Execução completa do app para levar o resultado à sessão
+        st.rerun()
+    st.progress(tarefa.fracao(), text=tarefa.descrever())
+    if st.button("Cancelar", key=f"cancelar_{calculo}"):
+        tarefa.cancelar()
+
+def acompanhar_tarefa(calculo, concluir):
+    # Mostra o progresso da tarefa da sessão ou, se ela terminou, aplica concluir(resultado)
+    id_tarefa = st.session_state.tarefas.get(calculo)
+    if not id_tarefa: return
+    tarefa = tarefas.fila_padrao().obter(id_tarefa)
+    if tarefa is not None and not tarefa.finalizada():
+        progresso_tarefa(calculo)
+        return
+    del st.session_state.tarefas[calculo]
+    if tarefa is None:
+        st.warning("O resultado do cálculo expirou no servidor; calcule novamente.")
+    elif tarefa.estado == tarefas.CONCLUIDA:
+        resultado = tarefa.resultado
+        registrar_fontes(calculo, resultado["series"])
+        st.session_state.ultimo_diagnostico = resultado["diagnostico"]
+        concluir(resultado)
+        st.session_state.exibir_resultado[calculo] = True
+    elif tarefa.estado == tarefas.CANCELADA:
+        st.info("Cálculo cancelado.")
     else:
-        texto_explicativo += "METODOLOGIA APLICADA (Padrão): Correção Monetária plena + Juros de Mora de 1% a.m. sobre o valor corrigido."
-
-    pdf.set_font("Arial", "", 9)
-    pdf.safe_multi_cell(0, 5, texto_explicativo)
-    pdf.ln(5)
-
-    # INDENIZAÇÃO
-    if not dados_ind.empty:
-        pdf.set_font("Arial", "B", 10)
-        pdf.set_fill_color(220, 230, 255)
-        pdf.safe_cell(0, 7, " 2. DEMONSTRATIVO DE CÁLCULO - INDENIZAÇÃO", 0, 1, 'L', True)
-        
-        if "Misto" in tipo_regime:
-            headers = [("Vencimento", 25), ("Valor Orig.", 25), ("Fator CM", 22), ("V. Corrigido", 28), ("Juros F1", 25), ("Subtotal F1", 30), ("Fator SELIC", 45), ("TOTAL", 35)]
-            campos = ['Vencimento', 'Valor Orig.', 'Audit Fator CM', 'V. Corrigido Puro', 'Audit Juros %', 'Subtotal F1', 'Audit Fator SELIC', 'TOTAL']
-        elif "SELIC" in tipo_regime:
-            headers = [("Vencimento", 30), ("Valor Orig.", 35), ("Fator SELIC Acum.", 50), ("TOTAL", 40)]
-            campos = ['Vencimento', 'Valor Orig.', 'Audit Fator SELIC', 'TOTAL']
+        st.error(f"Falha no cálculo: {tarefa.erro}")
+
+def tarefa_indenizacao(tarefa, inicio_atraso, fim_atraso, val_mensal_cheio, regime_tipo, cod_ind_escolhido, data_calculo,
+                       data_citacao_ind, data_corte_selic, aplicar_juros_fase1, calc_tjsp, offline):
+    with diagnostico.medir_calculo("indenizacao") as diag:
+        # --- LÓGICA DE DATAS (PRO-RATA) ---
+        datas_calc = motor.gerar_cronograma_pro_rata(inicio_atraso, fim_atraso, val_mensal_cheio)
+
+        janelas = motor.series_indenizacao(datas_calc, regime_tipo, cod_ind_escolhido, data_corte_selic, data_calculo)
+
+        # --- CACHE: MESMAS ENTRADAS E MESMOS DADOS (MARCA D'ÁGUA DAS SÉRIES / TABELA TJSP) ---
+        def chave_resultado(situacoes):
+            return cache_resultados.chave_indenizacao(
+                inicio_atraso, fim_atraso, val_mensal_cheio, regime_tipo, cod_ind_escolhido, data_calculo,
+                data_citacao_ind, data_corte_selic, aplicar_juros_fase1, calc_tjsp.hash_conteudo, situacoes)
+
+        # Séries que o armazém local já atende: o resultado guardado sai sem baixar nem montar as séries
+        cache = cache_resultados.cache_padrao()
+        locais = situacoes_locais(list(janelas.values()), offline)
+        chave_local = chave_resultado(dict(zip(janelas, locais))) if locais is not None else None
+        guardado = cache.obter(chave_local) if chave_local else None
+        if guardado is not None:
+            series = {janelas[nome][0]: situacao for nome, situacao in zip(janelas, locais)}
         else:
-            headers = [("Vencimento", 25), ("Valor Orig.", 25), ("Fator CM", 25), ("V. Corrigido", 30), ("Juros %", 25), ("Valor Juros", 30), ("TOTAL", 35)]
-            campos = ['Vencimento', 'Valor Orig.', 'Audit Fator CM', 'V. Corrigido Puro', 'Audit Juros %', 'Valor Juros', 'TOTAL']
-
-        pdf.set_font("Arial", "B", 8)
-        for txt, w in headers: pdf.safe_cell(w, 7, txt, 1, 0, 'C')
-        pdf.ln()
-        
-        pdf.set_font("Arial", "", 8)
-        for _, row in dados_ind.iterrows():
-            widths = [h[1] for h in headers]
-            for i, campo in enumerate(campos):
-                valor = str(row.get(campo, '-'))
-                pdf.safe_cell(widths[i], 6, valor, 1, 0, 'C') 
-            pdf.ln()
-        
-        pdf.set_font("Arial", "B", 9)
-        pdf.safe_cell(0, 8, f"Subtotal Indenização: {formatar_moeda(totais['indenizacao'])}", 0, 1, 'R')
-        pdf.ln(3)
-
-    # (DEMAIS PARTES DO PDF)
-    if not dados_hon.empty:
-        pdf.set_font("Arial", "B", 10)
-        pdf.safe_cell(0, 7, " 3. HONORÁRIOS E DEMAIS", 0, 1, 'L', True)
-        pdf.set_font("Arial", "B", 9)
-        pdf.safe_cell(0, 8, f"Subtotal Honorários: {formatar_moeda(totais['honorarios'])}", 0, 1, 'R')
-        pdf.ln(3)
-
-    # RESUMO
-    if totais['final'] > 0:
-        pdf.ln(5)
-        pdf.set_font("Arial", "B", 14)
-        pdf.set_fill_color(220, 220, 220)
-        pdf.safe_cell(140, 12, "TOTAL GERAL DA DÍVIDA", 1, 0, 'L', True)
-        pdf.safe_cell(40, 12, formatar_moeda(totais['final']), 1, 1, 'R', True)
-
-    return pdf.output(dest='S').encode('latin-1', 'replace')
-
-# --- 6. DADOS ESTÁTICOS ---
-mapa_indices_completo = {
-    "Tabela Prática TJSP (Oficial)": -1,
-    "INPC (IBGE) - 188": 188, 
-    "IGP-M (FGV) - 189": 189, 
-    "IPCA (IBGE) - 433": 433,
-    "IPCA-E (IBGE) - 10764": 10764, 
-    "SELIC (Taxa Referencial) - 4390": 4390 
-}
-COD_SELIC = 4390
+            # --- BAIXA DADOS DO BCB ---
+            tarefa.progresso(0, len(datas_calc), "Baixando séries do BCB" if janelas else "Calculando")
+            baixadas = dict(zip(janelas, obter_dados_bcb_varios(list(janelas.values()), offline)))
+            df_indice_principal = baixadas.get('indice', pd.DataFrame())
+            df_selic_cache = baixadas.get('selic', pd.DataFrame())
+            series = {janelas[nome][0]: df for nome, df in baixadas.items()}
+            chave = chave_resultado({nome: series_bcb.situacao_serie(df) for nome, df in baixadas.items()})
+            # Mesma chave já consultada acima: não conta outra falta no diagnóstico
+            guardado = cache.obter(chave) if chave != chave_local else None
+            if guardado is None:
+                # --- LOOP DE CÁLCULO (em blocos, com progresso) ---
+                tarefa.progresso(0, len(datas_calc), "Calculando")
+                resultado = calcular_indenizacao_em_blocos(
+                    datas_calc, regime_tipo, data_calculo, cod_ind_escolhido, df_indice_principal,
+                    df_selic_cache, calc_tjsp, data_citacao_ind, data_corte_selic, aplicar_juros_fase1,
+                    progresso=tarefa.progresso
+                )
+                # Guarda colunas tipadas; o texto é montado só na exibição/PDF
+                guardado = IndenizacaoCompacta(resultado), resultado.soma_total()
+                cache.guardar(chave, guardado)
+        compacto, total = guardado
+    return {"compacto": compacto, "total": total, "diagnostico": diag.como_dict(), "series": series}
+
+def tarefa_pensao(tarefa, parcelas, cod, data_calculo, calc_tjsp, pensao_incremental, offline):
+    with diagnostico.medir_calculo("pensao") as diag:
+        # --- BAIXA A SÉRIE UMA ÚNICA VEZ (MENOR VENCIMENTO ATÉ A DATA BASE) ---
+        df_serie_pensao = pd.DataFrame()
+        series = {}
+        janela = motor.janela_pensao(parcelas, data_calculo)
+        if cod != -1 and janela:
+            tarefa.progresso(0, len(parcelas), "Baixando série do BCB")
+            df_serie_pensao = series[cod] = obter_dados_bcb_cache(cod, *janela, offline=offline)
+
+        # Só as parcelas editadas desde o último cálculo são recalculadas
+        tarefa.progresso(0, len(parcelas), "Calculando")
+        with diagnostico.etapa("calculo_linhas"):
+            res_pensao, total_pensao = pensao_incremental.calcular(parcelas, cod, df_serie_pensao, calc_tjsp, data_calculo,
+                                                                   progresso=tarefa.progresso)
+        pensao_compacta = PensaoCompacta(res_pensao)
+    return {"compacto": pensao_compacta, "total": total_pensao, "diagnostico": diag.como_dict(), "series": series}
+
+def tarefa_pensao_extrato(tarefa, parcelas, extrato, cod, data_calculo, calc_tjsp, offline):
+    # Com extrato de pagamentos: imputação em uma passada (imputacao.py), sem o cache incremental
+    with diagnostico.medir_calculo("pensao_imputacao") as diag:
+        df_serie_pensao = pd.DataFrame()
+        series = {}
+        janela = motor.janela_pensao(parcelas, data_calculo)
+        if cod != -1 and janela:
+            tarefa.progresso(0, len(parcelas), "Baixando série do BCB")
+            df_serie_pensao = series[cod] = obter_dados_bcb_cache(cod, *janela, offline=offline)
+
+        tarefa.progresso(0, len(parcelas), "Imputando pagamentos")
+        with diagnostico.etapa("imputacao"):
+            resultado = imputacao.imputar_parcelas(parcelas, extrato, cod, df_serie_pensao, calc_tjsp, data_calculo,
+                                                   montar_linha=linha_pensao_compacta, progresso=tarefa.progresso)
+        pensao_compacta = PensaoCompacta(resultado.linhas)
+    return {"compacto": pensao_compacta, "total": resultado.total, "imputacao": resultado,
+            "diagnostico": diag.como_dict(), "series": series}
 
 # ==============================================================================
 # NAVEGAÇÃO
@@ -352,7 +364,7 @@ with tab1:
     
     regime_tipo = st.radio(
         "Regime de Atualização:",
-        ["1. Índice Correção + Juros 1% a.m.", "2. Taxa SELIC Pura (EC 113/21)", "3. Misto (Índice até Corte -> SELIC)"],
+        motor.REGIMES,
         horizontal=True
     )
     
@@ -392,164 +404,90 @@ with tab1:
             'data_citacao': data_citacao_ind, 'data_calculo': data_calculo,
             'juros_fase1': aplicar_juros_fase1
         }
+        enviar_tarefa("indenizacao", tarefa_indenizacao, inicio_atraso, fim_atraso, val_mensal_cheio, regime_tipo,
+                      cod_ind_escolhido, data_calculo, data_citacao_ind, data_corte_selic, aplicar_juros_fase1,
+                      calc_tjsp, st.session_state.simular_erro_bcb)
 
-        lista_resultados = []
-        with st.status("Processando dados (Pro-Rata)...", expanded=True) as status:
-            
-            # --- LÓGICA DE DATAS (PRO-RATA) ---
-            datas_calc = []
-            curr = inicio_atraso
-            while curr <= fim_atraso:
-                ultimo_dia_mes = calendar.monthrange(curr.year, curr.month)[1]
-                data_fim_mes = date(curr.year, curr.month, ultimo_dia_mes)
-                data_encerramento_periodo = min(data_fim_mes, fim_atraso)
-                dias_ativos = (data_encerramento_periodo - curr).days + 1
-                dias_no_mes = ultimo_dia_mes
-                
-                valor_base_mes = val_mensal_cheio
-                txt_pro_rata = "Integral"
-                if dias_ativos < dias_no_mes:
-                    fator_pro = Decimal(dias_ativos) / Decimal(dias_no_mes)
-                    valor_base_mes = val_mensal_cheio * fator_pro
-                    txt_pro_rata = f"Pro-rata ({dias_ativos}/{dias_no_mes} dias)"
-
-                datas_calc.append({
-                    "vencimento": curr, 
-                    "valor_base": valor_base_mes,
-                    "info_prorata": txt_pro_rata
-                })
-                curr = data_fim_mes + timedelta(days=1)
-            
-            # --- BAIXA DADOS DO BCB ---
-            dt_minima_api = min([d['vencimento'] for d in datas_calc])
-            
-            df_indice_principal = pd.DataFrame()
-            if cod_ind_escolhido and cod_ind_escolhido != -1:
-                status.write(f"Baixando série histórica {indice_sel_ind}...")
-                df_indice_principal = obter_dados_bcb_cache(cod_ind_escolhido, dt_minima_api, data_calculo)
-            elif cod_ind_escolhido == -1:
-                status.write("Acessando Tabela Prática TJSP...")
-            
-            df_selic_cache = pd.DataFrame()
-            if "SELIC" in regime_tipo or "Misto" in regime_tipo:
-                status.write("Baixando série histórica SELIC...")
-                dt_inicio_selic = data_corte_selic if data_corte_selic else dt_minima_api
-                if dt_inicio_selic > dt_minima_api: dt_inicio_selic = dt_minima_api
-                df_selic_cache = obter_dados_bcb_cache(COD_SELIC, dt_inicio_selic, data_calculo)
-            
-            # --- LOOP DE CÁLCULO ---
-            for item in datas_calc:
-                venc = item['vencimento']
-                val_base = item['valor_base']
-                
-                linha = {
-                    "Vencimento": venc.strftime("%d/%m/%Y"),
-                    "Pro-Rata": item['info_prorata'],
-                    "Valor Orig.": formatar_moeda(val_base),
-                    "Audit Fator CM": "-", "V. Corrigido Puro": "-",
-                    "Audit Juros %": "-", "Valor Juros": "-", "Subtotal F1": "-",
-                    "Audit Fator SELIC": "-", "Principal Atualizado": "-", "TOTAL": "-",
-                    "_num": Decimal('0.00'),
-                    "data_sort": venc
-                }
-
-                total_final = Decimal('0.00')
-
-                # 1. ÍNDICE PADRÃO
-                if "1. Índice" in regime_tipo:
-                    if cod_ind_escolhido == -1:
-                         fator = calc_tjsp.calcular_fator_composto(venc, data_calculo)
-                    else:
-                         fator = calcular_fator_memoria(df_indice_principal, venc, data_calculo)
-                    
-                    if fator:
-                        v_corrigido = val_base * fator
-                        linha["Audit Fator CM"] = formatar_decimal_str(fator)
-                        linha["V. Corrigido Puro"] = formatar_moeda(v_corrigido)
-                        
-                        dt_inicio_juros = data_citacao_ind if venc < data_citacao_ind else venc
-                        dias_atraso = (data_calculo - dt_inicio_juros).days
-                        
-                        valor_juros = Decimal('0.00')
-                        if dias_atraso > 0:
-                            valor_juros = v_corrigido * ((Decimal('0.01') / Decimal('30')) * Decimal(dias_atraso))
-                            linha["Audit Juros %"] = f"{(dias_atraso/30):.1f}%"
-                            linha["Valor Juros"] = formatar_moeda(valor_juros)
-                        total_final = v_corrigido + valor_juros
-
-                # 2. SELIC PURA
-                elif "2. Taxa SELIC" in regime_tipo:
-                    fator_selic = calcular_fator_memoria(df_selic_cache, venc, data_calculo)
-                    if fator_selic:
-                        total_final = val_base * fator_selic
-                        linha["Audit Fator SELIC"] = formatar_decimal_str(fator_selic)
-                
-                # 3. MISTO
-                elif "3. Misto" in regime_tipo:
-                    if venc >= data_corte_selic:
-                        # Pós Corte: SELIC Pura
-                        fator_selic = calcular_fator_memoria(df_selic_cache, venc, data_calculo)
-                        if fator_selic:
-                            total_final = val_base * fator_selic
-                            linha["Audit Fator SELIC"] = formatar_decimal_str(fator_selic)
-                            linha["Principal Atualizado"] = formatar_moeda(total_final)
-                            linha["Audit Juros %"] = "-"
-                    else:
-                        # Fase 1
-                        if cod_ind_escolhido == -1:
-                             f_fase1 = calc_tjsp.calcular_fator_composto(venc, data_corte_selic)
-                        else:
-                             f_fase1 = calcular_fator_memoria(df_indice_principal, venc, data_corte_selic)
-
-                        if f_fase1:
-                            v_corr_f1 = val_base * f_fase1
-                            linha["Audit Fator CM"] = f"{f_fase1:.6f}"
-                            linha["V. Corrigido Puro"] = formatar_moeda(v_corr_f1)
-
-                            # Juros (Congelados) - SOMENTE SE O CHECKBOX ESTIVER MARCADO
-                            juros_f1 = Decimal('0.00')
-                            
-                            if aplicar_juros_fase1: # <--- CONTROLE NOVO
-                                dt_j_f1 = data_citacao_ind if venc < data_citacao_ind else venc
-                                if dt_j_f1 < data_corte_selic:
-                                    dias_f1 = (data_corte_selic - dt_j_f1).days
-                                    juros_f1 = v_corr_f1 * (Decimal('0.01')/Decimal('30') * Decimal(dias_f1))
-                                    linha["Audit Juros %"] = formatar_moeda(juros_f1)
-                                else:
-                                    linha["Audit Juros %"] = "R$ 0,00"
-                            else:
-                                linha["Audit Juros %"] = "N/A (Desativado)"
-                            
-                            total_fase1 = v_corr_f1 + juros_f1
-                            linha["Subtotal F1"] = formatar_moeda(total_fase1)
-
-                            f_selic_f2 = calcular_fator_memoria(df_selic_cache, data_corte_selic, data_calculo)
-                            if f_selic_f2:
-                                princ_atualizado = v_corr_f1 * f_selic_f2
-                                linha["Audit Fator SELIC"] = f"{f_selic_f2:.6f}"
-                                linha["Principal Atualizado"] = formatar_moeda(princ_atualizado)
-                                total_final = princ_atualizado + juros_f1
-
-                linha["TOTAL"] = formatar_moeda(total_final)
-                linha["_num"] = total_final
-                lista_resultados.append(linha)
-
-            status.update(label="Concluído!", state="complete")
-        
-        df = pd.DataFrame(lista_resultados)
-        st.session_state.df_indenizacao = df
-        st.session_state.total_indenizacao = df["_num"].sum()
-        
+    def concluir_indenizacao(resultado):
+        st.session_state.df_indenizacao = resultado["compacto"]
+        st.session_state.total_indenizacao = resultado["total"]
+
+    acompanhar_tarefa("indenizacao", concluir_indenizacao)
+    if st.session_state.exibir_resultado.get("indenizacao"):
+        compacto = st.session_state.df_indenizacao
         st.success(f"Total: {formatar_moeda(st.session_state.total_indenizacao)}")
-        
-        if not df.empty:
-            chart_data = df[['data_sort', '_num']].copy()
-            chart_data = chart_data.rename(columns={'data_sort': 'Vencimento', '_num': 'Valor Atualizado'})
-            chart_data['Valor Atualizado'] = chart_data['Valor Atualizado'].astype(float)
-            st.area_chart(chart_data.set_index('Vencimento'))
+        mostrar_fontes("indenizacao")
 
+        if compacto.n:
+            st.area_chart(compacto.tabela_grafico())
+
+        df = compacto.para_dataframe()
         cols_exibir = [c for c in df.columns if c not in ["_num", "data_sort"]]
         st.dataframe(df[cols_exibir], use_container_width=True, hide_index=True)
+        botoes_exportar("indenizacao", f"indenizacao_{data_calculo}", compacto.ESQUEMA, compacto.blocos)
+
+    if st.button("Comparar Todos os Índices"):
+        if "2. Taxa SELIC" in regime_tipo:
+            st.info("O regime SELIC pura não depende do índice de correção; escolha o regime 1 ou 3 para comparar.")
+        else:
+            with diagnostico.medir_calculo("comparacao_indenizacao") as diag:
+                datas_calc = motor.gerar_cronograma_pro_rata(inicio_atraso, fim_atraso, val_mensal_cheio)
+                codigos = list(mapa_indices_completo.values())
+                janelas = [j for cod in codigos for j in motor.series_indenizacao(datas_calc, regime_tipo, cod, data_corte_selic, data_calculo).values()]
+                series_comp = obter_series_comparacao(janelas)
+                registrar_fontes("comparacao", series_comp)
+                comparacao = comparar_indenizacao(datas_calc, regime_tipo, data_calculo, series_comp, calc_tjsp,
+                                                  data_citacao_ind, data_corte_selic, aplicar_juros_fase1, codigos)
+            st.session_state.ultimo_diagnostico = diag.como_dict()
+            # Parcelas sem nenhum fator (índice indisponível na data) ficam como None
+            mostrar_comparacao([d['vencimento'] for d in datas_calc],
+                               {cod: [t if fc is not None or fs is not None else None for t, fc, fs in zip(res.total, res.fator_cm, res.fator_selic)]
+                                for cod, res in comparacao.items()})
+            mostrar_fontes("comparacao")
+
+    with st.expander("⏱️ Multa diária / astreinte (cronograma diário, semanal ou mensal)"):
+        st.caption("Usa o regime, índice e datas escolhidos acima. Períodos com o mesmo fator são calculados juntos, uma linha por grupo.")
+        c_a1, c_a2, c_a3 = st.columns(3)
+        periodicidade = c_a1.selectbox("Periodicidade", list(PERIODICIDADES))
+        valor_periodo = to_decimal(c_a2.number_input("Valor por período (R$)", value=100.00, step=10.00))
+        teto_multa = to_decimal(c_a3.number_input("Teto nominal (R$, 0 = sem teto)", value=0.00, step=1000.00))
+        c_a4, c_a5, c_a6 = st.columns(3)
+        inicio_multa = c_a4.date_input("Início da multa", value=inicio_atraso, format="DD/MM/YYYY")
+        fim_multa = c_a5.date_input("Fim da multa", value=fim_atraso, format="DD/MM/YYYY")
+        limite_dias = int(c_a6.number_input("Limite de dias (0 = sem limite)", value=0, step=1, min_value=0))
+        st.caption("Suspensões (dias em que a multa não corre):")
+        tabela_suspensoes = st.data_editor(pd.DataFrame(columns=["Início", "Fim"]), num_rows="dynamic", key="suspensoes_multa", hide_index=True,
+                                           column_config={"Início": st.column_config.DateColumn(format="DD/MM/YYYY"), "Fim": st.column_config.DateColumn(format="DD/MM/YYYY")})
+
+        if st.button("Calcular Multa"):
+            with diagnostico.medir_calculo("astreinte") as diag:
+                suspensoes = [(ini.date(), fim.date()) for ini, fim in zip(pd.to_datetime(tabela_suspensoes["Início"], errors="coerce"),
+                                                                           pd.to_datetime(tabela_suspensoes["Fim"], errors="coerce"))
+                              if not pd.isna(ini) and not pd.isna(fim)]
+                try:
+                    cron = gerar_cronograma(inicio_multa, fim_multa, valor_periodo, PERIODICIDADES[periodicidade], suspensoes,
+                                            teto_multa or None, limite_dias or None)
+                except ValueError as e:
+                    cron = None
+                    st.error(str(e))
+                if cron is not None:
+                    janelas = janelas_cronograma(cron, regime_tipo, cod_ind_escolhido, data_corte_selic, data_calculo)
+                    baixadas = dict(zip(janelas, obter_dados_bcb_varios(list(janelas.values()))))
+                    registrar_fontes("astreinte", {janelas[nome][0]: df for nome, df in baixadas.items()})
+                    res_multa = calcular_cronograma(cron, regime_tipo, data_calculo, cod_ind_escolhido, baixadas.get('indice', pd.DataFrame()),
+                                                    baixadas.get('selic', pd.DataFrame()), calc_tjsp, data_citacao_ind, data_corte_selic,
+                                                    aplicar_juros_fase1)
+                    with diagnostico.etapa("formatacao"):
+                        df_multa = pd.DataFrame(list(res_multa.linhas()))
+            st.session_state.ultimo_diagnostico = diag.como_dict()
+            if cron is not None:
+                c_m1, c_m2 = st.columns(2)
+                c_m1.metric("Valor Nominal", formatar_moeda(res_multa.soma_nominal()))
+                c_m2.metric("Total Atualizado", formatar_moeda(res_multa.soma_total()))
+                st.caption(f"{cron.n} períodos em {res_multa.n} grupos de fator" + (" (limitado ao teto)" if cron.limitado_teto else ""))
+                mostrar_fontes("astreinte")
+                if not df_multa.empty:
+                    st.dataframe(df_multa.drop(columns=["_num"]), use_container_width=True, hide_index=True)
 
 with tab2:
     # (Mantido padrão)
@@ -560,18 +498,15 @@ with tab2:
     idx_hon = st.selectbox("Índice", list(mapa_indices_completo.keys()), index=0)
     aplica_juros_hon = st.checkbox("Aplicar Juros 1%?", value=True)
     if st.button("Calcular Hon."):
-        fator = buscar_fator_bcb(mapa_indices_completo[idx_hon], data_hon, data_calculo)
-        if fator:
-            val_corr = val_hon * fator
-            juros_val = Decimal('0.00')
-            if aplica_juros_hon:
-                dias = (data_calculo - data_hon).days
-                if dias > 0: juros_val = val_corr * (Decimal('0.01')/Decimal('30') * Decimal(dias))
-            total = val_corr + juros_val
-            res = [{"Descrição": "Honorários", "Valor Orig.": formatar_moeda(val_hon), "Audit Fator": formatar_decimal_str(fator), "Juros": formatar_moeda(juros_val), "TOTAL": formatar_moeda(total), "_num": total}]
+        with diagnostico.medir_calculo("honorarios") as diag:
+            fator = buscar_fator_bcb(mapa_indices_completo[idx_hon], data_hon, data_calculo, "honorarios")
+            res = motor.calcular_honorarios(val_hon, data_hon, data_calculo, fator, aplica_juros_hon)
+        st.session_state.ultimo_diagnostico = diag.como_dict()
+        if res:
             st.session_state.df_honorarios = pd.DataFrame(res)
-            st.session_state.total_honorarios = total
+            st.session_state.total_honorarios = res[0]["_num"]
             st.dataframe(st.session_state.df_honorarios.drop(columns=["_num"]), hide_index=True)
+            mostrar_fontes("honorarios")
 
 with tab3:
     st.subheader("Pensão Alimentícia")
@@ -581,40 +516,66 @@ with tab3:
     p_fim = c_p3.date_input("Fim", value=date.today(), format="DD/MM/YYYY")
     idx_pensao = st.selectbox("Índice Pensão", list(mapa_indices_completo.keys()))
     if st.button("1. Gerar Tabela"):
-        dates = []
-        curr = p_ini
-        while curr <= p_fim:
-            dates.append({"Vencimento": curr, "Valor Devido (R$)": float(p_val), "Valor Pago (R$)": 0.0})
-            curr += relativedelta(months=1)
+        dates = [{"Vencimento": venc, "Valor Devido (R$)": float(devido), "Valor Pago (R$)": 0.0} for venc, devido, _ in motor.gerar_parcelas_pensao(p_val, p_ini, p_fim)]
         st.session_state.df_pensao_input = pd.DataFrame(dates)
     
     tabela_editada = st.data_editor(st.session_state.df_pensao_input, num_rows="dynamic", use_container_width=True, hide_index=True, column_config={"Vencimento": st.column_config.DateColumn(format="DD/MM/YYYY"), "Valor Devido (R$)": st.column_config.NumberColumn(format="%.2f"), "Valor Pago (R$)": st.column_config.NumberColumn(format="%.2f")})
 
+    def ler_parcelas_pensao(tabela):
+        parcelas = []
+        vencimentos = pd.to_datetime(tabela["Vencimento"], errors="coerce")
+        for venc, devido, pago in zip(vencimentos, tabela["Valor Devido (R$)"], tabela["Valor Pago (R$)"]):
+            if pd.isna(venc): continue
+            parcelas.append((venc.date(), to_decimal(devido), to_decimal(pago)))
+        return parcelas
+
+    arquivo_extrato = st.file_uploader("Extrato de pagamentos (.csv)", type=["csv"], key="extrato_pensao")
+    st.caption("Colunas data e valor. Cada pagamento quita primeiro as parcelas mais antigas e, em cada parcela, "
+               "os juros antes do principal (arts. 354 e 355 do CC); o Valor Pago da tabela conta como pagamento no vencimento.")
+
     if st.button("2. Calcular Saldo"):
-        res_pensao = []
-        cod = mapa_indices_completo[idx_pensao]
-        for _, row in tabela_editada.iterrows():
-            try:
-                venc = pd.to_datetime(row["Vencimento"]).date()
-                devido = to_decimal(row["Valor Devido (R$)"])
-                pago = to_decimal(row["Valor Pago (R$)"])
-                saldo = devido - pago
-                if saldo <= 0:
-                    res_pensao.append({"Vencimento": venc.strftime("%d/%m/%Y"), "Valor Devido": formatar_moeda(devido), "Valor Pago": formatar_moeda(pago), "Base Cálculo": "QUITADO", "Fator CM": "-", "Atualizado": "-", "Juros": "-", "TOTAL": "R$ 0,00", "_num": Decimal('0.00')})
-                else:
-                    fator = buscar_fator_bcb(cod, venc, data_calculo)
-                    if not fator: continue
-                    atualizado = saldo * fator
-                    dias = (data_calculo - venc).days
-                    juros = atualizado * (Decimal('0.01')/Decimal('30') * Decimal(dias)) if dias > 0 else Decimal('0.00')
-                    tot = atualizado + juros
-                    res_pensao.append({"Vencimento": venc.strftime("%d/%m/%Y"), "Valor Devido": formatar_moeda(devido), "Valor Pago": formatar_moeda(pago), "Base Cálculo": formatar_moeda(saldo), "Fator CM": formatar_decimal_str(fator), "Atualizado": formatar_moeda(atualizado), "Juros": formatar_moeda(juros), "TOTAL": formatar_moeda(tot), "_num": tot})
-            except: pass
-        df_fin = pd.DataFrame(res_pensao)
-        st.session_state.df_pensao_final = df_fin
-        st.session_state.total_pensao = df_fin["_num"].sum() if not df_fin.empty else Decimal('0.00')
+        parcelas_pensao = ler_parcelas_pensao(tabela_editada)
+        if arquivo_extrato is None:
+            enviar_tarefa("pensao", tarefa_pensao, parcelas_pensao, mapa_indices_completo[idx_pensao],
+                          data_calculo, calc_tjsp, st.session_state.pensao_incremental, st.session_state.simular_erro_bcb)
+        else:
+            extrato, invalidos = imputacao.ler_extrato(arquivo_extrato.getvalue().decode("utf-8-sig"))
+            for erro in invalidos[:20]:
+                st.warning(f"Extrato ignorado na {erro}" if erro.startswith("linha") else erro)
+            if len(invalidos) > 20: st.warning(f"... e mais {len(invalidos) - 20} linhas inválidas no extrato.")
+            enviar_tarefa("pensao", tarefa_pensao_extrato, parcelas_pensao, extrato, mapa_indices_completo[idx_pensao],
+                          data_calculo, calc_tjsp, st.session_state.simular_erro_bcb)
+
+    def concluir_pensao(resultado):
+        st.session_state.df_pensao_final = resultado["compacto"]
+        st.session_state.total_pensao = resultado["total"]
+        st.session_state.imputacao_pensao = resultado.get("imputacao")
+
+    acompanhar_tarefa("pensao", concluir_pensao)
+    if st.session_state.exibir_resultado.get("pensao"):
         st.success(f"Total: {formatar_moeda(st.session_state.total_pensao)}")
+        mostrar_fontes("pensao")
+        df_fin = st.session_state.df_pensao_final.para_dataframe()
         if not df_fin.empty: st.dataframe(df_fin.drop(columns=["_num"]), use_container_width=True, hide_index=True)
+        botoes_exportar("pensao", f"pensao_{data_calculo}", PensaoCompacta.ESQUEMA, st.session_state.df_pensao_final.blocos)
+        imputado = st.session_state.imputacao_pensao
+        if imputado is not None:
+            with st.expander(f"Imputação dos pagamentos ({len(imputado.pagamentos)} pagamentos, "
+                             f"{formatar_moeda(imputado.soma_imputada())} imputados)"):
+                st.dataframe(pd.DataFrame(list(imputado.linhas_pagamentos())), use_container_width=True, hide_index=True)
+                botoes_exportar("imputacao", f"imputacao_pensao_{data_calculo}", imputacao.ResultadoImputacao.ESQUEMA_PAGAMENTOS,
+                                imputado.blocos_pagamentos)
+
+    if st.button("Comparar Todos os Índices (Pensão)"):
+        with diagnostico.medir_calculo("comparacao_pensao") as diag:
+            parcelas = ler_parcelas_pensao(tabela_editada)
+            janela = motor.janela_pensao(parcelas, data_calculo)
+            series_comp = obter_series_comparacao([(cod, *janela) for cod in mapa_indices_completo.values()]) if janela else {}
+            registrar_fontes("comparacao", series_comp)
+            comparacao = comparar_pensao(parcelas, data_calculo, series_comp, calc_tjsp)
+        st.session_state.ultimo_diagnostico = diag.como_dict()
+        mostrar_comparacao([p[0] for p in parcelas], {cod: list(totais) for cod, totais in comparacao.items()})
+        mostrar_fontes("comparacao")
 
 with tab4:
     # (Mantido padrão)
@@ -624,27 +585,75 @@ with tab4:
     dt_reaj = ca2.date_input("Data Reajuste", value=date.today())
     idx_a = st.selectbox("Índice Aluguel", list(mapa_indices_completo.keys()), index=1)
     if st.button("Calcular Reajuste"):
-        dt_ini = dt_reaj - relativedelta(months=12)
-        fator = buscar_fator_bcb(mapa_indices_completo[idx_a], dt_ini, dt_reaj)
-        if fator:
-            novo_val = alug_atual * fator
-            st.session_state.dados_aluguel = {'valor_antigo': alug_atual, 'novo_valor': novo_val, 'indice': idx_a, 'periodo': f"{dt_ini.strftime('%d/%m/%Y')} a {dt_reaj.strftime('%d/%m/%Y')}", 'fator': fator}
-            st.metric("Novo Aluguel", formatar_moeda(novo_val))
+        with diagnostico.medir_calculo("aluguel") as diag:
+            dt_ini, dt_fim = motor.janela_reajuste_aluguel(dt_reaj)
+            fator = buscar_fator_bcb(mapa_indices_completo[idx_a], dt_ini, dt_fim, "aluguel")
+            dados_aluguel = motor.calcular_reajuste_aluguel(alug_atual, dt_reaj, idx_a, fator)
+        st.session_state.ultimo_diagnostico = diag.como_dict()
+        if dados_aluguel:
+            st.session_state.dados_aluguel = dados_aluguel
+            st.metric("Novo Aluguel", formatar_moeda(dados_aluguel['novo_valor']))
+            mostrar_fontes("aluguel")
+
+    with st.expander("📑 Reajuste em lote (carteira de contratos)"):
+        st.caption("CSV com id, valor, indice (IGP-M, IPCA, INPC, TJSP...) e data_reajuste, ou inicio_contrato para reajustar no aniversário do ano abaixo.")
+        arquivo_contratos = st.file_uploader("Contratos (.csv)", type=["csv"], key="contratos_aluguel")
+        ano_reajuste = st.number_input("Ano do reajuste (inicio_contrato)", value=dt_reaj.year, step=1)
+        if arquivo_contratos is not None and st.button("Reajustar Carteira"):
+            import aluguel_lote
+            with diagnostico.medir_calculo("aluguel_lote") as diag:
+                registros = csv.DictReader(io.StringIO(arquivo_contratos.getvalue().decode("utf-8-sig")))
+                contratos, invalidos = aluguel_lote.ler_contratos(registros, int(ano_reajuste))
+                linhas_lote, fatores_lote, series_lote = aluguel_lote.reajustar_contratos(
+                    contratos, calc_tjsp, offline=st.session_state.simular_erro_bcb)
+                registrar_fontes("aluguel_lote", series_lote)
+            st.session_state.ultimo_diagnostico = diag.como_dict()
+            sem_indice = sum(bool(l["erro"]) for l in linhas_lote)
+            st.success(f"{len(linhas_lote)} contratos reajustados em {len(fatores_lote)} grupos ({sem_indice} sem índice, {len(invalidos)} ignorados).")
+            for msg in invalidos[:20]:
+                st.warning(f"Contrato ignorado ({msg})")
+            mostrar_fontes("aluguel_lote")
+            st.dataframe(pd.DataFrame(linhas_lote[:1000]), use_container_width=True, hide_index=True)
+            st.download_button("⬇️ Reajustes (.csv)", data=lambda: aluguel_lote.csv_reajustes(linhas_lote), file_name="reajustes.csv", mime="text/csv")
+            botoes_exportar("aluguel_lote", "reajustes_tipados", aluguel_lote.ESQUEMA_TIPADO,
+                           lambda: aluguel_lote.blocos_tipados(contratos, fatores_lote))
 
 with tab5:
     st.header("Fechamento")
     subtotal = st.session_state.total_indenizacao + st.session_state.total_honorarios + st.session_state.total_pensao
-    val_multa_523 = subtotal * Decimal('0.10') if aplicar_multa_523 else Decimal('0.00')
-    val_hon_523 = subtotal * Decimal('0.10') if aplicar_hon_523 else Decimal('0.00')
-    total_geral = subtotal + val_multa_523 + val_hon_523
+    art523 = motor.calcular_art523(subtotal, aplicar_multa_523, aplicar_hon_523)
+    val_multa_523, val_hon_523, total_geral = art523['multa'], art523['hon_exec'], art523['final']
     
     st.metric("TOTAL DA EXECUÇÃO", formatar_moeda(total_geral))
     
     totais_pdf = {'indenizacao': st.session_state.total_indenizacao, 'honorarios': st.session_state.total_honorarios, 'pensao': st.session_state.total_pensao, 'multa': val_multa_523, 'hon_exec': val_hon_523, 'final': total_geral}
     config_pdf = st.session_state.params_relatorio.copy()
     config_pdf.update({'multa_523': aplicar_multa_523, 'hon_523': aplicar_hon_523})
+    config_pdf['fontes_dados'] = [(NOMES_SERIES.get(cod, cod), texto) for fontes in st.session_state.fontes_dados.values() for cod, texto in fontes.items()]
+    if series_bcb.CAMINHO_PACOTE:
+        config_pdf['fontes_dados'].append(("Séries e Tabela TJSP", series_bcb.armazem_padrao().descrever()))
     
     if st.button("📄 Baixar PDF"):
-        pdf_bytes = gerar_pdf_relatorio(st.session_state.df_indenizacao, st.session_state.df_honorarios, st.session_state.df_pensao_final, st.session_state.dados_aluguel, totais_pdf, config_pdf)
+        # fpdf só é carregado quando o primeiro PDF é pedido
+        from relatorio_pdf import gerar_pdf_relatorio
+        with diagnostico.medir_calculo("pdf") as diag, diagnostico.etapa("pdf"):
+            pdf_bytes = gerar_pdf_relatorio(st.session_state.df_indenizacao.para_dataframe(), st.session_state.df_honorarios,
+                                            st.session_state.df_pensao_final.para_dataframe(), st.session_state.dados_aluguel, totais_pdf, config_pdf)
+        st.session_state.ultimo_diagnostico = diag.como_dict()
         st.download_button(label="⬇️ Download PDF", data=pdf_bytes, file_name=f"Laudo_CalcJus_{date.today()}.pdf", mime="application/pdf")
     
+
+# --- 4. PAINEL DE DIAGNÓSTICO ---
+# Preenchido no fim do script para refletir o cálculo feito nesta execução
+with painel_diagnostico:
+    diag_atual = st.session_state.ultimo_diagnostico
+    if not diag_atual:
+        st.caption("Nenhum cálculo executado nesta sessão.")
+    else:
+        st.markdown(f"**{diag_atual['calculo']}** em {diag_atual['segundos'] * 1000:.1f} ms")
+        etapas = [{"Etapa": nome, "ms": round(e["segundos"] * 1000, 1), "Chamadas": e["chamadas"]} for nome, e in diag_atual["etapas"].items()]
+        if etapas: st.dataframe(pd.DataFrame(etapas), hide_index=True, use_container_width=True)
+        st.dataframe(pd.DataFrame([{"Contador": k, "Valor": v} for k, v in diag_atual["contadores"].items()]), hide_index=True, use_container_width=True)
+        # Conteúdo gerado só no clique (callable), não a cada rerun
+        st.download_button("⬇️ JSON", data=lambda: json.dumps(diag_atual, ensure_ascii=False, indent=2), file_name="diagnostico.json", mime="application/json")
+    st.download_button("⬇️ Prometheus", data=diagnostico.texto_prometheus, file_name="calcjus.prom", mime="text/plain")
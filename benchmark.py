@@ -0,0 +1,273 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import pandas as pd
+
+import cronograma
+import exportacao
+import imputacao
+import motor_calculo as motor
+import motor_vetorizado
+import series_bcb
+from relatorio_pdf import gerar_pdf_relatorio
+from resultado_compacto import IndenizacaoCompacta
+from sgs_simulado import serie_sintetica
+
+# --- BENCHMARK (SEM REDE) ---
+# Uso: python benchmark.py --saida bench.json [--tamanhos 12 120 1000 10000] [--repeticoes 3]
+#      python benchmark.py --partida [--repeticoes 10]   (partida a frio e reruns do app.py)
+#      python benchmark.py --api [--requisicoes 500 --processos 4 --concorrencia 16 --casos-por-lote 1]
+# As séries vêm do gerador determinístico de sgs_simulado, então os números são reproduzíveis.
+
+TAMANHOS_PADRAO = [12, 120, 1000, 10000]
+DATA_CALCULO = date(2025, 6, 1)
+INICIO_SERIES = date(1996, 1, 1)
+CODIGO_DIARIO = 11
+
+def serie_df(codigo, inicio=INICIO_SERIES, fim=DATA_CALCULO):
+    pontos = [(datetime.strptime(p['data'], "%d/%m/%Y").date(), p['valor'])
+              for p in serie_sintetica(codigo, inicio, fim, ate=fim)]
+    return series_bcb.montar_dataframe(pontos)
+
+def cronograma_ciclico(n, valor=Decimal('1234.56')):
+    # n parcelas mensais reaproveitando o intervalo coberto pelas séries sintéticas
+    base = motor.gerar_cronograma_pro_rata(date(1996, 1, 15), date(2024, 12, 20), valor)
+    return [base[k % len(base)] for k in range(n)]
+
+def astreinte_diaria(n, valor=Decimal('500.00')):
+    # n dias de multa terminando um mês antes de DATA_CALCULO (5 anos = 1826 dias)
+    fim = DATA_CALCULO - timedelta(days=30)
+    return cronograma.gerar_cronograma(fim - timedelta(days=n - 1), fim, valor, "diaria")
+
+def tabela_tjsp_csv(meses):
+    linhas = ["mes_ano,fator"]
+    fator = Decimal('10.000000')
+    dt = date(2025, 1, 1)
+    for _ in range(meses):
+        linhas.append(f"{dt.month:02d}/{dt.year},{fator:.6f}")
+        fator = fator * Decimal('0.995')
+        dt = date(dt.year - (dt.month == 1), 12 if dt.month == 1 else dt.month - 1, 1)
+    return ("\n".join(linhas) + "\n").encode('utf-8')
+
+class _Upload:
+    def __init__(self, conteudo):
+        self.conteudo = conteudo
+
+    def seek(self, pos):
+        pass
+
+    def getvalue(self):
+        return self.conteudo
+
+def medir(funcao, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        gc.collect()
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    gc.collect()
+    tracemalloc.start()
+    funcao()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"segundos_min": min(tempos), "segundos_mediana": statistics.median(tempos), "pico_memoria_bytes": pico}
+
+def etapas(n, ctx):
+    tj = ctx["tjsp"]
+    mensal, selic, diaria = ctx["serie_mensal"], ctx["serie_selic"], ctx["serie_diaria"]
+    cron = cronograma_ciclico(n)
+    vencs = [d["vencimento"] for d in cron]
+    parcelas = [(venc, Decimal('1000.00'), Decimal('250.00') if k % 7 == 0 else Decimal('0.00')) for k, venc in enumerate(vencs)]
+    args_ind = dict(data_calculo=DATA_CALCULO, cod_ind_escolhido=188, df_indice_principal=mensal, df_selic_cache=selic,
+                    calc_tjsp=tj, data_citacao_ind=date(2000, 1, 1), data_corte_selic=date(2015, 1, 1), aplicar_juros_fase1=True)
+    linhas_pdf = list(motor_vetorizado.calcular_indenizacao_vetorizada(cron, motor.REGIME_INDICE, **args_ind).linhas())
+    df_pdf = pd.DataFrame(linhas_pdf)
+    totais = {'indenizacao': sum(l["_num"] for l in linhas_pdf), 'honorarios': Decimal('0'), 'pensao': Decimal('0'),
+              'multa': Decimal('0'), 'hon_exec': Decimal('0')}
+    totais['final'] = totais['indenizacao']
+    config = {'data_calculo': DATA_CALCULO, 'tipo_regime': motor.REGIME_INDICE}
+    conteudo_tjsp = tabela_tjsp_csv(n)
+
+    def carregar_tjsp_frio():
+        motor._tabelas_tjsp.clear()
+        motor.CalculadoraTJSP(_Upload(conteudo_tjsp))
+
+    yield "cronograma_pro_rata", lambda: motor.gerar_cronograma_pro_rata(date(1990, 1, 15), date(1990, 1, 15) + timedelta(days=int(n * 30.4)), Decimal('1234.56'))
+    yield "cronograma_diario", lambda: cronograma.gerar_cronograma(date(1997, 1, 1), date(1997, 1, 1) + timedelta(days=n - 1), Decimal('500.00'))
+    astreinte = astreinte_diaria(n)
+    for nome, regime in (("indice", motor.REGIME_INDICE), ("selic", motor.REGIME_SELIC), ("misto", motor.REGIME_MISTO)):
+        yield f"astreinte_diaria_{nome}", lambda r=regime: cronograma.calcular_cronograma(astreinte, r, **args_ind).soma_total()
+    yield "fator_memoria_mensal", lambda: [series_bcb.calcular_fator_memoria(mensal, v, DATA_CALCULO) for v in vencs]
+    yield "fator_memoria_diaria", lambda: [series_bcb.calcular_fator_memoria(diaria, v, DATA_CALCULO) for v in vencs]
+    for nome, regime in (("indice", motor.REGIME_INDICE), ("selic", motor.REGIME_SELIC), ("misto", motor.REGIME_MISTO)):
+        yield f"indenizacao_{nome}_decimal", lambda r=regime: motor.calcular_indenizacao(cron, r, **args_ind)
+        yield f"indenizacao_{nome}_colunas", lambda r=regime: motor_vetorizado.calcular_indenizacao_vetorizada(cron, r, **args_ind).soma_total()
+    yield "pensao_saldo", lambda: motor.calcular_pensao(parcelas, 433, mensal, tj, DATA_CALCULO)
+    # Extrato com um pagamento parcial a cada parcela, 10 dias depois do vencimento
+    extrato = [(venc + timedelta(days=10), Decimal('600.00') if k % 5 else Decimal('3000.00')) for k, venc in enumerate(vencs)]
+    yield "pensao_imputacao", lambda: imputacao.imputar_parcelas(parcelas, extrato, 433, mensal, tj, DATA_CALCULO).total
+    yield "tjsp_carga_fria", carregar_tjsp_frio
+    yield "tjsp_carga_cache", lambda: motor.CalculadoraTJSP(_Upload(conteudo_tjsp))
+    yield "pdf_relatorio", lambda: gerar_pdf_relatorio(df_pdf, pd.DataFrame(), pd.DataFrame(), None, totais, config)
+    compacto = IndenizacaoCompacta(motor_vetorizado.calcular_indenizacao_vetorizada(cron, motor.REGIME_MISTO, **args_ind))
+    for formato in exportacao.formatos_disponiveis():
+        yield f"exportacao_{formato}", lambda f=formato: exportacao.exportar_arquivo(f, compacto.ESQUEMA, compacto.blocos()).close()
+
+# --- PARTIDA DO APP (STREAMLIT) ---
+# Roda num processo novo: importação do streamlit, primeira execução do app.py (partida a frio),
+# reruns sem ação e o clique em "Calcular Indenização" (Tabela TJSP, sem rede): envio da tarefa
+# e tempo até o resultado estar na sessão.
+SCRIPT_PARTIDA = """
+import json, statistics, sys, time
+inicio = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+importado = time.perf_counter()
+app = AppTest.from_file(sys.argv[1], default_timeout=120)
+app.run()
+primeira = time.perf_counter()
+modulos = {m: m in sys.modules for m in ("fpdf", "requests", "urllib3")}
+reruns = []
+for _ in range(int(sys.argv[2])):
+    t = time.perf_counter(); app.run(); reruns.append(time.perf_counter() - t)
+t = time.perf_counter()
+next(b for b in app.button if b.label == "Calcular Indenização").click().run()
+envio = time.perf_counter() - t
+import tarefas
+tarefas.fila_padrao().aguardar_todas(120)
+app.run()
+calculo = time.perf_counter() - t
+print(json.dumps({"importacao_streamlit_segundos": importado - inicio, "primeira_execucao_segundos": primeira - importado,
+                  "rerun_segundos_mediana": statistics.median(reruns), "rerun_segundos_min": min(reruns),
+                  "interacao_envio_segundos": envio, "interacao_calculo_segundos": calculo, "modulos_carregados_na_partida": modulos}))
+"""
+
+def medir_partida(reexecucoes):
+    raiz = os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.run([sys.executable, "-c", SCRIPT_PARTIDA, os.path.join(raiz, "app.py"), str(reexecucoes)],
+                          cwd=raiz, capture_output=True, text=True, check=True)
+    medida = json.loads(proc.stdout.strip().splitlines()[-1])
+    print(f"partida a frio {medida['primeira_execucao_segundos'] * 1000:8.1f} ms  rerun {medida['rerun_segundos_mediana'] * 1000:6.1f} ms"
+          f"  cálculo {medida['interacao_calculo_segundos'] * 1000:6.1f} ms", file=sys.stderr)
+    return dict(medida, versao=versao_codigo(), data=datetime.now().isoformat(timespec="seconds"), python=platform.python_version())
+
+CASO_API = {"tipo": "indenizacao", "valor": "1000", "inicio": "2020-01-21", "fim": "2023-09-26", "indice": "IPCA",
+            "data_calculo": "2025-01-15", "regime": "misto", "multa_523": True}
+
+def medir_api(requisicoes, processos, concorrencia, casos_por_lote=1):
+    # Sobe api_calculo.py contra o sgs_simulado e dispara requisições concorrentes pelo cliente
+    import urllib.request
+    from concurrent.futures import ThreadPoolExecutor
+
+    raiz = os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.Popen([sys.executable, os.path.join(raiz, "api_calculo.py"), "--sgs-simulado", "--porta", "0",
+                             "--processos", str(processos)], cwd=raiz, stdout=subprocess.PIPE, text=True)
+    try:
+        url = proc.stdout.readline().split()[3]
+        rota, corpo = ("/calcular", CASO_API) if casos_por_lote <= 1 else ("/lote", {"casos": [CASO_API] * casos_por_lote})
+        dados = json.dumps(corpo).encode("utf-8")
+
+        def chamar(_):
+            pedido = urllib.request.Request(url + rota, data=dados, headers={"Content-Type": "application/json"})
+            inicio = time.perf_counter()
+            with urllib.request.urlopen(pedido) as resposta:
+                resposta.read()
+            return time.perf_counter() - inicio
+
+        # Aquecimento: séries baixadas para o cache compartilhado antes da medida
+        chamar(0)
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(concorrencia) as executor:
+            tempos = sorted(executor.map(chamar, range(requisicoes)))
+        total = time.perf_counter() - inicio
+        with urllib.request.urlopen(url + "/metricas.json") as resposta:
+            servidor = json.loads(resposta.read())
+    finally:
+        proc.terminate()
+        proc.wait(10)
+
+    def percentil(q):
+        return tempos[min(len(tempos) - 1, int(q * len(tempos)))]
+
+    medida = {"requisicoes": requisicoes, "processos": processos, "concorrencia": concorrencia, "casos_por_requisicao": casos_por_lote,
+              "requisicoes_por_segundo": requisicoes / total, "casos_por_segundo": requisicoes * casos_por_lote / total,
+              "p50_segundos": percentil(0.50), "p95_segundos": percentil(0.95), "p99_segundos": percentil(0.99),
+              "metricas_servidor": servidor}
+    print(f"api {processos} processos  {medida['requisicoes_por_segundo']:8.1f} req/s  p50 {medida['p50_segundos'] * 1000:6.1f} ms"
+          f"  p95 {medida['p95_segundos'] * 1000:6.1f} ms", file=sys.stderr)
+    return dict(medida, versao=versao_codigo(), data=datetime.now().isoformat(timespec="seconds"), python=platform.python_version())
+
+def versao_codigo():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def executar(tamanhos, repeticoes, filtro=None):
+    ctx = {}
+    inicio = time.perf_counter()
+    ctx["serie_mensal"] = serie_df(188)
+    ctx["serie_selic"] = serie_df(motor.COD_SELIC)
+    ctx["serie_diaria"] = serie_df(CODIGO_DIARIO)
+    ctx["tjsp"] = motor.CalculadoraTJSP()
+    preparo = time.perf_counter() - inicio
+
+    resultados = []
+    for n in tamanhos:
+        for etapa, funcao in etapas(n, ctx):
+            if filtro and not any(f in etapa for f in filtro): continue
+            medida = medir(funcao, repeticoes)
+            resultados.append(dict(etapa=etapa, tamanho=n, **medida))
+            print(f"{etapa:34s} n={n:6d}  {medida['segundos_min'] * 1000:10.2f} ms  {medida['pico_memoria_bytes'] / 1024:10.0f} KiB",
+                  file=sys.stderr)
+    return {
+        "versao": versao_codigo(),
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "repeticoes": repeticoes,
+        "preparo_series_segundos": preparo,
+        "pontos_serie_diaria": len(ctx["serie_diaria"]),
+        "resultados": resultados,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark reproduzível do CalcJus Pro (sem rede)")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=TAMANHOS_PADRAO)
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--etapas", nargs="*", default=None, help="Filtra etapas pelo nome (substring)")
+    parser.add_argument("--saida", default=None, help="Arquivo JSON de saída (padrão: stdout)")
+    parser.add_argument("--partida", action="store_true", help="Mede a partida a frio e os reruns do app.py")
+    parser.add_argument("--api", action="store_true", help="Teste de carga da api_calculo.py contra o sgs_simulado")
+    parser.add_argument("--requisicoes", type=int, default=500)
+    parser.add_argument("--processos", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--concorrencia", type=int, default=16)
+    parser.add_argument("--casos-por-lote", type=int, default=1, help="Casos por requisição (>1 usa POST /lote)")
+    args = parser.parse_args(argv)
+
+    if args.api:
+        relatorio = medir_api(args.requisicoes, args.processos, args.concorrencia, args.casos_por_lote)
+    elif args.partida:
+        relatorio = medir_partida(args.repeticoes)
+    else:
+        relatorio = executar(args.tamanhos, args.repeticoes, args.etapas)
+    texto = json.dumps(relatorio, indent=2, ensure_ascii=False)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            f.write(texto)
+    else:
+        print(texto)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+
+import diagnostico
+
+# --- CACHE DE RESULTADOS (ENDEREÇADO POR CONTEÚDO) ---
+# A chave é o SHA-256 das entradas do cálculo em JSON canônico, incluindo a assinatura das
+# séries e da tabela TJSP usadas: dados novos no BCB ou outra tabela TJSP geram outra chave,
+# e as entradas antigas saem pelo LRU. O nível em disco é opcional (CALCJUS_CACHE_RESULTADOS).
+
+MAX_ITENS = 256
+MAX_BYTES = 64 * 1024 * 1024
+MAX_ITENS_DISCO = 2048
+DIRETORIO_DISCO = os.environ.get("CALCJUS_CACHE_RESULTADOS")
+
+def _canonico(valor):
+    if isinstance(valor, Decimal):
+        return format(valor.normalize(), 'f') if valor.is_finite() else str(valor)
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    if isinstance(valor, dict):
+        return {str(k): _canonico(v) for k, v in sorted(valor.items(), key=lambda kv: str(kv[0]))}
+    if isinstance(valor, (list, tuple)):
+        return [_canonico(v) for v in valor]
+    return valor
+
+def chave_calculo(tipo, entradas):
+    texto = json.dumps({"tipo": tipo, "entradas": _canonico(entradas)}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+def chave_indenizacao(inicio, fim, valor_mensal, regime, indice, data_calculo, citacao, corte, juros_fase1, hash_tjsp,
+                      situacoes):
+    # Entradas da Indenização + dados usados: a Tabela TJSP (só quando é o índice) e, para cada série
+    # ({nome: situação de series_bcb ou None}), a marca d'água e o pacote offline de origem
+    return chave_calculo("indenizacao_compacta_v2", {
+        'inicio': inicio, 'fim': fim, 'valor_mensal': valor_mensal, 'regime': regime, 'indice': indice,
+        'data_calculo': data_calculo, 'citacao': citacao, 'corte': corte, 'juros_fase1': juros_fase1,
+        'tjsp': hash_tjsp if indice == -1 else None,
+        'dados': {nome: (situacao['dados_ate'], situacao.get('pacote')) if situacao else None
+                  for nome, situacao in situacoes.items()},
+    })
+
+class CacheResultados:
+    # LRU em memória limitado por itens e bytes (tamanho do pickle), com nível opcional em disco
+
+    def __init__(self, max_itens=MAX_ITENS, max_bytes=MAX_BYTES, diretorio=None, max_itens_disco=MAX_ITENS_DISCO):
+        self.max_itens = max_itens
+        self.max_bytes = max_bytes
+        self.diretorio = diretorio
+        self.max_itens_disco = max_itens_disco
+        self._itens = OrderedDict()
+        self._bytes = 0
+        self._trava = threading.Lock()
+        if diretorio: os.makedirs(diretorio, exist_ok=True)
+
+    def _caminho(self, chave):
+        return os.path.join(self.diretorio, chave + ".pkl")
+
+    def _guardar_memoria(self, chave, dados):
+        with self._trava:
+            if chave in self._itens:
+                self._bytes -= len(self._itens.pop(chave))
+            self._itens[chave] = dados
+            self._bytes += len(dados)
+            while self._itens and (len(self._itens) > self.max_itens or self._bytes > self.max_bytes):
+                _, antigo = self._itens.popitem(last=False)
+                self._bytes -= len(antigo)
+
+    def obter(self, chave):
+        with self._trava:
+            dados = self._itens.get(chave)
+            if dados is not None: self._itens.move_to_end(chave)
+        if dados is None and self.diretorio:
+            try:
+                with open(self._caminho(chave), 'rb') as f:
+                    dados = f.read()
+                os.utime(self._caminho(chave))
+                self._guardar_memoria(chave, dados)
+            except OSError:
+                dados = None
+        if dados is None:
+            diagnostico.contar("resultados_cache_misses")
+            return None
+        diagnostico.contar("resultados_cache_hits")
+        return pickle.loads(dados)
+
+    def guardar(self, chave, valor):
+        dados = pickle.dumps(valor, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(dados) > self.max_bytes: return
+        self._guardar_memoria(chave, dados)
+        if self.diretorio:
+            try:
+                with tempfile.NamedTemporaryFile('wb', dir=self.diretorio, delete=False, suffix=".tmp") as f:
+                    f.write(dados)
+                os.replace(f.name, self._caminho(chave))
+                self._podar_disco()
+            except OSError:
+                pass
+
+    def _podar_disco(self):
+        # Remove os arquivos menos usados (mtime é atualizado a cada leitura)
+        arquivos = [os.path.join(self.diretorio, n) for n in os.listdir(self.diretorio) if n.endswith(".pkl")]
+        if len(arquivos) <= self.max_itens_disco: return
+        arquivos.sort(key=lambda c: os.stat(c).st_mtime)
+        for caminho in arquivos[:len(arquivos) - self.max_itens_disco]:
+            try:
+                os.remove(caminho)
+            except OSError:
+                pass
+
+    def limpar(self):
+        with self._trava:
+            self._itens.clear()
+            self._bytes = 0
+        if self.diretorio:
+            for nome in os.listdir(self.diretorio):
+                if nome.endswith(".pkl"):
+                    try:
+                        os.remove(os.path.join(self.diretorio, nome))
+                    except OSError:
+                        pass
+
+_cache = None
+_trava_cache = threading.Lock()
+
+def cache_padrao():
+    global _cache
+    with _trava_cache:
+        if _cache is None:
+            _cache = CacheResultados(diretorio=DIRETORIO_DISCO)
+        return _cache
@@ -0,0 +1,220 @@
+import argparse
+import csv
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal, ROUND_HALF_UP
+
+import exportacao
+import motor_calculo as motor
+import series_bcb
+
+# --- CÁLCULO EM LOTE (CLI) ---
+# Uso: python calculo_lote.py casos.csv --parcelas parcelas.csv --totais totais.csv [--processos N]
+#      [--laudos laudos.zip | --laudos pasta/]  (um PDF por caso, ver laudos_lote)
+#      [--pacote series.calcjus]  (séries e Tabela TJSP do pacote offline, ver pacote_series)
+#      [--formato csv|xlsx|parquet]  (parcelas com colunas tipadas, ver exportacao; padrão pela extensão)
+
+COLUNAS_PARCELAS = [
+    "id", "tipo", "Vencimento", "Descrição", "Pro-Rata", "Valor Orig.", "Valor Devido", "Valor Pago",
+    "Base Cálculo", "Audit Fator CM", "Fator CM", "Audit Fator", "V. Corrigido Puro", "Atualizado",
+    "Audit Juros %", "Valor Juros", "Juros", "Subtotal F1", "Audit Fator SELIC", "Principal Atualizado",
+    "TOTAL", "valor_num",
+]
+# Parcelas tipadas: (coluna de saída, tipo de exportacao, chave das linhas). Os valores vêm de
+# resultado["exatas"] (calcular_caso com exatas=True), sem passar pelos textos formatados:
+# fatores com todas as casas e valor_num como o total exato da parcela.
+PARCELAS_TIPADAS = [
+    ("id", "texto", "id"), ("tipo", "texto", "tipo"), ("vencimento", "data", "Vencimento"),
+    ("descricao", "texto", "Descrição"), ("pro_rata", "texto", "Pro-Rata"), ("valor_orig_centavos", "centavos", "Valor Orig."),
+    ("valor_devido_centavos", "centavos", "Valor Devido"), ("valor_pago_centavos", "centavos", "Valor Pago"),
+    ("base_calculo_centavos", "centavos", "Base Cálculo"), ("audit_fator_cm", "decimal", "Audit Fator CM"),
+    ("fator_cm", "decimal", "Fator CM"), ("audit_fator", "decimal", "Audit Fator"),
+    ("v_corrigido_centavos", "centavos", "V. Corrigido Puro"), ("atualizado_centavos", "centavos", "Atualizado"),
+    ("audit_juros", "texto", "Audit Juros %"), ("valor_juros_centavos", "centavos", "Valor Juros"),
+    ("juros_centavos", "centavos", "Juros"), ("subtotal_f1_centavos", "centavos", "Subtotal F1"),
+    ("audit_fator_selic", "decimal", "Audit Fator SELIC"), ("principal_atualizado_centavos", "centavos", "Principal Atualizado"),
+    ("total_centavos", "centavos", "TOTAL"), ("valor_num", "valor", "TOTAL"),
+]
+ESQUEMA_PARCELAS = [(nome, tipo) for nome, tipo, _ in PARCELAS_TIPADAS]
+BLOCO_EXPORTACAO = 50_000
+
+COLUNAS_TOTAIS = ["id", "tipo", "total", "multa_523", "honorarios_523", "total_geral", "pacote_series", "erro"]
+
+_series_worker = {}
+_tjsp_worker = None
+_pacote_worker = None
+_exatas_worker = False
+
+def ler_casos(caminho):
+    with open(caminho, mode='r', encoding='utf-8') as f:
+        if caminho.lower().endswith((".jsonl", ".ndjson")):
+            return [json.loads(linha) for linha in f if linha.strip()]
+        return list(csv.DictReader(f))
+
+def centavos(valor):
+    return str(valor.quantize(motor.DOIS_DECIMAIS, rounding=ROUND_HALF_UP))
+
+def valor_tipado(tipo, valor):
+    # Valor exato da linha -> tipo de exportacao (centavos: int arredondado); None = vazio
+    if valor is None or tipo != "centavos": return valor
+    return int(valor.quantize(motor.DOIS_DECIMAIS, rounding=ROUND_HALF_UP).scaleb(2))
+
+def blocos_parcelas(resultados, tamanho=BLOCO_EXPORTACAO):
+    # Colunas de ESQUEMA_PARCELAS em blocos de até `tamanho` parcelas, consumindo os resultados em fluxo
+    colunas = [[] for _ in PARCELAS_TIPADAS]
+    for res in resultados:
+        for exata in res.get("exatas", []):
+            registro = dict(exata, id=res["id"], tipo=res["tipo"])
+            for coluna, (_, tipo, origem) in zip(colunas, PARCELAS_TIPADAS):
+                coluna.append(valor_tipado(tipo, registro.get(origem)))
+        if len(colunas[0]) >= tamanho:
+            yield colunas
+            colunas = [[] for _ in PARCELAS_TIPADAS]
+    if colunas[0]:
+        yield colunas
+
+def pre_carregar_series(janelas_casos, armazem=None):
+    # Uma única consulta por série, cobrindo a união das janelas de todos os casos;
+    # janelas_casos: motor.janelas_caso de cada caso, montadas por quem valida o caso
+    uniao = {}
+    for janelas_caso in janelas_casos:
+        for codigo, inicio, fim in janelas_caso:
+            atual = uniao.get(codigo)
+            uniao[codigo] = (min(atual[0], inicio), max(atual[1], fim)) if atual else (inicio, fim)
+    janelas = [(codigo, inicio, fim) for codigo, (inicio, fim) in uniao.items()]
+    baixadas = series_bcb.obter_series(janelas, armazem=armazem)
+    return {janela[0]: df for janela, df in zip(janelas, baixadas) if df is not None}
+
+def _iniciar_worker(series, caminho_tjsp, caminho_pacote=None, exatas=False):
+    # Com pacote, a Tabela TJSP também vem dele (mmap aberto uma vez por processo)
+    global _series_worker, _tjsp_worker, _pacote_worker, _exatas_worker
+    _series_worker = series
+    _exatas_worker = exatas
+    if caminho_pacote:
+        import pacote_series
+        _pacote_worker = pacote_series.abrir_pacote(caminho_pacote)
+        _tjsp_worker = _pacote_worker.calculadora_tjsp()
+    else:
+        _pacote_worker = None
+        _tjsp_worker = motor.CalculadoraTJSP(arquivo_padrao=caminho_tjsp)
+
+def _calcular_worker(caso):
+    try:
+        resultado = motor.calcular_caso(caso, _series_worker, _tjsp_worker, _exatas_worker)
+    except Exception as e:
+        resultado = {"id": caso["id"], "tipo": caso["tipo"], "linhas": [], "total": Decimal('0.00'), "art523": None, "erro": str(e)}
+    resultado["pacote_series"] = _pacote_worker.id if _pacote_worker else ""
+    return resultado
+
+def calcular_lote(casos, series, caminho_tjsp='tabela_tjsp.csv', processos=None, caminho_pacote=None, exatas=False):
+    # Gera os resultados na ordem dos casos, distribuindo-os num pool de processos;
+    # exatas=True para a exportação tipada (ver motor_calculo.calcular_caso)
+    processos = processos or os.cpu_count() or 1
+    if processos == 1 or len(casos) < 2:
+        _iniciar_worker(series, caminho_tjsp, caminho_pacote, exatas)
+        yield from map(_calcular_worker, casos)
+        return
+    bloco = max(1, len(casos) // (processos * 4))
+    with ProcessPoolExecutor(max_workers=processos, initializer=_iniciar_worker,
+                             initargs=(series, caminho_tjsp, caminho_pacote, exatas)) as pool:
+        yield from pool.map(_calcular_worker, casos, chunksize=bloco)
+
+def _guardando(resultados, destino):
+    # Repassa os resultados ao CSV mantendo uma cópia para os laudos
+    for res in resultados:
+        destino.append(res)
+        yield res
+
+def _gravando_totais(resultados, totais, contagem):
+    # Grava a linha de totais de cada caso e repassa o resultado para as parcelas
+    for res in resultados:
+        contagem[0] += 1
+        art523 = res.get("art523") or {}
+        erro = res.get("erro", "")
+        contagem[1] += bool(erro)
+        totais.writerow({
+            "id": res["id"], "tipo": res["tipo"], "total": centavos(res["total"]),
+            "multa_523": centavos(art523.get("multa", Decimal('0.00'))),
+            "honorarios_523": centavos(art523.get("hon_exec", Decimal('0.00'))),
+            "total_geral": centavos(art523.get("final", res["total"])),
+            "pacote_series": res.get("pacote_series", ""), "erro": erro,
+        })
+        yield res
+
+def escrever_resultados(resultados, caminho_parcelas, caminho_totais, formato=None):
+    # formato None: parcelas no CSV formatado (textos da tela); csv/xlsx/parquet: colunas tipadas,
+    # que exigem os resultados calculados com exatas=True
+    contagem = [0, 0]
+    with open(caminho_totais, mode='w', encoding='utf-8', newline='') as f_tot:
+        totais = csv.DictWriter(f_tot, fieldnames=COLUNAS_TOTAIS)
+        totais.writeheader()
+        resultados = _gravando_totais(resultados, totais, contagem)
+        if formato:
+            exportacao.exportar(formato, ESQUEMA_PARCELAS, blocos_parcelas(resultados), caminho_parcelas)
+        else:
+            with open(caminho_parcelas, mode='w', encoding='utf-8', newline='') as f_parc:
+                parcelas = csv.DictWriter(f_parc, fieldnames=COLUNAS_PARCELAS, extrasaction='ignore')
+                parcelas.writeheader()
+                for res in resultados:
+                    for linha in res["linhas"]:
+                        parcelas.writerow(dict(linha, id=res["id"], tipo=res["tipo"], valor_num=str(linha["_num"])))
+    return contagem[0], contagem[1]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CalcJus Pro - cálculo em lote de processos")
+    parser.add_argument("casos", help="Arquivo CSV ou JSONL com um caso por linha")
+    parser.add_argument("--parcelas", default="parcelas.csv", help="CSV de saída por parcela")
+    parser.add_argument("--totais", default="totais.csv", help="CSV de saída com os totais por caso")
+    parser.add_argument("--processos", type=int, default=None, help="Tamanho do pool (padrão: nº de CPUs)")
+    parser.add_argument("--tabela-tjsp", default="tabela_tjsp.csv", help="CSV da Tabela Prática TJSP")
+    parser.add_argument("--laudos", default=None, help="Gera um PDF por caso: arquivo .zip ou diretório")
+    parser.add_argument("--pacote", default=series_bcb.CAMINHO_PACOTE,
+                        help="Pacote offline de séries (pacote_series); substitui o BCB e a --tabela-tjsp")
+    parser.add_argument("--formato", choices=list(exportacao.FORMATOS), default=None,
+                        help="Parcelas com colunas tipadas (centavos inteiros, fatores exatos); padrão: pela extensão de --parcelas")
+    args = parser.parse_args(argv)
+    formato = args.formato or exportacao.formato_pela_extensao(args.parcelas)
+
+    casos, janelas_casos, invalidos = [], [], []
+    for i, bruto in enumerate(ler_casos(args.casos), start=1):
+        # Um caso que não normaliza ou cujas janelas não se montam é ignorado, sem parar o lote
+        try:
+            caso = motor.normalizar_caso(bruto)
+            janelas_casos.append(motor.janelas_caso(caso))
+            casos.append(caso)
+        except Exception as e:
+            invalidos.append(f"linha {i}: {e}")
+    for msg in invalidos:
+        print(f"Caso ignorado ({msg})", file=sys.stderr)
+
+    armazem = None
+    if args.pacote:
+        import pacote_series
+        try:
+            armazem = pacote_series.abrir_pacote(args.pacote)
+        except (pacote_series.ErroPacote, OSError) as e:
+            print(f"Pacote de séries inválido: {e}", file=sys.stderr)
+            return 1
+        print(f"Usando o {armazem.descrever()}.")
+    series = pre_carregar_series(janelas_casos, armazem)
+    resultados = calcular_lote(casos, series, args.tabela_tjsp, args.processos, args.pacote, exatas=bool(formato))
+    calculados = []
+    if args.laudos:
+        resultados = _guardando(resultados, calculados)
+    total_casos, total_erros = escrever_resultados(resultados, args.parcelas, args.totais, formato)
+    print(f"{total_casos} casos calculados ({total_erros} com erro, {len(invalidos)} ignorados).")
+
+    falhas_laudos = []
+    if args.laudos:
+        import laudos_lote
+        falhas_laudos = laudos_lote.exportar_laudos(list(zip(casos, calculados)), args.laudos, args.processos,
+                                                    laudos_lote.progresso_terminal)
+        for caso_id, erro in falhas_laudos:
+            print(f"Laudo não gerado ({caso_id}): {erro}", file=sys.stderr)
+        print(f"{len(calculados) - len(falhas_laudos)} laudos gravados em {args.laudos}.")
+    return 1 if total_erros or invalidos or falhas_laudos else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,280 @@
+from datetime import date
+from decimal import Decimal
+
+import numpy as np
+
+import diagnostico
+from motor_calculo import JUROS_DIARIO, formatar_moeda, formatar_decimal_str, series_indenizacao
+from motor_vetorizado import ZERO, _vazio, _validos, fatores_indice, fatores_serie
+from series_bcb import indice_da_serie
+
+# --- CRONOGRAMA DIÁRIO / SEMANAL / MENSAL (ASTREINTES E MULTAS POR DIA) ---
+# O cronograma é gerado como colunas (ordinais int64 e valores Decimal), sem um dicionário por
+# período: dias suspensos saem de uma máscara diária, o limite de dias corta a máscara e o teto
+# (valor nominal máximo da multa) corta a soma acumulada. No cálculo, os períodos que têm o mesmo
+# fator (mesmo par de pontos da série ou mesmo mês da Tabela TJSP) formam um grupo: o fator é
+# calculado uma vez por grupo e, como correção e juros são lineares no valor, o grupo soma os
+# valores e os valores x dias de juros dos seus períodos. Resultado: uma linha por grupo, igual
+# (até a 20ª casa) à soma das linhas do laço Decimal período a período (tests/test_cronograma.py).
+
+PERIODICIDADES = {"Diária": "diaria", "Semanal": "semanal", "Mensal": "mensal"}
+_EPOCA = date(1970, 1, 1).toordinal()
+
+def _meses(ordinais):
+    # Índice do mês (ano * 12 + mês - 1) de cada ordinal, sem converter dia a dia
+    meses = (np.asarray(ordinais, dtype=np.int64) - _EPOCA).astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    return meses + 1970 * 12
+
+def _inicio_mes(meses):
+    return (meses - 1970 * 12).astype('datetime64[M]').astype('datetime64[D]').astype(np.int64) + _EPOCA
+
+def dias_ativos(inicio, fim, suspensoes=(), limite_dias=None):
+    # Máscara dos dias de inicio a fim (inclusive) em que a multa corre
+    ini, n = inicio.toordinal(), (fim - inicio).days + 1
+    ativo = np.ones(max(n, 0), dtype=bool)
+    for susp_ini, susp_fim in suspensoes:
+        if susp_fim < susp_ini:
+            raise ValueError(f"Suspensão com fim ({susp_fim:%d/%m/%Y}) antes do início ({susp_ini:%d/%m/%Y})")
+        a = max(susp_ini.toordinal() - ini, 0)
+        b = min(susp_fim.toordinal() - ini + 1, n)
+        if a < b: ativo[a:b] = False
+    if limite_dias is not None:
+        ativo &= np.cumsum(ativo) <= limite_dias
+    return ativo
+
+class Cronograma:
+    # Colunas dos períodos: vencimento (primeiro dia ativo), dias ativos, dias do período e valor base
+
+    def __init__(self, vencimento, dias, dias_periodo, valor_base, periodicidade, limitado_teto=False):
+        self.n = len(vencimento)
+        self.vencimento = vencimento
+        self.dias = dias
+        self.dias_periodo = dias_periodo
+        self.valor_base = valor_base
+        self.periodicidade = periodicidade
+        self.limitado_teto = limitado_teto
+
+    def valor_nominal(self):
+        return sum(self.valor_base, ZERO)
+
+    def info_prorata(self, k):
+        if self.limitado_teto and k == self.n - 1: return "Limitado ao teto"
+        if self.periodicidade == "diaria": return "Diária"
+        if self.dias[k] < self.dias_periodo[k]: return f"Pro-rata ({self.dias[k]}/{self.dias_periodo[k]} dias)"
+        return "Integral"
+
+    def datas_calc(self):
+        # Mesmo formato de motor_calculo.gerar_cronograma_pro_rata (laço de referência e conferência)
+        return [{"vencimento": date.fromordinal(int(self.vencimento[k])), "valor_base": self.valor_base[k],
+                 "info_prorata": self.info_prorata(k)} for k in range(self.n)]
+
+def gerar_cronograma(inicio, fim, valor_periodo, periodicidade="diaria", suspensoes=(), teto=None, limite_dias=None):
+    # valor_periodo: multa por dia/semana/mês cheio; teto: soma nominal máxima (antes da correção)
+    with diagnostico.etapa("cronograma"):
+        ativo = dias_ativos(inicio, fim, suspensoes, limite_dias)
+        ini = inicio.toordinal()
+        if periodicidade == "diaria":
+            vencimento = ini + np.flatnonzero(ativo)
+            dias = np.ones(len(vencimento), dtype=np.int64)
+            dias_periodo = dias
+        else:
+            if periodicidade == "semanal":
+                inicios = np.arange(0, len(ativo), 7, dtype=np.int64)
+                dias_periodo = np.full(len(inicios), 7, dtype=np.int64)
+            elif periodicidade == "mensal":
+                meses = np.arange(_meses([ini])[0], _meses([fim.toordinal()])[0] + 2, dtype=np.int64)
+                limites = _inicio_mes(meses)
+                inicios = np.maximum(limites[:-1], ini) - ini
+                dias_periodo = np.diff(limites)
+            else:
+                raise ValueError(f"Periodicidade desconhecida: {periodicidade}")
+            dias = np.add.reduceat(ativo.astype(np.int64), inicios) if len(ativo) else np.zeros(0, dtype=np.int64)
+            # Vencimento = primeiro dia ativo do período; períodos sem dia ativo saem
+            posicoes = np.flatnonzero(ativo)
+            primeiro = posicoes[np.minimum(np.searchsorted(posicoes, inicios), max(len(posicoes) - 1, 0))] if len(posicoes) else inicios
+            tem = dias > 0
+            vencimento, dias, dias_periodo = ini + primeiro[tem], dias[tem], dias_periodo[tem]
+
+        # Períodos cheios compartilham o mesmo Decimal; só os parciais fazem a divisão
+        valor_base = _vazio(len(vencimento), valor_periodo)
+        for k in np.flatnonzero(dias < dias_periodo):
+            valor_base[k] = valor_periodo * (Decimal(int(dias[k])) / Decimal(int(dias_periodo[k])))
+
+        limitado = False
+        if teto is not None and len(valor_base):
+            acumulado = np.cumsum(valor_base)
+            acima = np.flatnonzero(acumulado >= teto)
+            if len(acima):
+                corte = int(acima[0])
+                limitado = True
+                vencimento, dias, dias_periodo = vencimento[:corte + 1], dias[:corte + 1], dias_periodo[:corte + 1]
+                valor_base = valor_base[:corte + 1].copy()
+                valor_base[corte] = teto - (acumulado[corte - 1] if corte else ZERO)
+    diagnostico.contar("periodos_cronograma", len(vencimento))
+    return Cronograma(vencimento, dias, dias_periodo, valor_base, periodicidade, limitado)
+
+def janelas_cronograma(cron, regime_tipo, cod_ind_escolhido, data_corte_selic, data_calculo):
+    # Mesmas janelas de series_indenizacao (só dependem do primeiro vencimento)
+    if not cron.n: return {}
+    primeiro = [{"vencimento": date.fromordinal(int(cron.vencimento[0]))}]
+    return series_indenizacao(primeiro, regime_tipo, cod_ind_escolhido, data_corte_selic, data_calculo)
+
+# --- CÁLCULO POR GRUPO DE FATOR ---
+
+def chaves_fator(codigo_serie, df_serie, inicios, fins):
+    # Inteiro que identifica o fator [inicio, fim] de cada período: iguais => mesmo fator
+    if codigo_serie == -1:
+        return _meses(inicios) * 2**24 + _meses(fins)
+    if df_serie is None or df_serie.empty:
+        return np.zeros(len(inicios), dtype=np.int64)
+    datas, acumulados = indice_da_serie(df_serie).arrays()
+    i = np.searchsorted(datas, inicios, side='left')
+    j = np.searchsorted(datas, fins, side='right')
+    return i * (len(acumulados) + 1) + j
+
+def _grupos(*chaves):
+    # Início de cada grupo de períodos consecutivos com as mesmas chaves
+    n = len(chaves[0])
+    if n == 0: return np.zeros(0, dtype=np.int64)
+    muda = np.zeros(n, dtype=bool)
+    muda[0] = True
+    for chave in chaves:
+        muda[1:] |= chave[1:] != chave[:-1]
+    return np.flatnonzero(muda)
+
+def _somar(valores, inicios):
+    # Soma por grupo de uma coluna de Decimal (np.add.reduceat sobre objetos)
+    if len(inicios) == 0: return _vazio(0)
+    return np.add.reduceat(valores, inicios)
+
+class ResultadoCronograma:
+    # Uma linha por grupo de fator; valores somados sobre os períodos do grupo
+
+    def __init__(self, cron, inicios):
+        g = len(inicios)
+        self.n = g
+        fins = np.append(inicios[1:], cron.n) - 1 if g else inicios
+        self.primeiro = cron.vencimento[inicios]
+        self.ultimo = cron.vencimento[fins]
+        self.periodos = np.diff(np.append(inicios, cron.n)) if g else inicios
+        self.dias = np.add.reduceat(cron.dias, inicios) if g else inicios
+        self.nominal = _somar(cron.valor_base, inicios)
+        self.fator_cm = _vazio(g)
+        self.v_corrigido = _vazio(g)
+        self.juros = _vazio(g, ZERO)
+        self.subtotal_f1 = _vazio(g)
+        self.fator_selic = _vazio(g)
+        self.principal_atualizado = _vazio(g)
+        self.total = _vazio(g, ZERO)
+
+    def soma_total(self):
+        return sum(self.total, ZERO)
+
+    def soma_nominal(self):
+        return sum(self.nominal, ZERO)
+
+    def linhas(self):
+        for k in range(self.n):
+            ini, fim = date.fromordinal(int(self.primeiro[k])), date.fromordinal(int(self.ultimo[k]))
+            yield {
+                "Período": ini.strftime("%d/%m/%Y") if ini == fim else f"{ini:%d/%m/%Y} a {fim:%d/%m/%Y}",
+                "Dias": int(self.dias[k]),
+                "Valor Nominal": formatar_moeda(self.nominal[k]),
+                "Audit Fator CM": formatar_decimal_str(self.fator_cm[k]) if self.fator_cm[k] is not None else "-",
+                "V. Corrigido Puro": formatar_moeda(self.v_corrigido[k]) if self.v_corrigido[k] is not None else "-",
+                "Valor Juros": formatar_moeda(self.juros[k]),
+                "Subtotal F1": formatar_moeda(self.subtotal_f1[k]) if self.subtotal_f1[k] is not None else "-",
+                "Audit Fator SELIC": formatar_decimal_str(self.fator_selic[k]) if self.fator_selic[k] is not None else "-",
+                "Principal Atualizado": formatar_moeda(self.principal_atualizado[k]) if self.principal_atualizado[k] is not None else "-",
+                "TOTAL": formatar_moeda(self.total[k]),
+                "_num": self.total[k],
+            }
+
+def _juros_grupo(cron, inicios, dias_juros):
+    # Soma de valor x dias por grupo: os juros do grupo são fator x soma x JUROS_DIARIO
+    com = dias_juros > 0
+    pond = _vazio(cron.n, ZERO)
+    pond[com] = cron.valor_base[com] * dias_juros[com]
+    return _somar(pond, inicios)
+
+def calcular_cronograma(cron, regime_tipo, data_calculo, cod_ind_escolhido, df_indice_principal, df_selic_cache,
+                        calc_tjsp, data_citacao_ind=None, data_corte_selic=None, aplicar_juros_fase1=True):
+    # Mesmas regras de motor_calculo.calcular_indenizacao, aplicadas por grupo de fator
+    with diagnostico.etapa("calculo_linhas"):
+        res = _calcular_grupos(cron, regime_tipo, data_calculo, cod_ind_escolhido, df_indice_principal, df_selic_cache,
+                               calc_tjsp, data_citacao_ind, data_corte_selic, aplicar_juros_fase1)
+    diagnostico.contar("linhas_processadas", cron.n)
+    diagnostico.contar("grupos_fator", res.n)
+    return res
+
+def _calcular_grupos(cron, regime_tipo, data_calculo, cod_ind_escolhido, df_indice_principal, df_selic_cache,
+                     calc_tjsp, data_citacao_ind, data_corte_selic, aplicar_juros_fase1):
+    venc = cron.vencimento
+    calc_ord = data_calculo.toordinal()
+    calc = np.full(cron.n, calc_ord, dtype=np.int64)
+
+    # 1. ÍNDICE PADRÃO
+    if "1. Índice" in regime_tipo:
+        inicios = _grupos(chaves_fator(cod_ind_escolhido, df_indice_principal, venc, calc))
+        res = ResultadoCronograma(cron, inicios)
+        if not res.n: return res
+        fator = fatores_indice(cod_ind_escolhido, df_indice_principal, calc_tjsp, venc[inicios], calc[inicios])
+        ok = _validos(fator)
+        res.fator_cm[ok] = fator[ok]
+        res.v_corrigido[ok] = res.nominal[ok] * fator[ok]
+        pond = _juros_grupo(cron, inicios, calc - np.maximum(venc, data_citacao_ind.toordinal()))
+        res.juros[ok] = pond[ok] * fator[ok] * JUROS_DIARIO
+        res.total[ok] = res.v_corrigido[ok] + res.juros[ok]
+
+    # 2. SELIC PURA
+    elif "2. Taxa SELIC" in regime_tipo:
+        inicios = _grupos(chaves_fator(None, df_selic_cache, venc, calc))
+        res = ResultadoCronograma(cron, inicios)
+        if not res.n: return res
+        fator = fatores_serie(df_selic_cache, venc[inicios], calc[inicios])
+        ok = _validos(fator)
+        res.fator_selic[ok] = fator[ok]
+        res.total[ok] = res.nominal[ok] * fator[ok]
+
+    # 3. MISTO
+    elif "3. Misto" in regime_tipo:
+        corte = data_corte_selic.toordinal()
+        pos = venc >= corte
+        chave = np.where(pos, chaves_fator(None, df_selic_cache, venc, calc),
+                         chaves_fator(cod_ind_escolhido, df_indice_principal, venc, np.full(cron.n, corte, dtype=np.int64)))
+        inicios = _grupos(pos, chave)
+        res = ResultadoCronograma(cron, inicios)
+        if not res.n: return res
+        g_pos = pos[inicios]
+
+        # Pós Corte: SELIC Pura
+        fator = fatores_serie(df_selic_cache, venc[inicios][g_pos], calc[inicios][g_pos])
+        ok = np.zeros(res.n, dtype=bool)
+        ok[g_pos] = _validos(fator)
+        res.fator_selic[ok] = fator[ok[g_pos]]
+        res.total[ok] = res.nominal[ok] * res.fator_selic[ok]
+        res.principal_atualizado[ok] = res.total[ok]
+
+        # Fase 1
+        pre = ~g_pos
+        f_fase1 = fatores_indice(cod_ind_escolhido, df_indice_principal, calc_tjsp, venc[inicios][pre],
+                                 np.full(int(pre.sum()), corte, dtype=np.int64))
+        ok1 = np.zeros(res.n, dtype=bool)
+        ok1[pre] = _validos(f_fase1)
+        res.fator_cm[ok1] = f_fase1[ok1[pre]]
+        res.v_corrigido[ok1] = res.nominal[ok1] * res.fator_cm[ok1]
+        if aplicar_juros_fase1:
+            dias_f1 = np.where(pos, 0, corte - np.maximum(venc, data_citacao_ind.toordinal()))
+            pond = _juros_grupo(cron, inicios, dias_f1)
+            res.juros[ok1] = pond[ok1] * res.fator_cm[ok1] * JUROS_DIARIO
+        res.subtotal_f1[ok1] = res.v_corrigido[ok1] + res.juros[ok1]
+
+        if ok1.any():
+            f_selic_f2 = fatores_serie(df_selic_cache, np.array([corte]), calc[:1])[0]
+            if f_selic_f2:
+                res.fator_selic[ok1] = f_selic_f2
+                res.principal_atualizado[ok1] = res.v_corrigido[ok1] * f_selic_f2
+                res.total[ok1] = res.principal_atualizado[ok1] + res.juros[ok1]
+    else:
+        res = ResultadoCronograma(cron, _grupos(venc))
+    return res
@@ -0,0 +1,156 @@
+import contextvars
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+# --- INSTRUMENTAÇÃO DOS CÁLCULOS ---
+# Cada cálculo abre um Diagnostico (medir_calculo); as camadas inferiores registram tempo por
+# etapa e contadores via etapa()/contar() sem receber o objeto por parâmetro. Sem cálculo
+# ativo, etapa() e contar() não fazem nada.
+# Exportação: CALCJUS_METRICAS_JSONL (uma linha JSON por cálculo) e CALCJUS_METRICAS_PROM
+# (arquivo texto no formato Prometheus, reescrito a cada cálculo).
+
+CAMINHO_JSONL = os.environ.get("CALCJUS_METRICAS_JSONL")
+CAMINHO_PROM = os.environ.get("CALCJUS_METRICAS_PROM")
+CONTADORES = ("http_requisicoes", "http_retries", "bytes_baixados", "linhas_processadas", "cache_hits", "cache_misses",
+              "resultados_cache_hits", "resultados_cache_misses")
+
+logger = logging.getLogger("calcjus.metricas")
+_atual = contextvars.ContextVar("calcjus_diagnostico", default=None)
+
+class Diagnostico:
+    def __init__(self, calculo):
+        self.calculo = calculo
+        self.inicio = datetime.now()
+        self.segundos = 0.0
+        self.etapas = {}
+        self.contadores = dict.fromkeys(CONTADORES, 0)
+        self._trava = threading.Lock()
+
+    def registrar_etapa(self, nome, segundos):
+        with self._trava:
+            etapa = self.etapas.setdefault(nome, {"segundos": 0.0, "chamadas": 0})
+            etapa["segundos"] += segundos
+            etapa["chamadas"] += 1
+
+    def contar(self, nome, qtd=1):
+        with self._trava:
+            self.contadores[nome] = self.contadores.get(nome, 0) + qtd
+
+    def como_dict(self):
+        with self._trava:
+            return {
+                "calculo": self.calculo,
+                "inicio": self.inicio.isoformat(timespec="seconds"),
+                "segundos": round(self.segundos, 6),
+                "etapas": {k: {"segundos": round(v["segundos"], 6), "chamadas": v["chamadas"]} for k, v in self.etapas.items()},
+                "contadores": dict(self.contadores),
+            }
+
+# --- AGREGADOS DO PROCESSO (PROMETHEUS) ---
+_trava_global = threading.Lock()
+_agregado_calculos = {}
+_agregado_etapas = {}
+_agregado_contadores = dict.fromkeys(CONTADORES, 0)
+historico = deque(maxlen=50)
+
+def _acumular(diag):
+    dados = diag.como_dict()
+    with _trava_global:
+        calc = _agregado_calculos.setdefault(diag.calculo, {"segundos": 0.0, "total": 0})
+        calc["segundos"] += dados["segundos"]
+        calc["total"] += 1
+        for nome, etapa in dados["etapas"].items():
+            ag = _agregado_etapas.setdefault(nome, {"segundos": 0.0, "chamadas": 0})
+            ag["segundos"] += etapa["segundos"]
+            ag["chamadas"] += etapa["chamadas"]
+        for nome, qtd in dados["contadores"].items():
+            _agregado_contadores[nome] = _agregado_contadores.get(nome, 0) + qtd
+        historico.append(dados)
+    return dados
+
+def texto_prometheus():
+    with _trava_global:
+        linhas = [
+            "# HELP calcjus_calculo_segundos_total Tempo acumulado por tipo de cálculo.",
+            "# TYPE calcjus_calculo_segundos_total counter",
+        ]
+        linhas += [f'calcjus_calculo_segundos_total{{calculo="{k}"}} {v["segundos"]:.6f}' for k, v in sorted(_agregado_calculos.items())]
+        linhas += ["# TYPE calcjus_calculos_total counter"]
+        linhas += [f'calcjus_calculos_total{{calculo="{k}"}} {v["total"]}' for k, v in sorted(_agregado_calculos.items())]
+        linhas += ["# HELP calcjus_etapa_segundos_total Tempo acumulado por etapa instrumentada.",
+                   "# TYPE calcjus_etapa_segundos_total counter"]
+        linhas += [f'calcjus_etapa_segundos_total{{etapa="{k}"}} {v["segundos"]:.6f}' for k, v in sorted(_agregado_etapas.items())]
+        linhas += ["# TYPE calcjus_etapa_chamadas_total counter"]
+        linhas += [f'calcjus_etapa_chamadas_total{{etapa="{k}"}} {v["chamadas"]}' for k, v in sorted(_agregado_etapas.items())]
+        for nome, qtd in sorted(_agregado_contadores.items()):
+            linhas += [f"# TYPE calcjus_{nome}_total counter", f"calcjus_{nome}_total {qtd}"]
+    return "\n".join(linhas) + "\n"
+
+def exportar_prometheus(caminho):
+    # Escrita atômica, compatível com o textfile collector do node_exporter
+    diretorio = os.path.dirname(os.path.abspath(caminho))
+    with tempfile.NamedTemporaryFile("w", dir=diretorio, delete=False, encoding="utf-8", suffix=".tmp") as f:
+        f.write(texto_prometheus())
+    os.replace(f.name, caminho)
+
+def _exportar(dados):
+    linha = json.dumps(dados, ensure_ascii=False)
+    logger.info(linha)
+    try:
+        if CAMINHO_JSONL:
+            with open(CAMINHO_JSONL, "a", encoding="utf-8") as f:
+                f.write(linha + "\n")
+        if CAMINHO_PROM:
+            exportar_prometheus(CAMINHO_PROM)
+    except OSError as e:
+        logger.warning(f"Falha ao exportar métricas: {e}")
+
+# --- API DE INSTRUMENTAÇÃO ---
+
+@contextmanager
+def medir_calculo(calculo):
+    diag = Diagnostico(calculo)
+    token = _atual.set(diag)
+    inicio = time.perf_counter()
+    try:
+        yield diag
+    finally:
+        diag.segundos = time.perf_counter() - inicio
+        _atual.reset(token)
+        _exportar(_acumular(diag))
+
+@contextmanager
+def etapa(nome):
+    diag = _atual.get()
+    if diag is None:
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        diag.registrar_etapa(nome, time.perf_counter() - inicio)
+
+def contar(nome, qtd=1):
+    diag = _atual.get()
+    if diag is not None:
+        diag.contar(nome, qtd)
+
+def no_contexto(funcao):
+    # Propaga o diagnóstico ativo para threads de pools (concurrent.futures não copia o contexto)
+    diag = _atual.get()
+
+    def executar(*args, **kwargs):
+        token = _atual.set(diag)
+        try:
+            return funcao(*args, **kwargs)
+        finally:
+            _atual.reset(token)
+    return executar
@@ -0,0 +1,222 @@
+import csv
+import io
+import tempfile
+import zipfile
+from datetime import date
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP, localcontext
+from xml.sax.saxutils import escape
+
+# --- EXPORTAÇÃO TIPADA (CSV / XLSX / PARQUET) ---
+# Um esquema é uma lista de (coluna, tipo) e os dados chegam em blocos: listas de colunas na
+# ordem do esquema, com None para vazio. Cada bloco é gravado e descartado antes do próximo,
+# então a memória não cresce com o número de linhas (Indenização/Pensão vêm de
+# resultado_compacto, o lote de calculo_lote e aluguel_lote).
+# Tipos: "data" (date), "texto", "inteiro", "centavos" (int, valor x 100), "decimal" (fator exato,
+# Decimal) e "valor" (valor em reais sem arredondamento, Decimal). No XLSX os centavos são números
+# inteiros e os Decimals vão como texto: o Excel guarda números em float e perderia casas.
+# Parquet depende do pyarrow (opcional, importado só ao exportar).
+
+FORMATOS = {
+    "csv": ("CSV", "csv", "text/csv"),
+    "xlsx": ("Excel (XLSX)", "xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "parquet": ("Parquet", "parquet", "application/vnd.apache.parquet"),
+}
+# Casas no Parquet (decimal128 tem 38 dígitos): fatores com 18 casas e até 20 dígitos inteiros;
+# valores com 10 casas e 28 dígitos inteiros, o bastante para qualquer número do contexto de 28 dígitos
+ESCALA_FATOR = 18
+ESCALA_VALOR = 10
+LINHAS_POR_PLANILHA = 1_048_575  # limite do Excel, sem o cabeçalho
+
+def formatos_disponiveis():
+    import importlib.util
+    return [f for f in FORMATOS if f != "parquet" or importlib.util.find_spec("pyarrow") is not None]
+
+def formato_pela_extensao(caminho):
+    # .xlsx/.parquet -> exportação tipada; None para .csv (as CLIs mantêm o CSV formatado de antes)
+    extensao = caminho.lower().rsplit(".", 1)[-1]
+    return extensao if extensao in ("xlsx", "parquet") else None
+
+# --- CSV ---
+
+def _texto_csv(valor):
+    if valor is None: return ""
+    if isinstance(valor, Decimal): return format(valor, "f")
+    if isinstance(valor, date): return valor.isoformat()
+    return valor
+
+def escrever_csv(destino, esquema, blocos):
+    # destino: arquivo binário; UTF-8, datas ISO e ponto decimal
+    texto = io.TextIOWrapper(destino, encoding="utf-8", newline="", write_through=True)
+    try:
+        escritor = csv.writer(texto)
+        escritor.writerow([nome for nome, _ in esquema])
+        linhas = 0
+        for bloco in blocos:
+            convertidas = [[_texto_csv(v) for v in coluna] for coluna in bloco]
+            escritor.writerows(zip(*convertidas))
+            linhas += len(bloco[0]) if bloco else 0
+    finally:
+        texto.detach()
+    return linhas
+
+# --- XLSX (SpreadsheetML gravado em fluxo dentro do ZIP, sem dependências) ---
+
+_NS = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+_NS_R = 'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"'
+_EPOCA_EXCEL = date(1899, 12, 30).toordinal()
+
+def _celula_texto(valor):
+    return f'<c t="inlineStr"><is><t>{escape(valor)}</t></is></c>'
+
+def _celulas_xlsx(tipo, coluna):
+    if tipo == "data":
+        return ["<c/>" if v is None else f'<c s="1"><v>{v.toordinal() - _EPOCA_EXCEL}</v></c>' for v in coluna]
+    if tipo in ("centavos", "inteiro"):
+        return ["<c/>" if v is None else f"<c><v>{v}</v></c>" for v in coluna]
+    if tipo in ("decimal", "valor"):
+        return ["<c/>" if v is None else _celula_texto(format(v, "f")) for v in coluna]
+    return ["<c/>" if v is None else _celula_texto(str(v)) for v in coluna]
+
+def _linhas_xlsx(esquema, blocos):
+    for bloco in blocos:
+        colunas = [_celulas_xlsx(tipo, coluna) for (_, tipo), coluna in zip(esquema, bloco)]
+        yield from ("".join(celulas) for celulas in zip(*colunas))
+
+def _membro_xlsx(nome):
+    # Data fixa nos membros do ZIP: o mesmo conteúdo gera sempre os mesmos bytes
+    membro = zipfile.ZipInfo(nome, date_time=(1980, 1, 1, 0, 0, 0))
+    membro.compress_type = zipfile.ZIP_DEFLATED
+    membro.external_attr = 0o600 << 16
+    return membro
+
+def escrever_xlsx(destino, esquema, blocos):
+    # Uma planilha a cada LINHAS_POR_PLANILHA linhas; o cabeçalho se repete em cada uma
+    cabecalho = '<row r="1">' + "".join(_celula_texto(nome) for nome, _ in esquema) + "</row>"
+    linhas = _linhas_xlsx(esquema, blocos)
+    total, planilhas = 0, 0
+    with zipfile.ZipFile(destino, "w", zipfile.ZIP_DEFLATED) as pacote:
+        proxima = next(linhas, None)
+        while planilhas == 0 or proxima is not None:
+            planilhas += 1
+            with pacote.open(_membro_xlsx(f"xl/worksheets/sheet{planilhas}.xml"), "w", force_zip64=True) as folha:
+                folha.write(f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<worksheet {_NS}><sheetData>'.encode())
+                folha.write(cabecalho.encode())
+                numero = 1
+                while proxima is not None and numero <= LINHAS_POR_PLANILHA:
+                    numero += 1
+                    folha.write(f'<row r="{numero}">{proxima}</row>'.encode("utf-8"))
+                    proxima = next(linhas, None)
+                folha.write(b"</sheetData></worksheet>")
+                total += numero - 1
+        _escrever_estrutura_xlsx(pacote, planilhas)
+    return total
+
+def _escrever_estrutura_xlsx(pacote, planilhas):
+    folhas = range(1, planilhas + 1)
+    pacote.writestr(_membro_xlsx("[Content_Types].xml"),
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        + "".join(f'<Override PartName="/xl/worksheets/sheet{k}.xml" '
+                  'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>' for k in folhas)
+        + "</Types>")
+    pacote.writestr(_membro_xlsx("_rels/.rels"),
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        "</Relationships>")
+    pacote.writestr(_membro_xlsx("xl/workbook.xml"),
+        f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<workbook {_NS} {_NS_R}><sheets>'
+        + "".join(f'<sheet name="Dados{"" if k == 1 else f" {k}"}" sheetId="{k}" r:id="rId{k}"/>' for k in folhas)
+        + "</sheets></workbook>")
+    pacote.writestr(_membro_xlsx("xl/_rels/workbook.xml.rels"),
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        + "".join(f'<Relationship Id="rId{k}" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+                  f'Target="worksheets/sheet{k}.xml"/>' for k in folhas)
+        + f'<Relationship Id="rId{planilhas + 1}" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+          'Target="styles.xml"/></Relationships>')
+    # Estilo 1: data (formato 14, dd/mm/aaaa no Excel em português)
+    pacote.writestr(_membro_xlsx("xl/styles.xml"),
+        f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<styleSheet {_NS}>'
+        '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+        "</styleSheet>")
+
+# --- PARQUET ---
+
+_ESCALAS_PARQUET = {"decimal": ESCALA_FATOR, "valor": ESCALA_VALOR}
+
+def _tipos_arrow(pa):
+    return {"data": pa.date32(), "texto": pa.string(), "inteiro": pa.int64(), "centavos": pa.int64(),
+            **{tipo: pa.decimal128(38, escala) for tipo, escala in _ESCALAS_PARQUET.items()}}
+
+def _decimais_parquet(nome, tipo, coluna):
+    # Arredonda à escala do tipo; valor que não cabe nos 38 dígitos é erro da coluna, não do pyarrow
+    escala = _ESCALAS_PARQUET[tipo]
+    quantum = Decimal(1).scaleb(-escala)
+    limite = Decimal(1).scaleb(38 - escala)
+    ajustados = []
+    with localcontext() as ctx:
+        ctx.prec = 80
+        for v in coluna:
+            if v is None:
+                ajustados.append(None)
+                continue
+            try:
+                ajustado = v.quantize(quantum, rounding=ROUND_HALF_UP)
+            except InvalidOperation:
+                ajustado = None
+            if ajustado is None or not abs(ajustado) < limite:
+                raise ValueError(f"coluna {nome}: {v} não cabe em decimal128(38, {escala})")
+            ajustados.append(ajustado)
+    return ajustados
+
+def escrever_parquet(destino, esquema, blocos):
+    # Um row group por bloco
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    tipos = _tipos_arrow(pa)
+    schema = pa.schema([(nome, tipos[tipo]) for nome, tipo in esquema])
+    linhas = 0
+    with pq.ParquetWriter(destino, schema) as escritor:
+        for bloco in blocos:
+            arrays = [pa.array(_decimais_parquet(nome, tipo, coluna) if tipo in _ESCALAS_PARQUET else coluna, type=tipos[tipo])
+                      for (nome, tipo), coluna in zip(esquema, bloco)]
+            escritor.write_batch(pa.record_batch(arrays, schema=schema))
+            linhas += len(bloco[0]) if bloco else 0
+    return linhas
+
+# --- ENTRADA ÚNICA ---
+
+_ESCRITORES = {"csv": escrever_csv, "xlsx": escrever_xlsx, "parquet": escrever_parquet}
+
+def exportar(formato, esquema, blocos, destino):
+    # destino: caminho ou arquivo binário; devolve o número de linhas gravadas
+    if formato not in _ESCRITORES:
+        raise ValueError(f"formato de exportação desconhecido: {formato}")
+    if isinstance(destino, str):
+        with open(destino, "wb") as f:
+            return _ESCRITORES[formato](f, esquema, blocos)
+    return _ESCRITORES[formato](destino, esquema, blocos)
+
+def exportar_arquivo(formato, esquema, blocos):
+    # Para o st.download_button: grava bloco a bloco num temporário em disco (apagado ao fechar)
+    # e o devolve aberto para leitura, do início; o arquivo não é montado em memória
+    temporario = tempfile.TemporaryFile()
+    try:
+        exportar(formato, esquema, blocos, temporario)
+        bruto = temporario.detach()
+    except BaseException:
+        temporario.close()
+        raise
+    bruto.seek(0)
+    return io.BufferedReader(bruto)
@@ -0,0 +1,237 @@
+import bisect
+import csv
+import io
+from collections import deque
+from decimal import Decimal, InvalidOperation
+
+import diagnostico
+import motor_calculo as motor
+from resultado_compacto import centavos_int
+from series_bcb import indice_da_serie
+
+# --- IMPUTAÇÃO DE PAGAMENTOS (PENSÃO) ---
+# Pagamentos de um extrato (parciais, atrasados ou de uma vez) são imputados nas parcelas
+# vencidas mais antigas primeiro e, em cada parcela, nos juros antes do principal (arts. 354 e
+# 355 do CC). Na data de cada pagamento a parcela é atualizada pelo índice acumulado comum (o
+# mesmo de fator_indice, sem o ponto do próprio dia: pagar o devido no vencimento quita a
+# parcela) e os juros de 1% a.m. correm sobre o valor corrigido; juros não pagos
+# ficam pendentes, só corrigidos (sem juros sobre juros). Sobra de pagamento vira crédito usado
+# nas parcelas seguintes, no vencimento de cada uma.
+# Parcelas e pagamentos vão em ordem de data; as parcelas vencidas e ainda abertas ficam numa
+# fila e cada pagamento só toca a da frente até quitá-la, então cada parcela sai da fila uma
+# vez e o custo total é O((parcelas + pagamentos) log n), com n pontos da série (busca binária
+# no índice acumulado). Cada parcela guarda (valor na data-base, acumulado na data-base), e a
+# atualização até qualquer data é uma divisão. Os trechos [vencimento, 1º pagamento), ...,
+# [último pagamento, data do cálculo] cobrem cada ponto da série uma vez: sem pagamentos, o
+# resultado é o mesmo de motor_calculo.valores_pensao.
+
+BLOCO_PROGRESSO = 500
+COLUNAS_DATA = ("data", "data_pagamento", "data pagamento", "pagamento")
+COLUNAS_VALOR = ("valor", "valor_pago", "valor pago", "pago")
+
+class IndiceCorrecao:
+    # ate(t): acumulado com os pontos até t (inclusive); antes(t): só os pontos anteriores a t.
+    # fator_indice(v, t) == ate(t) / antes(v). TJSP: número-índice do mês nos dois casos.
+
+    def __init__(self, cod, df_serie, calc_tjsp):
+        self.tjsp = calc_tjsp if cod == -1 else None
+        self.indice = indice_da_serie(df_serie) if cod != -1 and df_serie is not None and not df_serie.empty else None
+
+    def ate(self, dia):
+        if self.tjsp is not None: return self.tjsp.obter_fator(dia)
+        if self.indice is None: return None
+        return self.indice.acumulados[bisect.bisect_right(self.indice.datas, dia)]
+
+    def antes(self, dia):
+        if self.tjsp is not None: return self.tjsp.obter_fator(dia)
+        if self.indice is None: return None
+        return self.indice.acumulados[bisect.bisect_left(self.indice.datas, dia)]
+
+class _Parcela:
+    __slots__ = ("venc", "devido", "principal", "juros", "acumulado", "data_base", "pago", "tocada")
+
+    def __init__(self, venc, devido):
+        self.venc, self.devido = venc, devido
+        self.principal, self.juros = devido, Decimal('0.00')
+        self.acumulado, self.data_base = None, venc
+        self.pago, self.tocada = Decimal('0.00'), False
+
+    def quitada(self):
+        return self.principal <= 0 and self.juros <= 0
+
+    def atualizar(self, indice, dia, acumulado):
+        # (principal, juros, acumulado) em `dia`, com o acumulado do índice nessa data;
+        # sem índice na data, o trecho fica sem correção
+        if self.acumulado is None: self.acumulado = indice.antes(self.venc)
+        acumulado = acumulado or self.acumulado
+        fator = acumulado / self.acumulado if self.acumulado else Decimal('1')
+        principal = self.principal * fator
+        juros = self.juros * fator + motor.juros_mora(principal, (dia - self.data_base).days)
+        return principal, juros, acumulado
+
+    def pagar(self, indice, dia, valor):
+        # Juros primeiro, depois o principal; devolve (juros pagos, principal pago)
+        principal, juros, acumulado = self.atualizar(indice, dia, indice.antes(dia))
+        pago_juros = min(valor, juros)
+        pago_principal = min(valor - pago_juros, principal)
+        self.principal, self.juros = principal - pago_principal, juros - pago_juros
+        self.acumulado, self.data_base = acumulado, dia
+        self.pago += pago_juros + pago_principal
+        self.tocada = True
+        return pago_juros, pago_principal
+
+class ResultadoImputacao:
+    ESQUEMA_PAGAMENTOS = [("data", "data"), ("valor_centavos", "centavos"), ("juros_centavos", "centavos"),
+                          ("principal_centavos", "centavos"), ("primeira_parcela", "data"), ("ultima_parcela", "data"),
+                          ("credito_centavos", "centavos"), ("situacao", "texto")]
+
+    def __init__(self, linhas, total, pagamentos):
+        self.linhas = linhas
+        self.total = total
+        # pagamentos: dicionários com data, valor, juros, principal, primeira, ultima, credito, situacao
+        self.pagamentos = pagamentos
+
+    def soma_imputada(self):
+        return sum((p["juros"] + p["principal"] for p in self.pagamentos), Decimal('0.00'))
+
+    def linhas_pagamentos(self):
+        for p in self.pagamentos:
+            parcelas = "-"
+            if p["primeira"] is not None:
+                parcelas = p["primeira"].strftime("%d/%m/%Y")
+                if p["ultima"] != p["primeira"]: parcelas += f" a {p['ultima'].strftime('%d/%m/%Y')}"
+            yield {"Data": p["data"].strftime("%d/%m/%Y"), "Valor": motor.formatar_moeda(p["valor"]),
+                   "Juros Imputados": motor.formatar_moeda(p["juros"]), "Principal Imputado": motor.formatar_moeda(p["principal"]),
+                   "Parcelas": parcelas, "Crédito Restante": motor.formatar_moeda(p["credito"]), "Situação": p["situacao"]}
+
+    def blocos_pagamentos(self):
+        # Um único bloco (o extrato cabe em memória); colunas de ESQUEMA_PAGAMENTOS para exportacao
+        if not self.pagamentos: return
+        yield [[p["data"] for p in self.pagamentos], [centavos_int(p["valor"]) for p in self.pagamentos],
+               [centavos_int(p["juros"]) for p in self.pagamentos], [centavos_int(p["principal"]) for p in self.pagamentos],
+               [p["primeira"] for p in self.pagamentos], [p["ultima"] for p in self.pagamentos],
+               [centavos_int(p["credito"]) for p in self.pagamentos], [p["situacao"] for p in self.pagamentos]]
+
+def _registro_pagamento(dia, valor, situacao=""):
+    return {"data": dia, "valor": valor, "juros": Decimal('0.00'), "principal": Decimal('0.00'),
+            "primeira": None, "ultima": None, "credito": Decimal('0.00'), "situacao": situacao}
+
+def _imputar(registro, parcela, indice, dia, valor):
+    pago_juros, pago_principal = parcela.pagar(indice, dia, valor)
+    registro["juros"] += pago_juros
+    registro["principal"] += pago_principal
+    if registro["primeira"] is None: registro["primeira"] = parcela.venc
+    registro["ultima"] = parcela.venc
+    return valor - pago_juros - pago_principal
+
+def imputar_pagamentos(dividas, pagamentos, cod, df_serie, calc_tjsp, data_calculo, montar_linha=motor.formatar_linha_pensao,
+                       progresso=None):
+    # dividas: [(vencimento, devido)]; pagamentos: [(data, valor)] em qualquer ordem.
+    # Linhas na ordem das dívidas (montar_linha(venc, devido, pago, valores), como em PensaoIncremental);
+    # parcela sem fator até a data do cálculo fica de fora, como em calcular_pensao.
+    indice = IndiceCorrecao(cod, df_serie, calc_tjsp)
+    parcelas = [_Parcela(venc, devido) for venc, devido in dividas]
+    por_vencimento = sorted(parcelas, key=lambda p: p.venc)
+    abertas = deque()
+    creditos = deque()  # [registro do pagamento, saldo], na ordem dos pagamentos
+    proxima = 0
+    registros = []
+
+    def vencer_ate(dia):
+        # Parcelas vencidas até `dia` entram na fila; crédito anterior é imputado no vencimento
+        nonlocal proxima
+        while proxima < len(por_vencimento) and por_vencimento[proxima].venc <= dia:
+            parcela = por_vencimento[proxima]
+            proxima += 1
+            while creditos and not parcela.quitada():
+                credito = creditos[0]
+                credito[1] = _imputar(credito[0], parcela, indice, parcela.venc, credito[1])
+                credito[0]["credito"] = credito[1]
+                if credito[1] <= 0: creditos.popleft()
+            if not parcela.quitada(): abertas.append(parcela)
+
+    ordem = sorted(range(len(pagamentos)), key=lambda k: pagamentos[k][0])
+    for feitos, k in enumerate(ordem):
+        dia, valor = pagamentos[k]
+        if progresso and feitos % BLOCO_PROGRESSO == 0:
+            progresso(feitos, len(ordem))
+        if dia > data_calculo:
+            registros.append(_registro_pagamento(dia, valor, "após a data do cálculo"))
+            continue
+        registro = _registro_pagamento(dia, valor)
+        registros.append(registro)
+        vencer_ate(dia)
+        while valor > 0 and abertas:
+            valor = _imputar(registro, abertas[0], indice, dia, valor)
+            if abertas[0].quitada(): abertas.popleft()
+        if valor > 0:
+            registro["credito"] = valor
+            creditos.append([registro, valor])
+    vencer_ate(data_calculo)
+    for credito in creditos:
+        credito[0]["situacao"] = "crédito sem parcela a imputar"
+    if progresso: progresso(len(ordem), len(ordem))
+
+    linhas, total = [], Decimal('0.00')
+    for parcela in parcelas:
+        valores = _valores_finais(parcela, indice, cod, df_serie, calc_tjsp, data_calculo)
+        if valores is None: continue
+        linhas.append(montar_linha(parcela.venc, parcela.devido, parcela.pago, valores))
+        total += valores[4]
+    diagnostico.contar("linhas_processadas", len(parcelas) + len(pagamentos))
+    return ResultadoImputacao(linhas, total, sorted(registros, key=lambda r: r["data"]))
+
+def imputar_parcelas(parcelas, extrato, *args, **kwargs):
+    # parcelas no formato da pensão [(vencimento, devido, pago)]: o "pago" de cada parcela entra
+    # como mais um pagamento, feito no vencimento, e segue a mesma imputação do extrato
+    pagamentos = list(extrato) + [(venc, pago) for venc, _, pago in parcelas if pago > 0]
+    return imputar_pagamentos([(venc, devido) for venc, devido, _ in parcelas], pagamentos, *args, **kwargs)
+
+def _valores_finais(parcela, indice, cod, df_serie, calc_tjsp, data_calculo):
+    # (saldo, fator, atualizado, juros, total) de motor.valores_pensao; saldo = principal na última data-base
+    if not parcela.tocada:
+        return motor.valores_pensao(parcela.venc, parcela.devido, Decimal('0.00'), cod, df_serie, calc_tjsp, data_calculo)
+    if motor.fator_indice(cod, df_serie, calc_tjsp, parcela.venc, data_calculo) is None: return None
+    if parcela.quitada():
+        return (parcela.devido - parcela.pago, None, None, None, Decimal('0.00'))
+    base = parcela.principal
+    principal, juros, acumulado = parcela.atualizar(indice, data_calculo, indice.ate(data_calculo))
+    return (base, acumulado / parcela.acumulado, principal, juros, principal + juros)
+
+# --- EXTRATO DE PAGAMENTOS (CSV) ---
+
+def ler_valor(texto):
+    # "1.234,56", "R$ 1.234,56" ou "1234.56"; erro em vez de zero para texto inválido
+    numero = str(texto or "").replace("R$", "").strip()
+    if "," in numero: numero = numero.replace(".", "").replace(",", ".")
+    try:
+        valor = Decimal(numero)
+    except InvalidOperation:
+        raise ValueError(f"valor inválido: {texto!r}")
+    if not valor.is_finite() or valor <= 0: raise ValueError(f"valor deve ser positivo: {texto!r}")
+    return valor
+
+def ler_extrato(texto):
+    # CSV com colunas data e valor (separador , ou ;) -> ([(data, valor)], [erros])
+    try:
+        dialeto = csv.Sniffer().sniff(texto[:4096], delimiters=";,\t")
+    except csv.Error:
+        dialeto = csv.excel
+    leitor = csv.DictReader(io.StringIO(texto), dialect=dialeto)
+    campos = {(nome or "").strip().lower(): nome for nome in leitor.fieldnames or []}
+    col_data = next((campos[c] for c in COLUNAS_DATA if c in campos), None)
+    col_valor = next((campos[c] for c in COLUNAS_VALOR if c in campos), None)
+    if col_data is None or col_valor is None:
+        return [], ["o extrato precisa das colunas data e valor"]
+    pagamentos, invalidos = [], []
+    for i, bruto in enumerate(leitor, start=2):
+        try:
+            try:
+                dia = motor.ler_data(bruto.get(col_data))
+            except ValueError:
+                raise ValueError(f"data inválida: {bruto.get(col_data)!r}")
+            if dia is None: raise ValueError("data vazia")
+            pagamentos.append((dia, ler_valor(bruto.get(col_valor))))
+        except Exception as e:
+            invalidos.append(f"linha {i}: {e}")
+    return pagamentos, invalidos
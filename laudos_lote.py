@@ -0,0 +1,126 @@
+import csv
+import io
+import os
+import re
+import sys
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+import pandas as pd
+
+import motor_calculo as motor
+from calculo_lote import centavos
+from relatorio_pdf import gerar_pdf_relatorio
+
+# --- LAUDOS EM LOTE (PDF + RESUMO CSV) ---
+# Uso: python calculo_lote.py casos.csv --laudos laudos.zip   (ou um diretório)
+# Cada caso calculado vira um PDF gerado num pool de processos; o resumo.csv traz os
+# totais e o erro (se houver) de cada caso.
+
+COLUNAS_RESUMO = ["id", "tipo", "total", "multa_523", "honorarios_523", "total_geral", "arquivo", "erro"]
+NOMES_INDICES = {cod: nome for nome, cod in motor.mapa_indices_completo.items()}
+
+def nome_laudo(caso_id, tipo, usados):
+    base = re.sub(r"[^\w.-]+", "_", f"Laudo_{caso_id}_{tipo}").strip("_") or "Laudo"
+    nome, n = f"{base}.pdf", 1
+    while nome in usados:
+        n += 1
+        nome = f"{base}-{n}.pdf"
+    usados.add(nome)
+    return nome
+
+def argumentos_relatorio(caso, resultado):
+    # Monta os argumentos de gerar_pdf_relatorio a partir de um caso e do seu resultado
+    vazio = pd.DataFrame()
+    tabelas = {"indenizacao": vazio, "honorarios": vazio, "pensao": vazio}
+    if resultado["tipo"] in tabelas:
+        tabelas[resultado["tipo"]] = pd.DataFrame(resultado["linhas"])
+    art523 = resultado.get("art523") or {}
+    total = resultado["total"] if resultado["tipo"] != "aluguel" else Decimal('0.00')
+    totais = {
+        "indenizacao": total if resultado["tipo"] == "indenizacao" else Decimal('0.00'),
+        "honorarios": total if resultado["tipo"] == "honorarios" else Decimal('0.00'),
+        "pensao": total if resultado["tipo"] == "pensao" else Decimal('0.00'),
+        "multa": art523.get("multa", Decimal('0.00')),
+        "hon_exec": art523.get("hon_exec", Decimal('0.00')),
+        "final": art523.get("final", total),
+    }
+    regime = caso.get("regime", "")
+    config = {
+        "data_calculo": caso["data_calculo"], "tipo_regime": regime, "regime_desc": regime,
+        "indice_nome": NOMES_INDICES.get(caso["codigo_indice"], "SELIC"),
+        "data_corte": caso.get("data_corte_selic"), "data_citacao": caso.get("data_citacao"),
+        "juros_fase1": caso.get("juros_fase1", True), "multa_523": caso["multa_523"], "hon_523": caso["hon_523"],
+    }
+    if resultado.get("pacote_series"):
+        config["fontes_dados"] = [("Séries e Tabela TJSP", f"pacote offline {resultado['pacote_series']}")]
+    return tabelas["indenizacao"], tabelas["honorarios"], tabelas["pensao"], resultado.get("dados_aluguel"), totais, config
+
+def _gerar_laudo(tarefa):
+    # Worker: devolve (bytes do PDF ou None, erro); com diretório o PDF é gravado aqui mesmo
+    caso, resultado, caminho = tarefa
+    try:
+        if resultado.get("erro"): return None, resultado["erro"]
+        argumentos = argumentos_relatorio(caso, resultado)
+        if caminho:
+            gerar_pdf_relatorio(*argumentos, destino=caminho)
+            return None, ""
+        return gerar_pdf_relatorio(*argumentos), ""
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+def _linha_resumo(resultado, arquivo, erro):
+    art523 = resultado.get("art523") or {}
+    return {
+        "id": resultado["id"], "tipo": resultado["tipo"], "total": centavos(resultado["total"]),
+        "multa_523": centavos(art523.get("multa", Decimal('0.00'))),
+        "honorarios_523": centavos(art523.get("hon_exec", Decimal('0.00'))),
+        "total_geral": centavos(art523.get("final", resultado["total"])),
+        "arquivo": "" if erro else arquivo, "erro": erro,
+    }
+
+def exportar_laudos(pares, destino, processos=None, progresso=None):
+    # pares: [(caso normalizado, resultado de calcular_caso)]; destino terminado em .zip gera um
+    # ZIP, senão um diretório. progresso(feitos, total) é chamado a cada laudo concluído.
+    # Retorna a lista [(id, erro)] dos casos que falharam.
+    em_zip = destino.lower().endswith(".zip")
+    if not em_zip: os.makedirs(destino, exist_ok=True)
+    usados = set()
+    nomes = [nome_laudo(caso["id"], caso["tipo"], usados) for caso, _ in pares]
+    tarefas = [(caso, res, None if em_zip else os.path.join(destino, nome)) for (caso, res), nome in zip(pares, nomes)]
+
+    processos = processos or os.cpu_count() or 1
+    resumo = io.StringIO()
+    escritor = csv.DictWriter(resumo, fieldnames=COLUNAS_RESUMO)
+    escritor.writeheader()
+    falhas = []
+    arquivo_zip = zipfile.ZipFile(destino, "w", zipfile.ZIP_DEFLATED) if em_zip else None
+    try:
+        if processos == 1 or len(tarefas) < 2:
+            gerados = map(_gerar_laudo, tarefas)
+            pool = None
+        else:
+            pool = ProcessPoolExecutor(max_workers=processos)
+            gerados = pool.map(_gerar_laudo, tarefas, chunksize=max(1, len(tarefas) // (processos * 4)))
+        try:
+            for feitos, ((caso, resultado), nome, (conteudo, erro)) in enumerate(zip(pares, nomes, gerados), start=1):
+                if erro:
+                    falhas.append((resultado["id"], erro))
+                elif arquivo_zip is not None:
+                    arquivo_zip.writestr(nome, conteudo)
+                escritor.writerow(_linha_resumo(resultado, nome, erro))
+                if progresso: progresso(feitos, len(tarefas))
+        finally:
+            if pool is not None: pool.shutdown()
+        if arquivo_zip is not None:
+            arquivo_zip.writestr("resumo.csv", resumo.getvalue())
+        else:
+            with open(os.path.join(destino, "resumo.csv"), mode="w", encoding="utf-8", newline="") as f:
+                f.write(resumo.getvalue())
+    finally:
+        if arquivo_zip is not None: arquivo_zip.close()
+    return falhas
+
+def progresso_terminal(feitos, total):
+    print(f"\rLaudos: {feitos}/{total}", end="\n" if feitos == total else "", file=sys.stderr, flush=True)
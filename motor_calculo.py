@@ -0,0 +1,624 @@
+import calendar
+import csv
+import hashlib
+import io
+import threading
+from collections import Counter
+from datetime import date, timedelta
+from decimal import Decimal, ROUND_HALF_UP, getcontext, localcontext
+
+from dateutil.relativedelta import relativedelta
+
+import diagnostico
+from series_bcb import calcular_fator_memoria, indice_da_serie
+
+# --- 1. CONFIGURAÇÃO FINANCEIRA ---
+getcontext().prec = 28
+DOIS_DECIMAIS = Decimal('0.01')
+JUROS_DIARIO = Decimal('0.01') / Decimal('30')
+
+REGIME_INDICE = "1. Índice Correção + Juros 1% a.m."
+REGIME_SELIC = "2. Taxa SELIC Pura (EC 113/21)"
+REGIME_MISTO = "3. Misto (Índice até Corte -> SELIC)"
+REGIMES = [REGIME_INDICE, REGIME_SELIC, REGIME_MISTO]
+
+mapa_indices_completo = {
+    "Tabela Prática TJSP (Oficial)": -1,
+    "INPC (IBGE) - 188": 188,
+    "IGP-M (FGV) - 189": 189,
+    "IPCA (IBGE) - 433": 433,
+    "IPCA-E (IBGE) - 10764": 10764,
+    "SELIC (Taxa Referencial) - 4390": 4390,
+    "SELIC Diária (Over) - 11": 11
+}
+COD_SELIC = 4390
+
+# --- 2. TABELA PRÁTICA TJSP ---
+class ErroTabelaTJSP(ValueError):
+    pass
+
+# Tabelas já validadas, compartilhadas por todas as sessões do processo: sha256 -> (primeiro_mes, fatores)
+_tabelas_tjsp = {}
+_trava_tabelas_tjsp = threading.Lock()
+
+def mes_absoluto(data_obj):
+    return data_obj.year * 12 + data_obj.month - 1
+
+def validar_tabela_tjsp(conteudo):
+    # CSV mes_ano,fator -> (primeiro_mes, tupla de Decimal por mês consecutivo)
+    try:
+        leitor = csv.DictReader(io.StringIO(conteudo.decode('utf-8-sig')))
+    except UnicodeDecodeError:
+        raise ErroTabelaTJSP("Arquivo não está em UTF-8.")
+    if not leitor.fieldnames or 'mes_ano' not in leitor.fieldnames or 'fator' not in leitor.fieldnames:
+        raise ErroTabelaTJSP("Cabeçalho deve conter as colunas 'mes_ano' e 'fator'.")
+
+    por_mes = {}
+    for num_linha, linha in enumerate(leitor, start=2):
+        mes_ano = (linha.get('mes_ano') or '').strip()
+        fator_txt = (linha.get('fator') or '').strip()
+        if not mes_ano and not fator_txt: continue
+        try:
+            mes, ano = mes_ano.split('/')
+            chave = mes_absoluto(date(int(ano), int(mes), 1))
+            fator = Decimal(fator_txt.replace(',', '.'))
+        except Exception:
+            raise ErroTabelaTJSP(f"Linha {num_linha} malformada: '{mes_ano}', '{fator_txt}'.")
+        if not fator.is_finite() or fator <= 0:
+            raise ErroTabelaTJSP(f"Linha {num_linha}: fator deve ser positivo ({fator_txt}).")
+        if chave in por_mes:
+            raise ErroTabelaTJSP(f"Linha {num_linha}: mês {mes_ano} repetido.")
+        por_mes[chave] = fator
+
+    if not por_mes:
+        return 0, ()
+    primeiro, ultimo = min(por_mes), max(por_mes)
+    faltando = [f"{m % 12 + 1:02d}/{m // 12}" for m in range(primeiro, ultimo + 1) if m not in por_mes]
+    if faltando:
+        raise ErroTabelaTJSP(f"Meses ausentes na tabela: {', '.join(faltando[:6])}{'...' if len(faltando) > 6 else ''}")
+    return primeiro, tuple(por_mes[m] for m in range(primeiro, ultimo + 1))
+
+def carregar_tabela_tjsp(conteudo):
+    chave = hashlib.sha256(conteudo).hexdigest()
+    with _trava_tabelas_tjsp:
+        tabela = _tabelas_tjsp.get(chave)
+    if tabela is None:
+        try:
+            tabela = validar_tabela_tjsp(conteudo)
+        except ErroTabelaTJSP as e:
+            tabela = e
+        with _trava_tabelas_tjsp:
+            _tabelas_tjsp[chave] = tabela
+    if isinstance(tabela, ErroTabelaTJSP):
+        raise tabela
+    return chave, tabela
+
+class CalculadoraTJSP:
+    def __init__(self, arquivo_prioritario=None, arquivo_padrao='tabela_tjsp.csv'):
+        self.primeiro_mes = 0
+        self.fatores = ()
+        self.hash_conteudo = None
+        if arquivo_prioritario is not None:
+            self.carregar_dados(arquivo_prioritario, eh_upload=True)
+        else:
+            self.carregar_dados(arquivo_padrao, eh_upload=False)
+
+    def carregar_dados(self, arquivo, eh_upload=False):
+        # Levanta ErroTabelaTJSP se o conteúdo for inválido; arquivo padrão ausente = tabela vazia
+        if eh_upload:
+            arquivo.seek(0)
+            conteudo = arquivo.getvalue()
+        else:
+            try:
+                with open(arquivo, mode='rb') as f:
+                    conteudo = f.read()
+            except FileNotFoundError:
+                return
+        self.hash_conteudo, (self.primeiro_mes, self.fatores) = carregar_tabela_tjsp(conteudo)
+
+    def obter_fator(self, data_obj):
+        i = mes_absoluto(data_obj) - self.primeiro_mes
+        if 0 <= i < len(self.fatores):
+            return self.fatores[i]
+        return None
+
+    def calcular_fator_composto(self, data_venc, data_atualiz):
+        idx_base = self.obter_fator(data_venc)
+        idx_final = self.obter_fator(data_atualiz)
+        if not idx_base or not idx_final: return None
+        return idx_final / idx_base
+
+# --- 3. FUNÇÕES UTILITÁRIAS ---
+
+def to_decimal(valor):
+    if not valor: return Decimal('0.00')
+    try:
+        if isinstance(valor, (float, int, Decimal)):
+            return Decimal(str(valor))
+        if isinstance(valor, str):
+            valor = valor.strip()
+            if ',' in valor:
+                valor = valor.replace('.', '').replace(',', '.')
+            return Decimal(str(valor))
+    except:
+        return Decimal('0.00')
+
+def formatar_moeda(valor):
+    try:
+        if not isinstance(valor, Decimal):
+            valor = to_decimal(valor)
+        # + 0: o que arredonda para zero sai "R$ 0,00", não "R$ -0,00"
+        valor_ajustado = valor.quantize(DOIS_DECIMAIS, rounding=ROUND_HALF_UP) + 0
+        texto = f"R$ {valor_ajustado:,.2f}"
+        return texto.replace(",", "X").replace(".", ",").replace("X", ".")
+    except:
+        return "R$ 0,00"
+
+def formatar_decimal_str(valor):
+    return f"{valor:.6f}"
+
+def fator_indice(codigo_serie, df_serie, calc_tjsp, dt_ini, dt_fim):
+    if codigo_serie == -1:
+        return calc_tjsp.calcular_fator_composto(dt_ini, dt_fim)
+    return calcular_fator_memoria(df_serie, dt_ini, dt_fim)
+
+def juros_mora(valor, dias):
+    if dias <= 0: return Decimal('0.00')
+    return valor * (JUROS_DIARIO * Decimal(dias))
+
+# --- 4. INDENIZAÇÃO (PRO-RATA) ---
+
+def gerar_cronograma_pro_rata(inicio_atraso, fim_atraso, val_mensal_cheio):
+    datas_calc = []
+    curr = inicio_atraso
+    while curr <= fim_atraso:
+        ultimo_dia_mes = calendar.monthrange(curr.year, curr.month)[1]
+        data_fim_mes = date(curr.year, curr.month, ultimo_dia_mes)
+        data_encerramento_periodo = min(data_fim_mes, fim_atraso)
+        dias_ativos = (data_encerramento_periodo - curr).days + 1
+        dias_no_mes = ultimo_dia_mes
+
+        valor_base_mes = val_mensal_cheio
+        txt_pro_rata = "Integral"
+        if dias_ativos < dias_no_mes:
+            fator_pro = Decimal(dias_ativos) / Decimal(dias_no_mes)
+            valor_base_mes = val_mensal_cheio * fator_pro
+            txt_pro_rata = f"Pro-rata ({dias_ativos}/{dias_no_mes} dias)"
+
+        datas_calc.append({
+            "vencimento": curr,
+            "valor_base": valor_base_mes,
+            "info_prorata": txt_pro_rata
+        })
+        curr = data_fim_mes + timedelta(days=1)
+    return datas_calc
+
+def series_indenizacao(datas_calc, regime_tipo, cod_ind_escolhido, data_corte_selic, data_calculo):
+    # Janelas {papel: (codigo, inicio, fim)} que o cálculo precisa baixar do BCB
+    janelas = {}
+    if not datas_calc: return janelas
+    dt_minima_api = min(d['vencimento'] for d in datas_calc)
+    if cod_ind_escolhido and cod_ind_escolhido != -1:
+        janelas['indice'] = (cod_ind_escolhido, dt_minima_api, data_calculo)
+    if "SELIC" in regime_tipo or "Misto" in regime_tipo:
+        dt_inicio_selic = data_corte_selic if data_corte_selic else dt_minima_api
+        if dt_inicio_selic > dt_minima_api: dt_inicio_selic = dt_minima_api
+        janelas['selic'] = (COD_SELIC, dt_inicio_selic, data_calculo)
+    return janelas
+
+def calcular_indenizacao(datas_calc, regime_tipo, data_calculo, cod_ind_escolhido, df_indice_principal,
+                         df_selic_cache, calc_tjsp, data_citacao_ind=None, data_corte_selic=None,
+                         aplicar_juros_fase1=True):
+    lista_resultados = []
+    for item in datas_calc:
+        venc = item['vencimento']
+        val_base = item['valor_base']
+
+        linha = {
+            "Vencimento": venc.strftime("%d/%m/%Y"),
+            "Pro-Rata": item['info_prorata'],
+            "Valor Orig.": formatar_moeda(val_base),
+            "Audit Fator CM": "-", "V. Corrigido Puro": "-",
+            "Audit Juros %": "-", "Valor Juros": "-", "Subtotal F1": "-",
+            "Audit Fator SELIC": "-", "Principal Atualizado": "-", "TOTAL": "-",
+            "_num": Decimal('0.00'),
+            "data_sort": venc
+        }
+
+        total_final = Decimal('0.00')
+
+        # 1. ÍNDICE PADRÃO
+        if "1. Índice" in regime_tipo:
+            fator = fator_indice(cod_ind_escolhido, df_indice_principal, calc_tjsp, venc, data_calculo)
+
+            if fator:
+                v_corrigido = val_base * fator
+                linha["Audit Fator CM"] = formatar_decimal_str(fator)
+                linha["V. Corrigido Puro"] = formatar_moeda(v_corrigido)
+
+                dt_inicio_juros = data_citacao_ind if venc < data_citacao_ind else venc
+                dias_atraso = (data_calculo - dt_inicio_juros).days
+
+                valor_juros = Decimal('0.00')
+                if dias_atraso > 0:
+                    valor_juros = juros_mora(v_corrigido, dias_atraso)
+                    linha["Audit Juros %"] = f"{(dias_atraso/30):.1f}%"
+                    linha["Valor Juros"] = formatar_moeda(valor_juros)
+                total_final = v_corrigido + valor_juros
+
+        # 2. SELIC PURA
+        elif "2. Taxa SELIC" in regime_tipo:
+            fator_selic = calcular_fator_memoria(df_selic_cache, venc, data_calculo)
+            if fator_selic:
+                total_final = val_base * fator_selic
+                linha["Audit Fator SELIC"] = formatar_decimal_str(fator_selic)
+
+        # 3. MISTO
+        elif "3. Misto" in regime_tipo:
+            if venc >= data_corte_selic:
+                # Pós Corte: SELIC Pura
+                fator_selic = calcular_fator_memoria(df_selic_cache, venc, data_calculo)
+                if fator_selic:
+                    total_final = val_base * fator_selic
+                    linha["Audit Fator SELIC"] = formatar_decimal_str(fator_selic)
+                    linha["Principal Atualizado"] = formatar_moeda(total_final)
+                    linha["Audit Juros %"] = "-"
+            else:
+                # Fase 1
+                f_fase1 = fator_indice(cod_ind_escolhido, df_indice_principal, calc_tjsp, venc, data_corte_selic)
+
+                if f_fase1:
+                    v_corr_f1 = val_base * f_fase1
+                    linha["Audit Fator CM"] = f"{f_fase1:.6f}"
+                    linha["V. Corrigido Puro"] = formatar_moeda(v_corr_f1)
+
+                    # Juros (Congelados) - SOMENTE SE O CHECKBOX ESTIVER MARCADO
+                    juros_f1 = Decimal('0.00')
+
+                    if aplicar_juros_fase1:
+                        dt_j_f1 = data_citacao_ind if venc < data_citacao_ind else venc
+                        if dt_j_f1 < data_corte_selic:
+                            dias_f1 = (data_corte_selic - dt_j_f1).days
+                            juros_f1 = juros_mora(v_corr_f1, dias_f1)
+                            linha["Audit Juros %"] = formatar_moeda(juros_f1)
+                        else:
+                            linha["Audit Juros %"] = "R$ 0,00"
+                    else:
+                        linha["Audit Juros %"] = "N/A (Desativado)"
+
+                    total_fase1 = v_corr_f1 + juros_f1
+                    linha["Subtotal F1"] = formatar_moeda(total_fase1)
+
+                    f_selic_f2 = calcular_fator_memoria(df_selic_cache, data_corte_selic, data_calculo)
+                    if f_selic_f2:
+                        princ_atualizado = v_corr_f1 * f_selic_f2
+                        linha["Audit Fator SELIC"] = f"{f_selic_f2:.6f}"
+                        linha["Principal Atualizado"] = formatar_moeda(princ_atualizado)
+                        total_final = princ_atualizado + juros_f1
+
+        linha["TOTAL"] = formatar_moeda(total_final)
+        linha["_num"] = total_final
+        lista_resultados.append(linha)
+    return lista_resultados
+
+# --- 5. HONORÁRIOS ---
+
+def valores_honorarios(val_hon, data_hon, data_calculo, fator, aplica_juros_hon=True):
+    # Linha de honorários com os valores exatos (mesmas chaves de calcular_honorarios); [] sem fator
+    if not fator: return []
+    val_corr = val_hon * fator
+    juros_val = Decimal('0.00')
+    if aplica_juros_hon:
+        juros_val = juros_mora(val_corr, (data_calculo - data_hon).days)
+    return [{"Descrição": "Honorários", "Valor Orig.": val_hon, "Audit Fator": fator, "Juros": juros_val, "TOTAL": val_corr + juros_val}]
+
+def formatar_linha_honorarios(v):
+    return {"Descrição": v["Descrição"], "Valor Orig.": formatar_moeda(v["Valor Orig."]), "Audit Fator": formatar_decimal_str(v["Audit Fator"]),
+            "Juros": formatar_moeda(v["Juros"]), "TOTAL": formatar_moeda(v["TOTAL"]), "_num": v["TOTAL"]}
+
+def calcular_honorarios(val_hon, data_hon, data_calculo, fator, aplica_juros_hon=True):
+    return [formatar_linha_honorarios(v) for v in valores_honorarios(val_hon, data_hon, data_calculo, fator, aplica_juros_hon)]
+
+# --- 6. PENSÃO ---
+
+def gerar_parcelas_pensao(p_val, p_ini, p_fim):
+    parcelas = []
+    curr = p_ini
+    while curr <= p_fim:
+        parcelas.append((curr, p_val, Decimal('0.00')))
+        curr += relativedelta(months=1)
+    return parcelas
+
+def janela_pensao(parcelas, data_calculo):
+    if not parcelas: return None
+    return min(p[0] for p in parcelas), data_calculo
+
+def valores_pensao(venc, devido, pago, cod, df_serie_pensao, calc_tjsp, data_calculo):
+    # (saldo, fator, atualizado, juros, total) de uma parcela; fator None = quitada; None quando falta o fator
+    saldo = devido - pago
+    if saldo <= 0: return (saldo, None, None, None, Decimal('0.00'))
+    fator = fator_indice(cod, df_serie_pensao, calc_tjsp, venc, data_calculo)
+    if not fator: return None
+    atualizado = saldo * fator
+    juros = juros_mora(atualizado, (data_calculo - venc).days)
+    return (saldo, fator, atualizado, juros, atualizado + juros)
+
+def formatar_linha_pensao(venc, devido, pago, valores):
+    saldo, fator, atualizado, juros, tot = valores
+    if fator is None:
+        return {"Vencimento": venc.strftime("%d/%m/%Y"), "Valor Devido": formatar_moeda(devido), "Valor Pago": formatar_moeda(pago), "Base Cálculo": "QUITADO", "Fator CM": "-", "Atualizado": "-", "Juros": "-", "TOTAL": "R$ 0,00", "_num": tot}
+    return {"Vencimento": venc.strftime("%d/%m/%Y"), "Valor Devido": formatar_moeda(devido), "Valor Pago": formatar_moeda(pago), "Base Cálculo": formatar_moeda(saldo), "Fator CM": formatar_decimal_str(fator), "Atualizado": formatar_moeda(atualizado), "Juros": formatar_moeda(juros), "TOTAL": formatar_moeda(tot), "_num": tot}
+
+def exata_linha_pensao(venc, devido, pago, valores):
+    # Mesmas chaves de formatar_linha_pensao, com os valores exatos (None onde a linha mostra "-"/"QUITADO")
+    saldo, fator, atualizado, juros, tot = valores
+    return {"Vencimento": venc, "Valor Devido": devido, "Valor Pago": pago, "Base Cálculo": None if fator is None else saldo,
+            "Fator CM": fator, "Atualizado": atualizado, "Juros": juros, "TOTAL": tot}
+
+def formatada_e_exata_linha_pensao(venc, devido, pago, valores):
+    return formatar_linha_pensao(venc, devido, pago, valores), exata_linha_pensao(venc, devido, pago, valores)
+
+def linha_pensao(venc, devido, pago, cod, df_serie_pensao, calc_tjsp, data_calculo, montar_linha=formatar_linha_pensao):
+    # Linha formatada de uma parcela, ou None quando falta o fator de correção
+    valores = valores_pensao(venc, devido, pago, cod, df_serie_pensao, calc_tjsp, data_calculo)
+    return montar_linha(venc, devido, pago, valores) if valores is not None else None
+
+def calcular_pensao(parcelas, cod, df_serie_pensao, calc_tjsp, data_calculo, montar_linha=formatar_linha_pensao):
+    # parcelas: [(vencimento, devido, pago)]
+    res_pensao = []
+    for venc, devido, pago in parcelas:
+        linha = linha_pensao(venc, devido, pago, cod, df_serie_pensao, calc_tjsp, data_calculo, montar_linha)
+        if linha is not None: res_pensao.append(linha)
+    diagnostico.contar("linhas_processadas", len(parcelas))
+    return res_pensao
+
+def assinatura_indice(cod, df_serie, calc_tjsp):
+    # Identifica os dados usados na correção: muda quando a tabela TJSP ou a série é atualizada
+    if cod == -1: return (cod, calc_tjsp.hash_conteudo)
+    if df_serie is None or df_serie.empty: return (cod, None)
+    indice = indice_da_serie(df_serie)
+    return (cod, len(indice.datas), indice.datas[-1], indice.acumulados[-1])
+
+class PensaoIncremental:
+    # Memória por parcela entre cliques em "Calcular Saldo": só as linhas cujas entradas
+    # (vencimento, devido, pago, índice, data de cálculo) mudaram são recalculadas, e o
+    # total é ajustado pela diferença entre as chaves da execução anterior e da atual.
+    # montar_linha(venc, devido, pago, valores) define o que fica guardado por parcela
+    # (dicionário formatado por padrão; a sessão do app usa a tupla de resultado_compacto).
+    # O objeto fica na sessão e é usado por tarefas em segundo plano: calcular é serializado
+    # por uma trava própria, sem depender da ordem em que a fila executa as tarefas.
+
+    BLOCO_PROGRESSO = 500
+
+    def __init__(self, montar_linha=formatar_linha_pensao):
+        self.montar_linha = montar_linha
+        self.memo = {}
+        self.chaves = Counter()
+        self.total = Decimal('0.00')
+        self._trava = threading.Lock()
+
+    def calcular(self, parcelas, cod, df_serie_pensao, calc_tjsp, data_calculo, progresso=None):
+        # progresso(feitos, total): chamado a cada BLOCO_PROGRESSO parcelas (tarefas em segundo plano);
+        # se interromper o laço, a memória e o total da execução anterior continuam coerentes
+        with self._trava:
+            return self._calcular(parcelas, cod, df_serie_pensao, calc_tjsp, data_calculo, progresso)
+
+    def _calcular(self, parcelas, cod, df_serie_pensao, calc_tjsp, data_calculo, progresso):
+        indice = assinatura_indice(cod, df_serie_pensao, calc_tjsp)
+        chaves = [(venc, devido, pago, indice, data_calculo) for venc, devido, pago in parcelas]
+        novas = 0
+        for k, chave in enumerate(chaves):
+            if chave not in self.memo:
+                valores = valores_pensao(*chave[:3], cod, df_serie_pensao, calc_tjsp, data_calculo)
+                self.memo[chave] = (self.montar_linha(*chave[:3], valores), valores[4]) if valores is not None else None
+                novas += 1
+            if progresso and k % self.BLOCO_PROGRESSO == 0:
+                progresso(k, len(chaves))
+        if progresso: progresso(len(chaves), len(chaves))
+        diagnostico.contar("linhas_processadas", novas)
+
+        # Precisão folgada para que somar e depois subtrair a mesma linha não deixe resíduo
+        atuais = Counter(chaves)
+        with localcontext() as ctx:
+            ctx.prec = 60
+            for chave, qtd in (atuais - self.chaves).items():
+                self.total += self._valor(chave) * qtd
+            for chave, qtd in (self.chaves - atuais).items():
+                self.total -= self._valor(chave) * qtd
+        self.chaves = atuais
+        self.memo = {chave: self.memo[chave] for chave in atuais}
+        return [self.memo[chave][0] for chave in chaves if self.memo[chave] is not None], self.total
+
+    def _valor(self, chave):
+        item = self.memo[chave]
+        return item[1] if item is not None else Decimal('0.00')
+
+# --- 7. ALUGUEL ---
+
+def janela_reajuste_aluguel(dt_reaj):
+    # 12 meses até o fim do mês do reajuste: só o mês conta, então contratos com o mesmo índice
+    # e o mesmo mês de reajuste têm o mesmo fator (aluguel_lote calcula um por grupo)
+    dt_fim = dt_reaj + relativedelta(day=31)
+    return dt_reaj - relativedelta(months=12, day=31), dt_fim
+
+def calcular_reajuste_aluguel(alug_atual, dt_reaj, indice, fator):
+    if not fator: return None
+    dt_ini, dt_fim = janela_reajuste_aluguel(dt_reaj)
+    return {'valor_antigo': alug_atual, 'novo_valor': alug_atual * fator, 'indice': indice, 'periodo': f"{dt_ini.strftime('%d/%m/%Y')} a {dt_fim.strftime('%d/%m/%Y')}", 'fator': fator}
+
+# --- 8. ART. 523 CPC ---
+
+def calcular_art523(subtotal, aplicar_multa_523=False, aplicar_hon_523=False):
+    val_multa_523 = subtotal * Decimal('0.10') if aplicar_multa_523 else Decimal('0.00')
+    val_hon_523 = subtotal * Decimal('0.10') if aplicar_hon_523 else Decimal('0.00')
+    return {'subtotal': subtotal, 'multa': val_multa_523, 'hon_exec': val_hon_523, 'final': subtotal + val_multa_523 + val_hon_523}
+
+# --- 9. API DE CASOS (LOTE) ---
+
+TIPOS_CASO = ("indenizacao", "honorarios", "pensao", "aluguel")
+DATA_CORTE_SELIC_PADRAO = date(2021, 12, 9)
+_APELIDOS_REGIME = {"1": REGIME_INDICE, "indice": REGIME_INDICE, "2": REGIME_SELIC, "selic": REGIME_SELIC, "3": REGIME_MISTO, "misto": REGIME_MISTO}
+_APELIDOS_INDICE = {nome.split(" (")[0].upper(): cod for nome, cod in mapa_indices_completo.items()}
+_APELIDOS_INDICE["TJSP"] = -1
+
+def ler_data(valor):
+    if valor is None or valor == "": return None
+    if isinstance(valor, date): return valor
+    valor = str(valor).strip()
+    if "/" in valor:
+        dia, mes, ano = valor.split("/")
+        return date(int(ano), int(mes), int(dia))
+    return date.fromisoformat(valor[:10])
+
+def ler_pagamento(bruto):
+    dia = ler_data(bruto.get("data"))
+    if dia is None: raise ValueError("pagamento sem data")
+    return dia, to_decimal(bruto.get("valor"))
+
+def ler_booleano(valor, padrao=False):
+    if valor is None or valor == "": return padrao
+    if isinstance(valor, bool): return valor
+    return str(valor).strip().lower() in ("1", "true", "sim", "s", "yes", "y", "x")
+
+def ler_regime(valor):
+    if not valor: return REGIME_INDICE
+    if valor in REGIMES: return valor
+    return _APELIDOS_REGIME[str(valor).strip().lower()]
+
+def ler_indice(valor):
+    if valor is None or valor == "": return -1
+    if valor in mapa_indices_completo: return mapa_indices_completo[valor]
+    texto = str(valor).strip()
+    if texto.lstrip("-").isdigit(): return int(texto)
+    return _APELIDOS_INDICE[texto.upper()]
+
+def normalizar_caso(bruto):
+    # Converte um registro de CSV/JSONL (strings) no dicionário tipado usado por calcular_caso
+    tipo = (bruto.get("tipo") or "indenizacao").strip().lower()
+    if tipo not in TIPOS_CASO:
+        raise ValueError(f"Tipo de caso desconhecido: {tipo}")
+    caso = {
+        "id": str(bruto.get("id", "")),
+        "tipo": tipo,
+        "data_calculo": ler_data(bruto.get("data_calculo")) or date.today(),
+        "valor": to_decimal(bruto.get("valor")),
+        "codigo_indice": ler_indice(bruto.get("indice")),
+        "multa_523": ler_booleano(bruto.get("multa_523")),
+        "hon_523": ler_booleano(bruto.get("hon_523")),
+    }
+    if tipo == "indenizacao":
+        regime = ler_regime(bruto.get("regime"))
+        caso["regime"] = regime
+        caso["percentual"] = to_decimal(bruto.get("percentual") or "100")
+        caso["inicio"] = ler_data(bruto.get("inicio"))
+        caso["fim"] = ler_data(bruto.get("fim"))
+        if caso["inicio"] is None or caso["fim"] is None: raise ValueError("indenização requer inicio e fim")
+        caso["data_citacao"] = None
+        caso["data_corte_selic"] = None
+        caso["juros_fase1"] = True
+        if "2. Taxa SELIC" in regime:
+            caso["codigo_indice"] = None
+        else:
+            caso["data_citacao"] = ler_data(bruto.get("data_citacao")) or caso["inicio"]
+        if "3. Misto" in regime:
+            caso["data_corte_selic"] = ler_data(bruto.get("data_corte_selic")) or DATA_CORTE_SELIC_PADRAO
+            caso["juros_fase1"] = ler_booleano(bruto.get("juros_fase1"), padrao=True)
+    elif tipo == "honorarios":
+        caso["data_fixacao"] = ler_data(bruto.get("data_fixacao") or bruto.get("inicio"))
+        if caso["data_fixacao"] is None: raise ValueError("honorários requerem data_fixacao")
+        caso["aplicar_juros"] = ler_booleano(bruto.get("aplicar_juros"), padrao=True)
+    elif tipo == "pensao":
+        if bruto.get("parcelas"):
+            caso["parcelas"] = [(ler_data(p.get("vencimento")), to_decimal(p.get("devido")), to_decimal(p.get("pago")))
+                                for p in bruto["parcelas"]]
+        else:
+            inicio, fim = ler_data(bruto.get("inicio")), ler_data(bruto.get("fim"))
+            if inicio is None or fim is None: raise ValueError("pensão requer inicio e fim")
+            caso["parcelas"] = gerar_parcelas_pensao(caso["valor"], inicio, fim)
+        # Extrato opcional: [{"data", "valor"}], imputado nas parcelas mais antigas (ver imputacao)
+        caso["pagamentos"] = [ler_pagamento(p) for p in bruto.get("pagamentos") or []]
+    elif tipo == "aluguel":
+        caso["data_reajuste"] = ler_data(bruto.get("data_reajuste") or bruto.get("fim")) or caso["data_calculo"]
+    return caso
+
+def janela_valida(janela):
+    # Mesmo filtro de obter_dados_bcb_cache: janelas vazias ou futuras não consultam o BCB
+    if janela is None: return False
+    codigo, data_inicio, data_fim = janela
+    return codigo != -1 and data_fim > data_inicio and data_inicio <= date.today()
+
+def janelas_caso(caso):
+    tipo = caso["tipo"]
+    cod = caso["codigo_indice"]
+    if tipo == "indenizacao":
+        val_mensal = caso["valor"] * (caso["percentual"] / Decimal('100'))
+        datas_calc = gerar_cronograma_pro_rata(caso["inicio"], caso["fim"], val_mensal)
+        janelas = list(series_indenizacao(datas_calc, caso["regime"], cod, caso["data_corte_selic"], caso["data_calculo"]).values())
+    elif tipo == "honorarios":
+        janelas = [(cod, caso["data_fixacao"], caso["data_calculo"])]
+    elif tipo == "pensao":
+        janela = janela_pensao(caso["parcelas"], caso["data_calculo"])
+        janelas = [(cod, *janela)] if janela else []
+    else:
+        janelas = [(cod, *janela_reajuste_aluguel(caso["data_reajuste"]))]
+    return [j for j in janelas if janela_valida(j)]
+
+def serie_da_janela(series, janela):
+    # series: {codigo: DataFrame} cobrindo (pelo menos) a janela pedida
+    if not janela_valida(janela): return None
+    return series.get(janela[0])
+
+def calcular_caso(caso, series, calc_tjsp, exatas=False):
+    # Função pura: caso normalizado + séries pré-carregadas -> linhas e totais. Com exatas=True,
+    # resultado["exatas"] traz, para cada linha, as mesmas chaves com os valores sem formatação
+    # (date/Decimal/None), para a exportação tipada do lote.
+    tipo = caso["tipo"]
+    cod = caso["codigo_indice"]
+    resultado = {"id": caso["id"], "tipo": tipo, "linhas": [], "total": Decimal('0.00'), "art523": None}
+    valores = []
+    if tipo == "indenizacao":
+        val_mensal = caso["valor"] * (caso["percentual"] / Decimal('100'))
+        datas_calc = gerar_cronograma_pro_rata(caso["inicio"], caso["fim"], val_mensal)
+        janelas = series_indenizacao(datas_calc, caso["regime"], cod, caso["data_corte_selic"], caso["data_calculo"])
+        from motor_vetorizado import calcular_indenizacao_vetorizada
+        calculado = calcular_indenizacao_vetorizada(
+            datas_calc, caso["regime"], caso["data_calculo"], cod,
+            serie_da_janela(series, janelas.get('indice')), serie_da_janela(series, janelas.get('selic')),
+            calc_tjsp, caso["data_citacao"], caso["data_corte_selic"], caso["juros_fase1"]
+        )
+        resultado["linhas"] = list(calculado.linhas())
+        if exatas: valores = list(calculado.valores())
+    elif tipo == "honorarios":
+        serie = serie_da_janela(series, (cod, caso["data_fixacao"], caso["data_calculo"]))
+        fator = fator_indice(cod, serie, calc_tjsp, caso["data_fixacao"], caso["data_calculo"])
+        valores = valores_honorarios(caso["valor"], caso["data_fixacao"], caso["data_calculo"], fator, caso["aplicar_juros"])
+        resultado["linhas"] = [formatar_linha_honorarios(v) for v in valores]
+    elif tipo == "pensao":
+        janela = janela_pensao(caso["parcelas"], caso["data_calculo"])
+        serie = serie_da_janela(series, (cod, *janela)) if janela else None
+        montar = formatada_e_exata_linha_pensao if exatas else formatar_linha_pensao
+        if caso.get("pagamentos"):
+            from imputacao import imputar_parcelas
+            linhas = imputar_parcelas(caso["parcelas"], caso["pagamentos"], cod, serie, calc_tjsp, caso["data_calculo"],
+                                      montar_linha=montar).linhas
+        else:
+            linhas = calcular_pensao(caso["parcelas"], cod, serie, calc_tjsp, caso["data_calculo"], montar)
+        if exatas:
+            linhas, valores = [l for l, _ in linhas], [v for _, v in linhas]
+        resultado["linhas"] = linhas
+    else:
+        dt_ini, dt_fim = janela_reajuste_aluguel(caso["data_reajuste"])
+        fator = fator_indice(cod, serie_da_janela(series, (cod, dt_ini, dt_fim)), calc_tjsp, dt_ini, dt_fim)
+        dados = calcular_reajuste_aluguel(caso["valor"], caso["data_reajuste"], str(cod), fator)
+        if dados:
+            resultado["linhas"] = [{"Descrição": "Reajuste Aluguel", "Valor Orig.": formatar_moeda(dados['valor_antigo']), "Audit Fator": formatar_decimal_str(fator), "TOTAL": formatar_moeda(dados['novo_valor']), "_num": dados['novo_valor']}]
+            valores = [{"Descrição": "Reajuste Aluguel", "Valor Orig.": dados['valor_antigo'], "Audit Fator": fator, "TOTAL": dados['novo_valor']}]
+        resultado["total"] = dados['novo_valor'] if dados else Decimal('0.00')
+        resultado["dados_aluguel"] = dados
+        if exatas: resultado["exatas"] = valores
+        return resultado
+
+    if exatas: resultado["exatas"] = valores
+    resultado["total"] = sum((l["_num"] for l in resultado["linhas"]), Decimal('0.00'))
+    resultado["art523"] = calcular_art523(resultado["total"], caso["multa_523"], caso["hon_523"])
+    return resultado
@@ -0,0 +1,290 @@
+from datetime import date
+from decimal import Decimal
+from functools import lru_cache
+
+import numpy as np
+
+import diagnostico
+from motor_calculo import COD_SELIC, JUROS_DIARIO, formatar_moeda, formatar_decimal_str, mapa_indices_completo
+from series_bcb import indice_da_serie
+
+# --- MOTOR EM COLUNAS (INDENIZAÇÃO) ---
+# Calcula as três modalidades de uma vez sobre colunas. O NumPy vetoriza a parte inteira:
+# datas como ordinais int64, buscas nos índices (searchsorted) e máscaras de regime e juros.
+# Os valores seguem Decimal em arrays dtype=object, ou seja, cada conta ainda roda elemento
+# a elemento em Python, e é a mesma do laço de motor_calculo.calcular_indenizacao, então os
+# resultados são idênticos (tests/test_motor_vetorizado.py). Centavos e fatores em int64 não
+# reproduzem os produtos de 28 dígitos do contexto Decimal (e valor x fator com muitas casas
+# estoura 64 bits), por isso não são usados aqui. O ganho sobre o laço vem de não formatar:
+# o texto fica para ResultadoIndenizacao.linhas(), chamada apenas na exibição/PDF.
+
+ZERO = Decimal('0.00')
+
+BLOCO_LINHAS = 2000
+
+# Estado da coluna "Audit Juros %"
+JUROS_NENHUM, JUROS_PERCENTUAL, JUROS_VALOR, JUROS_ZERADO, JUROS_DESATIVADO = range(5)
+
+def _vazio(n, valor=None):
+    arr = np.empty(n, dtype=object)
+    arr.fill(valor)
+    return arr
+
+def _validos(arr):
+    # Mesmo teste de "if fator:" do laço Decimal (None ou zero = ausente)
+    return np.fromiter((bool(x) for x in arr), dtype=bool, count=len(arr))
+
+@lru_cache(maxsize=None)
+def _taxa_juros(dias):
+    return JUROS_DIARIO * Decimal(dias)
+
+def _taxas_juros(dias):
+    # Taxa por nº de dias memorizada: compartilhada entre índices na comparação
+    return np.array([_taxa_juros(int(d)) for d in dias], dtype=object)
+
+def fatores_serie(df_serie, inicios, fins):
+    # Fator acumulado [inicio, fim] de cada linha via duas buscas binárias vetorizadas
+    n = len(inicios)
+    fatores = _vazio(n)
+    if df_serie is None or df_serie.empty or n == 0: return fatores
+    with diagnostico.etapa("fatores"):
+        datas, acumulados = indice_da_serie(df_serie).arrays()
+        i = np.searchsorted(datas, inicios, side='left')
+        j = np.searchsorted(datas, fins, side='right')
+        ok = j > i
+        # Intervalos repetidos (mesmos pontos inicial e final) são divididos uma única vez
+        pares, posicao = np.unique(i[ok] * (len(acumulados) + 1) + j[ok], return_inverse=True)
+        unicos = acumulados[pares % (len(acumulados) + 1)] / acumulados[pares // (len(acumulados) + 1)]
+        fatores[ok] = unicos[posicao]
+    return fatores
+
+def fatores_tjsp(calc_tjsp, inicios, fins):
+    n = len(inicios)
+    fatores = _vazio(n)
+    tabela = np.array(calc_tjsp.fatores, dtype=object)
+    if n == 0 or len(tabela) == 0: return fatores
+    with diagnostico.etapa("fatores"):
+        i = _meses(inicios) - calc_tjsp.primeiro_mes
+        j = _meses(fins) - calc_tjsp.primeiro_mes
+        ok = (i >= 0) & (i < len(tabela)) & (j >= 0) & (j < len(tabela))
+        fatores[ok] = tabela[j[ok]] / tabela[i[ok]]
+    return fatores
+
+def _meses(ordinais):
+    return np.fromiter((d.year * 12 + d.month - 1 for d in map(date.fromordinal, ordinais.tolist())),
+                       dtype=np.int64, count=len(ordinais))
+
+def fatores_indice(codigo_serie, df_serie, calc_tjsp, inicios, fins):
+    if codigo_serie == -1:
+        return fatores_tjsp(calc_tjsp, inicios, fins)
+    return fatores_serie(df_serie, inicios, fins)
+
+class ResultadoIndenizacao:
+    # Colunas tipadas do cálculo; nada é formatado até linhas()
+
+    def __init__(self, datas_calc):
+        n = len(datas_calc)
+        self.n = n
+        self.vencimento = np.fromiter((d['vencimento'].toordinal() for d in datas_calc), dtype=np.int64, count=n)
+        self.info_prorata = [d['info_prorata'] for d in datas_calc]
+        self.valor_base = np.array([d['valor_base'] for d in datas_calc], dtype=object)
+        self.fator_cm = _vazio(n)
+        self.v_corrigido = _vazio(n)
+        self.dias_juros = np.zeros(n, dtype=np.int64)
+        self.juros = _vazio(n, ZERO)
+        self.estado_juros = np.zeros(n, dtype=np.int8)
+        self.subtotal_f1 = _vazio(n)
+        self.fator_selic = _vazio(n)
+        self.principal_atualizado = _vazio(n)
+        self.total = _vazio(n, ZERO)
+
+    @classmethod
+    def juntar(cls, partes):
+        # Concatena resultados de blocos consecutivos do mesmo cronograma
+        res = cls([])
+        if not partes: return res
+        res.n = sum(p.n for p in partes)
+        for nome, valor in vars(partes[0]).items():
+            if isinstance(valor, np.ndarray):
+                setattr(res, nome, np.concatenate([getattr(p, nome) for p in partes]))
+        res.info_prorata = [txt for p in partes for txt in p.info_prorata]
+        return res
+
+    def soma_total(self):
+        return sum(self.total, ZERO)
+
+    def _audit_juros(self, k):
+        estado = self.estado_juros[k]
+        if estado == JUROS_PERCENTUAL: return f"{(int(self.dias_juros[k])/30):.1f}%"
+        if estado == JUROS_VALOR: return formatar_moeda(self.juros[k])
+        if estado == JUROS_ZERADO: return "R$ 0,00"
+        if estado == JUROS_DESATIVADO: return "N/A (Desativado)"
+        return "-"
+
+    def linhas(self):
+        # Apresentação: mesmos dicionários de motor_calculo.calcular_indenizacao
+        for k in range(self.n):
+            venc = date.fromordinal(int(self.vencimento[k]))
+            fator_cm, v_corr, juros = self.fator_cm[k], self.v_corrigido[k], self.juros[k]
+            yield {
+                "Vencimento": venc.strftime("%d/%m/%Y"),
+                "Pro-Rata": self.info_prorata[k],
+                "Valor Orig.": formatar_moeda(self.valor_base[k]),
+                "Audit Fator CM": formatar_decimal_str(fator_cm) if fator_cm is not None else "-",
+                "V. Corrigido Puro": formatar_moeda(v_corr) if v_corr is not None else "-",
+                "Audit Juros %": self._audit_juros(k),
+                "Valor Juros": formatar_moeda(juros) if self.estado_juros[k] == JUROS_PERCENTUAL else "-",
+                "Subtotal F1": formatar_moeda(self.subtotal_f1[k]) if self.subtotal_f1[k] is not None else "-",
+                "Audit Fator SELIC": formatar_decimal_str(self.fator_selic[k]) if self.fator_selic[k] is not None else "-",
+                "Principal Atualizado": formatar_moeda(self.principal_atualizado[k]) if self.principal_atualizado[k] is not None else "-",
+                "TOTAL": formatar_moeda(self.total[k]),
+                "_num": self.total[k],
+                "data_sort": venc
+            }
+
+    def valores(self):
+        # Mesmas chaves de linhas(), com os valores exatos (date/Decimal; None onde a linha mostra "-")
+        for k in range(self.n):
+            yield {
+                "Vencimento": date.fromordinal(int(self.vencimento[k])),
+                "Pro-Rata": self.info_prorata[k],
+                "Valor Orig.": self.valor_base[k],
+                "Audit Fator CM": self.fator_cm[k],
+                "V. Corrigido Puro": self.v_corrigido[k],
+                "Audit Juros %": self._audit_juros(k),
+                "Valor Juros": self.juros[k] if self.estado_juros[k] == JUROS_PERCENTUAL else None,
+                "Subtotal F1": self.subtotal_f1[k],
+                "Audit Fator SELIC": self.fator_selic[k],
+                "Principal Atualizado": self.principal_atualizado[k],
+                "TOTAL": self.total[k],
+            }
+
+def calcular_indenizacao_vetorizada(datas_calc, regime_tipo, data_calculo, cod_ind_escolhido, df_indice_principal,
+                                    df_selic_cache, calc_tjsp, data_citacao_ind=None, data_corte_selic=None,
+                                    aplicar_juros_fase1=True):
+    with diagnostico.etapa("calculo_linhas"):
+        res = _calcular_colunas(datas_calc, regime_tipo, data_calculo, cod_ind_escolhido, df_indice_principal,
+                                df_selic_cache, calc_tjsp, data_citacao_ind, data_corte_selic, aplicar_juros_fase1)
+    diagnostico.contar("linhas_processadas", res.n)
+    return res
+
+def calcular_indenizacao_em_blocos(datas_calc, *args, progresso=None, bloco=None):
+    # Mesmo resultado de calcular_indenizacao_vetorizada (as linhas são independentes), em blocos
+    # de linhas para informar o progresso(feitos, total) de uma tarefa em segundo plano
+    bloco = bloco or BLOCO_LINHAS
+    partes = []
+    for inicio in range(0, len(datas_calc), bloco):
+        partes.append(calcular_indenizacao_vetorizada(datas_calc[inicio:inicio + bloco], *args))
+        if progresso: progresso(min(inicio + bloco, len(datas_calc)), len(datas_calc))
+    return ResultadoIndenizacao.juntar(partes)
+
+def _calcular_colunas(datas_calc, regime_tipo, data_calculo, cod_ind_escolhido, df_indice_principal,
+                      df_selic_cache, calc_tjsp, data_citacao_ind, data_corte_selic, aplicar_juros_fase1):
+    res = ResultadoIndenizacao(datas_calc)
+    n = res.n
+    if n == 0: return res
+    venc = res.vencimento
+    vb = res.valor_base
+    calc = np.full(n, data_calculo.toordinal(), dtype=np.int64)
+
+    # 1. ÍNDICE PADRÃO
+    if "1. Índice" in regime_tipo:
+        fator = fatores_indice(cod_ind_escolhido, df_indice_principal, calc_tjsp, venc, calc)
+        ok = _validos(fator)
+        res.fator_cm[ok] = fator[ok]
+        res.v_corrigido[ok] = vb[ok] * fator[ok]
+        dias = calc - np.maximum(venc, data_citacao_ind.toordinal())
+        com_juros = ok & (dias > 0)
+        res.dias_juros[com_juros] = dias[com_juros]
+        res.juros[com_juros] = res.v_corrigido[com_juros] * _taxas_juros(dias[com_juros])
+        res.estado_juros[com_juros] = JUROS_PERCENTUAL
+        res.total[ok] = res.v_corrigido[ok] + res.juros[ok]
+
+    # 2. SELIC PURA
+    elif "2. Taxa SELIC" in regime_tipo:
+        fator = fatores_serie(df_selic_cache, venc, calc)
+        ok = _validos(fator)
+        res.fator_selic[ok] = fator[ok]
+        res.total[ok] = vb[ok] * fator[ok]
+
+    # 3. MISTO
+    elif "3. Misto" in regime_tipo:
+        corte = data_corte_selic.toordinal()
+        pos = venc >= corte
+
+        # Pós Corte: SELIC Pura
+        fator = fatores_serie(df_selic_cache, venc[pos], calc[pos])
+        ok = np.zeros(n, dtype=bool)
+        ok[pos] = _validos(fator)
+        res.fator_selic[ok] = fator[ok[pos]]
+        res.total[ok] = vb[ok] * res.fator_selic[ok]
+        res.principal_atualizado[ok] = res.total[ok]
+
+        # Fase 1 (o fator SELIC da Fase 2 é o mesmo para todas as linhas)
+        pre = ~pos
+        f_fase1 = fatores_indice(cod_ind_escolhido, df_indice_principal, calc_tjsp, venc[pre], np.full(int(pre.sum()), corte, dtype=np.int64))
+        ok1 = np.zeros(n, dtype=bool)
+        ok1[pre] = _validos(f_fase1)
+        res.fator_cm[ok1] = f_fase1[ok1[pre]]
+        res.v_corrigido[ok1] = vb[ok1] * res.fator_cm[ok1]
+
+        if aplicar_juros_fase1:
+            dt_j = np.maximum(venc, data_citacao_ind.toordinal())
+            tem = ok1 & (dt_j < corte)
+            dias_f1 = corte - dt_j[tem]
+            res.juros[tem] = res.v_corrigido[tem] * _taxas_juros(dias_f1)
+            res.estado_juros[tem] = JUROS_VALOR
+            res.estado_juros[ok1 & ~tem] = JUROS_ZERADO
+        else:
+            res.estado_juros[ok1] = JUROS_DESATIVADO
+
+        res.subtotal_f1[ok1] = res.v_corrigido[ok1] + res.juros[ok1]
+
+        if ok1.any():
+            f_selic_f2 = fatores_serie(df_selic_cache, np.array([corte]), calc[:1])[0]
+            if f_selic_f2:
+                res.fator_selic[ok1] = f_selic_f2
+                res.principal_atualizado[ok1] = res.v_corrigido[ok1] * f_selic_f2
+                res.total[ok1] = res.principal_atualizado[ok1] + res.juros[ok1]
+
+    return res
+
+# --- COMPARAÇÃO ENTRE ÍNDICES ---
+
+def codigos_comparacao():
+    return list(mapa_indices_completo.values())
+
+def comparar_indenizacao(datas_calc, regime_tipo, data_calculo, series, calc_tjsp, data_citacao_ind=None,
+                         data_corte_selic=None, aplicar_juros_fase1=True, codigos=None):
+    # {codigo: ResultadoIndenizacao} do mesmo cronograma com cada índice; series: {codigo: DataFrame}.
+    # Cronograma, séries e taxas de juros são compartilhados; nada é formatado.
+    codigos = codigos or codigos_comparacao()
+    df_selic = series.get(COD_SELIC)
+    return {cod: calcular_indenizacao_vetorizada(datas_calc, regime_tipo, data_calculo, cod, series.get(cod), df_selic,
+                                                 calc_tjsp, data_citacao_ind, data_corte_selic, aplicar_juros_fase1)
+            for cod in codigos}
+
+def comparar_pensao(parcelas, data_calculo, series, calc_tjsp, codigos=None):
+    # {codigo: array de totais por parcela}, com None onde falta fator (mesma regra de calcular_pensao)
+    codigos = codigos or codigos_comparacao()
+    n = len(parcelas)
+    venc = np.fromiter((p[0].toordinal() for p in parcelas), dtype=np.int64, count=n)
+    saldo = np.array([p[1] - p[2] for p in parcelas], dtype=object)
+    calc = np.full(n, data_calculo.toordinal(), dtype=np.int64)
+    quitada = np.fromiter((s <= 0 for s in saldo), dtype=bool, count=n)
+    dias = calc - venc
+    com_juros = ~quitada & (dias > 0)
+    taxas = _vazio(n, Decimal('0'))
+    taxas[com_juros] = _taxas_juros(dias[com_juros])
+    comparacao = {}
+    for cod in codigos:
+        with diagnostico.etapa("calculo_linhas"):
+            totais = _vazio(n)
+            totais[quitada] = ZERO
+            fator = fatores_indice(cod, series.get(cod), calc_tjsp, venc, calc)
+            ok = ~quitada & _validos(fator)
+            atualizado = saldo[ok] * fator[ok]
+            totais[ok] = atualizado + np.where(com_juros[ok], atualizado * taxas[ok], ZERO)
+        comparacao[cod] = totais
+        diagnostico.contar("linhas_processadas", n)
+    return comparacao
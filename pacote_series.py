@@ -0,0 +1,251 @@
+import argparse
+import hashlib
+import io
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+
+import numpy as np
+
+import diagnostico
+import series_bcb
+from motor_calculo import COD_SELIC, CalculadoraTJSP, carregar_tabela_tjsp, mapa_indices_completo
+
+# --- PACOTE OFFLINE DE SÉRIES ---
+# Um único arquivo com todas as séries usadas pelo app (mapa_indices_completo + SELIC) e a
+# Tabela Prática TJSP, para servidores sem acesso ao BCB e para reproduzir um laudo depois
+# com exatamente os mesmos dados.
+# Uso: python pacote_series.py gerar series.calcjus [--inicio 1980-01-01] [--tabela-tjsp tabela_tjsp.csv]
+#      python pacote_series.py verificar series.calcjus
+#      CALCJUS_PACOTE_SERIES=series.calcjus streamlit run app.py   (ou calculo_lote.py --pacote)
+#
+# Formato: MAGIA (8 bytes) | tamanho do cabeçalho (uint32 LE) | cabeçalho JSON | dados.
+# Os dados começam alinhados em 8 bytes; cada série tem três colunas de largura fixa: datas
+# (int32 ordinal), mantissa (int64) e expoente (int8) do valor publicado, de modo que o texto
+# do SGS é reconstruído exatamente. O arquivo é lido por mmap: abrir lê só o cabeçalho e cada
+# série vira uma visão numpy sobre o mapa. O id do pacote vem do SHA-256 de cabeçalho + dados.
+
+MAGIA = b"CALCJUS\x01"
+VERSAO_FORMATO = 1
+INICIO_PADRAO = date(1980, 1, 1)
+_CABECALHO = struct.Struct("<8sI")
+
+class ErroPacote(Exception):
+    pass
+
+def codigos_pacote():
+    return sorted({cod for cod in mapa_indices_completo.values() if cod != -1} | {COD_SELIC})
+
+def _alinhar(n):
+    return (n + 7) // 8 * 8
+
+def _colunas(pontos):
+    # [(date, "0.45")] -> ordinais int32, mantissas int64, expoentes int8
+    n = len(pontos)
+    ordinais = np.fromiter((d.toordinal() for d, _ in pontos), dtype="<i4", count=n)
+    mantissas = np.empty(n, dtype="<i8")
+    expoentes = np.empty(n, dtype="i1")
+    for k, (_, valor) in enumerate(pontos):
+        sinal, digitos, expoente = Decimal(valor).as_tuple()
+        mantissa = int("".join(map(str, digitos)) or "0")
+        mantissas[k] = -mantissa if sinal else mantissa
+        expoentes[k] = expoente
+    return ordinais, mantissas, expoentes
+
+def _hash(cabecalho, dados):
+    corpo = {k: v for k, v in cabecalho.items() if k not in ("id", "sha256")}
+    h = hashlib.sha256(json.dumps(corpo, sort_keys=True).encode("utf-8"))
+    h.update(dados)
+    return h.hexdigest()
+
+def gerar_pacote(caminho, armazem=None, inicio=INICIO_PADRAO, fim=None, caminho_tjsp="tabela_tjsp.csv", codigos=None):
+    # Consulta cada série (armazém local / BCB) de inicio até fim e grava o pacote; devolve o id
+    armazem = armazem or series_bcb.armazem_padrao()
+    fim = fim or date.today()
+    with open(caminho_tjsp, "rb") as f:
+        conteudo_tjsp = f.read()
+    hash_tjsp, _ = carregar_tabela_tjsp(conteudo_tjsp)
+
+    dados = io.BytesIO()
+    series = {}
+    for codigo in codigos or codigos_pacote():
+        consulta = armazem.consultar(codigo, inicio, fim)
+        if consulta is None:
+            raise ErroPacote(f"Série {codigo} indisponível (BCB fora do ar e sem cópia local)")
+        ordinais, mantissas, expoentes = _colunas(consulta["pontos"])
+        meta = {"n": len(ordinais), "inicio": inicio.isoformat(), "fim": fim.isoformat(),
+                "dados_ate": consulta["dados_ate"].isoformat() if consulta["dados_ate"] else None,
+                "verificado_em": consulta["verificado_em"].isoformat() if consulta["verificado_em"] else None}
+        for nome, coluna in (("datas", ordinais), ("mantissas", mantissas), ("expoentes", expoentes)):
+            meta[nome] = dados.tell()
+            dados.write(coluna.tobytes())
+            dados.write(b"\0" * (_alinhar(dados.tell()) - dados.tell()))
+        series[str(codigo)] = meta
+    tjsp = {"deslocamento": dados.tell(), "tamanho": len(conteudo_tjsp), "sha256": hash_tjsp}
+    dados.write(conteudo_tjsp)
+
+    dados = dados.getvalue()
+    cabecalho = {"formato": VERSAO_FORMATO, "gerado_em": datetime.now().isoformat(timespec="seconds"),
+                 "series": series, "tjsp": tjsp}
+    cabecalho["sha256"] = _hash(cabecalho, dados)
+    cabecalho["id"] = cabecalho["sha256"][:16]
+    texto = json.dumps(cabecalho, sort_keys=True).encode("utf-8")
+    preambulo = _CABECALHO.pack(MAGIA, len(texto)) + texto
+    preambulo += b"\0" * (_alinhar(len(preambulo)) - len(preambulo))
+
+    diretorio = os.path.dirname(os.path.abspath(caminho))
+    with tempfile.NamedTemporaryFile("wb", dir=diretorio, delete=False, suffix=".tmp") as f:
+        f.write(preambulo)
+        f.write(dados)
+    os.replace(f.name, caminho)
+    return cabecalho["id"]
+
+class PacoteSeries:
+    # Somente leitura, com a mesma interface de consulta do ArmazemSeries (series_bcb), então
+    # obter_serie/obter_series funcionam igual; a rede nunca é usada para as séries do pacote.
+    # reserva: armazém consultado para códigos fora do pacote (ex.: um código SGS digitado na
+    # tela); sem reserva, esses códigos ficam indisponíveis.
+
+    def __init__(self, caminho, verificar=True, reserva=None):
+        self.caminho = caminho
+        self.reserva = reserva
+        with open(caminho, "rb") as f:
+            self._mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mapa) < _CABECALHO.size:
+            raise ErroPacote("Arquivo curto demais para ser um pacote de séries")
+        magia, tamanho = _CABECALHO.unpack_from(self._mapa, 0)
+        if magia != MAGIA:
+            raise ErroPacote("Arquivo não é um pacote de séries do CalcJus")
+        try:
+            self.cabecalho = json.loads(self._mapa[_CABECALHO.size:_CABECALHO.size + tamanho])
+        except ValueError as e:
+            raise ErroPacote(f"Cabeçalho inválido: {e}")
+        if self.cabecalho.get("formato") != VERSAO_FORMATO:
+            raise ErroPacote(f"Versão de formato não suportada: {self.cabecalho.get('formato')}")
+        self._inicio_dados = _alinhar(_CABECALHO.size + tamanho)
+        self.id = self.cabecalho["id"]
+        self.gerado_em = datetime.fromisoformat(self.cabecalho["gerado_em"])
+        self._colunas = {}
+        self._trava = threading.Lock()
+        if verificar: self.verificar()
+
+    def verificar(self):
+        dados = memoryview(self._mapa)[self._inicio_dados:]
+        try:
+            if _hash(self.cabecalho, dados) != self.cabecalho["sha256"]:
+                raise ErroPacote(f"Checksum do pacote {self.caminho} não confere (arquivo alterado ou corrompido)")
+        finally:
+            dados.release()
+
+    def codigos(self):
+        return [int(c) for c in self.cabecalho["series"]]
+
+    def _colunas_serie(self, codigo):
+        # Visões numpy sobre o mmap (sem cópia), criadas na primeira consulta da série
+        with self._trava:
+            colunas = self._colunas.get(codigo)
+            if colunas is None:
+                meta = self.cabecalho["series"][str(codigo)]
+                colunas = tuple(np.frombuffer(self._mapa, dtype=tipo, count=meta["n"], offset=self._inicio_dados + meta[nome])
+                                for nome, tipo in (("datas", "<i4"), ("mantissas", "<i8"), ("expoentes", "i1")))
+                self._colunas[codigo] = colunas
+        return colunas
+
+    def pontos(self, codigo, data_inicio, data_fim):
+        # [(date, valor_str)] no intervalo fechado, com o texto original do SGS
+        datas, mantissas, expoentes = self._colunas_serie(codigo)
+        i = int(np.searchsorted(datas, data_inicio.toordinal(), side="left"))
+        j = int(np.searchsorted(datas, data_fim.toordinal(), side="right"))
+        return [(date.fromordinal(int(datas[k])), format(Decimal(int(mantissas[k])).scaleb(int(expoentes[k])), "f"))
+                for k in range(i, j)]
+
+    def situacao_local(self, codigo, data_inicio, data_fim, offline=False):
+        # O pacote é imutável: a situação de consultar vale sem ler os pontos
+        meta = self.cabecalho["series"].get(str(codigo))
+        if meta is None:
+            return self.reserva.situacao_local(codigo, data_inicio, data_fim, offline) if self.reserva else None
+        return {"codigo": codigo, "dados_ate": date.fromisoformat(meta["dados_ate"]) if meta["dados_ate"] else None,
+                "verificado_em": datetime.fromisoformat(meta["verificado_em"]) if meta["verificado_em"] else None,
+                "desatualizada": False, "pacote": self.id}
+
+    def consultar(self, codigo, data_inicio, data_fim, offline=False):
+        # Mesmo formato de ArmazemSeries.consultar, com o id do pacote; fora do pacote, a consulta
+        # vai para a reserva (sem o id) ou é None
+        if str(codigo) not in self.cabecalho["series"]:
+            return self.reserva.consultar(codigo, data_inicio, data_fim, offline) if self.reserva else None
+        situacao = self.situacao_local(codigo, data_inicio, data_fim, offline)
+        if situacao is None: return None
+        data_fim = min(data_fim, date.today())
+        pontos = self.pontos(codigo, data_inicio, data_fim) if data_fim >= data_inicio else []
+        diagnostico.contar("cache_hits")
+        return dict(situacao, pontos=pontos)
+
+    def obter(self, codigo, data_inicio, data_fim, offline=False):
+        consulta = self.consultar(codigo, data_inicio, data_fim, offline)
+        return consulta["pontos"] if consulta else None
+
+    def bcb_fora_do_ar(self):
+        return self.reserva.bcb_fora_do_ar() if self.reserva else False
+
+    def limpar(self):
+        # O pacote é imutável: só a reserva tem cache a limpar
+        if self.reserva: self.reserva.limpar()
+
+    def conteudo_tjsp(self):
+        meta = self.cabecalho["tjsp"]
+        inicio = self._inicio_dados + meta["deslocamento"]
+        return bytes(self._mapa[inicio:inicio + meta["tamanho"]])
+
+    def calculadora_tjsp(self):
+        return CalculadoraTJSP(arquivo_prioritario=io.BytesIO(self.conteudo_tjsp()))
+
+    def descrever(self):
+        return f"pacote offline {self.id} (gerado em {self.gerado_em.strftime('%d/%m/%Y %H:%M')})"
+
+_pacotes = {}
+_trava_pacotes = threading.Lock()
+
+def abrir_pacote(caminho, reserva=None):
+    # Um PacoteSeries por arquivo e processo (reruns do app e workers do lote reaproveitam o mmap);
+    # a reserva informada passa a valer para o pacote compartilhado
+    chave = os.path.abspath(caminho)
+    with _trava_pacotes:
+        pacote = _pacotes.get(chave)
+        if pacote is None:
+            pacote = _pacotes[chave] = PacoteSeries(caminho)
+        if reserva is not None: pacote.reserva = reserva
+        return pacote
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CalcJus Pro - pacote offline de séries (BCB + Tabela TJSP)")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    gerar = sub.add_parser("gerar", help="Gera o pacote a partir do armazém local / BCB")
+    gerar.add_argument("saida")
+    gerar.add_argument("--inicio", type=date.fromisoformat, default=INICIO_PADRAO)
+    gerar.add_argument("--tabela-tjsp", default="tabela_tjsp.csv")
+    verificar = sub.add_parser("verificar", help="Confere o checksum e lista o conteúdo")
+    verificar.add_argument("pacote")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.comando == "gerar":
+            print(f"Pacote {gerar_pacote(args.saida, inicio=args.inicio, caminho_tjsp=args.tabela_tjsp)} gravado em {args.saida}.")
+        else:
+            pacote = PacoteSeries(args.pacote)
+            print(f"Pacote {pacote.id} ok, gerado em {pacote.gerado_em.isoformat(sep=' ')}")
+            for codigo, meta in pacote.cabecalho["series"].items():
+                print(f"  série {codigo}: {meta['n']} pontos, dados até {meta['dados_ate'] or '-'}")
+            print(f"  Tabela TJSP: {pacote.cabecalho['tjsp']['tamanho']} bytes")
+    except (ErroPacote, OSError) as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,265 @@
+import io
+import zlib
+from datetime import date, datetime
+
+from fpdf import FPDF
+
+from motor_calculo import formatar_moeda
+
+# --- GERAÇÃO DE PDF ---
+# As tabelas são desenhadas em blocos de LINHAS_POR_BLOCO linhas: cada coluna do bloco é
+# convertida para latin-1 de uma vez e o cabeçalho da tabela se repete a cada página.
+# O documento é gravado no destino à medida que as páginas fecham (ver PDFRelatorio): a
+# memória fica em uma página mais um rodapé curto por página, qualquer que seja o tamanho.
+LINHAS_POR_BLOCO = 500
+SEPARADOR = "\x1f"
+
+def coluna_pdf(valores):
+    # Uma única conversão latin-1 para a coluna inteira (em vez de uma por célula)
+    valores = list(valores)
+    if not valores: return []
+    texto = SEPARADOR.join(map(str, valores)).encode('latin-1', 'replace').decode('latin-1')
+    return texto.split(SEPARADOR)
+
+class _SaidaPDF:
+    # Ocupa o lugar do buffer (str) do FPDF: o que ele concatena vai direto para o arquivo e
+    # len() devolve a posição, que o FPDF usa como offset dos objetos na tabela xref
+    def __init__(self, arquivo):
+        self.arquivo = arquivo
+        self.posicao = 0
+
+    def __iadd__(self, texto):
+        dados = texto.encode('latin-1', 'replace')
+        self.arquivo.write(dados)
+        self.posicao += len(dados)
+        return self
+
+    def __len__(self):
+        return self.posicao
+
+class PDFRelatorio(FPDF):
+    # FPDF 1.7 guarda todas as páginas em memória e monta o arquivo só no fim. Aqui cada página,
+    # ao fechar, vira já o seu stream de conteúdo no arquivo; o objeto /Page e o rodapé (que
+    # traz o total de páginas, {nb}) são gravados em close(), quando o total é conhecido.
+    # Sem links nem troca de orientação por página, que o relatório não usa.
+
+    def __init__(self, saida, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buffer = _SaidaPDF(saida)
+        self._inicio_rodape = 0
+        self._rodapes = []
+        self._objetos_pagina = []
+        self._conteudos = []
+
+    def header(self):
+        self.set_font('Arial', 'B', 12)
+        self.set_text_color(0, 0, 0)
+        self.cell(0, 5, 'RELATÓRIO DE CÁLCULO JUDICIAL', 0, 1, 'C')
+        self.ln(2)
+        self.set_draw_color(0, 0, 0)
+        self.line(10, 18, 287, 18) 
+        self.ln(10)
+
+    def footer(self):
+        self._inicio_rodape = len(self.pages[self.page])
+        self.set_y(-15)
+        self.set_font('Arial', 'I', 7)
+        self.set_text_color(128, 128, 128)
+        self.cell(0, 5, f'Pagina {self.page_no()}/{{nb}} | Gerado via CalcJus Pro em {datetime.now().strftime("%d/%m/%Y %H:%M")}', 0, 0, 'C')
+
+    def safe_cell(self, w, h, txt, border=0, ln=0, align='', fill=False):
+        try:
+            txt_safe = str(txt).encode('latin-1', 'replace').decode('latin-1')
+            self.cell(w, h, txt_safe, border, ln, align, fill)
+        except:
+            self.cell(w, h, "?", border, ln, align, fill)
+
+    def safe_multi_cell(self, w, h, txt, border=0, align='J', fill=False):
+        try:
+            txt_safe = str(txt).encode('latin-1', 'replace').decode('latin-1')
+            self.multi_cell(w, h, txt_safe, border, align, fill)
+        except:
+            self.multi_cell(w, h, "Erro texto.", border, align, fill)
+
+    def titulo_secao(self, texto, cor):
+        self.set_font("Arial", "B", 10)
+        self.set_fill_color(*cor)
+        self.safe_cell(0, 7, texto, 0, 1, 'L', True)
+
+    def _cabecalho_tabela(self, colunas):
+        self.set_font("Arial", "B", 8)
+        for titulo, largura, _ in colunas: self.safe_cell(largura, 7, titulo, 1, 0, 'C')
+        self.ln()
+        self.set_font("Arial", "", 8)
+
+    def tabela(self, colunas, dados, altura=6):
+        # colunas: [(título, largura, campo do DataFrame)]; campos ausentes saem como "-"
+        self._cabecalho_tabela(colunas)
+        for inicio in range(0, len(dados), LINHAS_POR_BLOCO):
+            bloco = dados.iloc[inicio:inicio + LINHAS_POR_BLOCO]
+            textos = [coluna_pdf(bloco[campo]) if campo in bloco else ["-"] * len(bloco) for _, _, campo in colunas]
+            larguras = [largura for _, largura, _ in colunas]
+            for valores in zip(*textos):
+                if self.get_y() + altura > self.page_break_trigger:
+                    self.add_page()
+                    self._cabecalho_tabela(colunas)
+                for largura, valor in zip(larguras, valores):
+                    self.cell(largura, altura, valor, 1, 0, 'C')
+                self.ln()
+
+    def _stream(self, conteudo):
+        dados = zlib.compress(conteudo.encode('latin-1', 'replace'))
+        self._newobj()
+        self._out(f'<</Filter /FlateDecode /Length {len(dados)}>>')
+        self._putstream(dados)
+        self._out('endobj')
+        return self.n
+
+    def _endpage(self):
+        super()._endpage()
+        if not self._objetos_pagina: super()._putheader()
+        conteudo, self.pages[self.page] = self.pages[self.page], ''
+        self._rodapes.append(conteudo[self._inicio_rodape:])
+        # Número reservado para o objeto /Page (a primeira página fica no objeto 3, como no FPDF)
+        self.n += 1
+        self._objetos_pagina.append(self.n)
+        self._conteudos.append(self._stream(conteudo[:self._inicio_rodape]))
+
+    def _putheader(self):
+        # Já gravado antes da primeira página
+        pass
+
+    def _putpages(self):
+        total = str(self.page)
+        alias = getattr(self, 'str_alias_nb_pages', None)
+        largura, altura = (self.fw_pt, self.fh_pt) if self.def_orientation == 'P' else (self.fh_pt, self.fw_pt)
+        for pagina, conteudo, rodape in zip(self._objetos_pagina, self._conteudos, self._rodapes):
+            objeto_rodape = self._stream(rodape.replace(alias, total) if alias else rodape)
+            self.offsets[pagina] = len(self.buffer)
+            self._out(f'{pagina} 0 obj')
+            self._out('<</Type /Page')
+            self._out('/Parent 1 0 R')
+            self._out('/Resources 2 0 R')
+            if self.pdf_version > '1.3':
+                self._out('/Group <</Type /Group /S /Transparency /CS /DeviceRGB>>')
+            self._out(f'/Contents [{conteudo} 0 R {objeto_rodape} 0 R]>>')
+            self._out('endobj')
+        self._rodapes = []
+        self.offsets[1] = len(self.buffer)
+        self._out('1 0 obj')
+        self._out('<</Type /Pages')
+        self._out('/Kids [' + ''.join(f'{pagina} 0 R ' for pagina in self._objetos_pagina) + ']')
+        self._out(f'/Count {self.page}')
+        self._out(f'/MediaBox [0 0 {largura:.2f} {altura:.2f}]')
+        self._out('>>')
+        self._out('endobj')
+
+    def subtotal(self, texto):
+        self.set_font("Arial", "B", 9)
+        self.safe_cell(0, 8, texto, 0, 1, 'R')
+        self.ln(3)
+
+COLUNAS_MISTO = [("Vencimento", 25, 'Vencimento'), ("Valor Orig.", 25, 'Valor Orig.'), ("Fator CM", 22, 'Audit Fator CM'),
+                 ("V. Corrigido", 28, 'V. Corrigido Puro'), ("Juros F1", 25, 'Audit Juros %'), ("Subtotal F1", 30, 'Subtotal F1'),
+                 ("Fator SELIC", 45, 'Audit Fator SELIC'), ("TOTAL", 35, 'TOTAL')]
+COLUNAS_SELIC = [("Vencimento", 30, 'Vencimento'), ("Valor Orig.", 35, 'Valor Orig.'), ("Fator SELIC Acum.", 50, 'Audit Fator SELIC'),
+                 ("TOTAL", 40, 'TOTAL')]
+COLUNAS_INDICE = [("Vencimento", 25, 'Vencimento'), ("Valor Orig.", 25, 'Valor Orig.'), ("Fator CM", 25, 'Audit Fator CM'),
+                  ("V. Corrigido", 30, 'V. Corrigido Puro'), ("Juros %", 25, 'Audit Juros %'), ("Valor Juros", 30, 'Valor Juros'),
+                  ("TOTAL", 35, 'TOTAL')]
+COLUNAS_HONORARIOS = [("Descrição", 45, 'Descrição'), ("Valor Orig.", 35, 'Valor Orig.'), ("Fator", 35, 'Audit Fator'),
+                      ("Juros", 35, 'Juros'), ("TOTAL", 40, 'TOTAL')]
+COLUNAS_PENSAO = [("Vencimento", 25, 'Vencimento'), ("Valor Devido", 30, 'Valor Devido'), ("Valor Pago", 30, 'Valor Pago'),
+                  ("Base Cálculo", 30, 'Base Cálculo'), ("Fator CM", 25, 'Fator CM'), ("Atualizado", 30, 'Atualizado'),
+                  ("Juros", 30, 'Juros'), ("TOTAL", 35, 'TOTAL')]
+
+def gerar_pdf_relatorio(dados_ind, dados_hon, dados_pen, dados_aluguel, totais, config, destino=None):
+    # destino: None devolve os bytes; caminho (str) ou objeto com write() recebe o PDF em fluxo
+    if destino is None:
+        saida = io.BytesIO()
+        _escrever_relatorio(saida, dados_ind, dados_hon, dados_pen, dados_aluguel, totais, config)
+        return saida.getvalue()
+    if isinstance(destino, str):
+        with open(destino, 'wb') as f:
+            _escrever_relatorio(f, dados_ind, dados_hon, dados_pen, dados_aluguel, totais, config)
+    else:
+        _escrever_relatorio(destino, dados_ind, dados_hon, dados_pen, dados_aluguel, totais, config)
+
+def _escrever_relatorio(saida, dados_ind, dados_hon, dados_pen, dados_aluguel, totais, config):
+    pdf = PDFRelatorio(saida, orientation='L', unit='mm', format='A4')
+    pdf.alias_nb_pages()
+    pdf.add_page()
+    
+    # MEMORIAL
+    pdf.set_font("Arial", "B", 10)
+    pdf.set_fill_color(240, 240, 240)
+    pdf.safe_cell(0, 7, " 1. PARÂMETROS E METODOLOGIA (MEMORIAL DESCRITIVO)", 0, 1, 'L', True)
+    pdf.ln(2)
+    dt_calc = config.get('data_calculo', date.today()).strftime('%d/%m/%Y')
+    texto_explicativo = f"DATA BASE DO CÁLCULO: {dt_calc}\n\n"
+    if config.get('fontes_dados'):
+        texto_explicativo += "FONTE DOS ÍNDICES (BCB/SGS):\n" + "".join(f"- {nome}: {texto}\n" for nome, texto in config['fontes_dados']) + "\n"
+    tipo_regime = config.get('tipo_regime', 'Padrao')
+    
+    if "Misto" in tipo_regime:
+        dt_corte = config.get('data_corte').strftime("%d/%m/%Y") if config.get('data_corte') else "-"
+        com_juros_txt = " + Juros de Mora de 1% a.m." if config.get('juros_fase1', True) else " (Sem Juros)"
+        texto_explicativo += (f"METODOLOGIA APLICADA (Regime Misto - EC 113/21):\n1. FASE PRÉ-SELIC (Até {dt_corte}): Correção monetária pelo índice original{com_juros_txt}.\n2. FASE SELIC (De {dt_corte} até {dt_calc}): A Taxa SELIC incidiu exclusivamente sobre o PRINCIPAL CORRIGIDO. Os juros de mora acumulados na Fase 1 foram somados ao final.")
+    elif "SELIC" in tipo_regime:
+        texto_explicativo += "METODOLOGIA APLICADA: Taxa SELIC Pura (Correção + Juros em fator único), conforme EC 113/21."
+    else:
+        texto_explicativo += "METODOLOGIA APLICADA (Padrão): Correção Monetária plena + Juros de Mora de 1% a.m. sobre o valor corrigido."
+
+    pdf.set_font("Arial", "", 9)
+    pdf.safe_multi_cell(0, 5, texto_explicativo)
+    pdf.ln(5)
+
+    # INDENIZAÇÃO
+    if not dados_ind.empty:
+        pdf.titulo_secao(" 2. DEMONSTRATIVO DE CÁLCULO - INDENIZAÇÃO", (220, 230, 255))
+        if "Misto" in tipo_regime:
+            colunas = COLUNAS_MISTO
+        elif "SELIC" in tipo_regime:
+            colunas = COLUNAS_SELIC
+        else:
+            colunas = COLUNAS_INDICE
+        pdf.tabela(colunas, dados_ind)
+        pdf.subtotal(f"Subtotal Indenização: {formatar_moeda(totais['indenizacao'])}")
+
+    # HONORÁRIOS
+    if dados_hon is not None and not dados_hon.empty:
+        pdf.titulo_secao(" 3. HONORÁRIOS", (220, 230, 255))
+        pdf.tabela(COLUNAS_HONORARIOS, dados_hon)
+        pdf.subtotal(f"Subtotal Honorários: {formatar_moeda(totais['honorarios'])}")
+
+    # PENSÃO
+    if dados_pen is not None and not dados_pen.empty:
+        pdf.titulo_secao(" 4. PENSÃO ALIMENTÍCIA", (220, 230, 255))
+        pdf.tabela(COLUNAS_PENSAO, dados_pen)
+        pdf.subtotal(f"Subtotal Pensão: {formatar_moeda(totais.get('pensao', 0))}")
+
+    # ALUGUEL (informativo: o reajuste não entra no total da dívida)
+    if dados_aluguel:
+        pdf.titulo_secao(" 5. REAJUSTE DE ALUGUEL", (220, 230, 255))
+        pdf.set_font("Arial", "", 9)
+        pdf.safe_multi_cell(0, 5, (f"Índice: {dados_aluguel['indice']} | Período: {dados_aluguel['periodo']} | Fator: {dados_aluguel['fator']:.6f}\n"
+                                   f"Valor anterior: {formatar_moeda(dados_aluguel['valor_antigo'])} | Novo valor: {formatar_moeda(dados_aluguel['novo_valor'])}"))
+        pdf.ln(3)
+
+    # ART. 523 CPC
+    if totais.get('multa') or totais.get('hon_exec'):
+        pdf.titulo_secao(" 6. PENALIDADES (ART. 523 CPC)", (220, 230, 255))
+        pdf.set_font("Arial", "", 9)
+        if totais.get('multa'): pdf.safe_cell(0, 6, f"Multa de 10%: {formatar_moeda(totais['multa'])}", 0, 1, 'R')
+        if totais.get('hon_exec'): pdf.safe_cell(0, 6, f"Honorários de execução de 10%: {formatar_moeda(totais['hon_exec'])}", 0, 1, 'R')
+        pdf.ln(3)
+
+    # RESUMO
+    if totais['final'] > 0:
+        pdf.ln(5)
+        pdf.set_font("Arial", "B", 14)
+        pdf.set_fill_color(220, 220, 220)
+        pdf.safe_cell(140, 12, "TOTAL GERAL DA DÍVIDA", 1, 0, 'L', True)
+        pdf.safe_cell(40, 12, formatar_moeda(totais['final']), 1, 1, 'R', True)
+
+    pdf.close()
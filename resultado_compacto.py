@@ -0,0 +1,196 @@
+from datetime import date
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+import pandas as pd
+
+from motor_calculo import DOIS_DECIMAIS
+from motor_vetorizado import ResultadoIndenizacao, JUROS_PERCENTUAL, JUROS_VALOR, JUROS_ZERADO, JUROS_DESATIVADO
+
+# --- RESULTADOS COMPACTOS (SESSÃO) ---
+# Colunas numéricas em vez de DataFrames de textos: valores em centavos (int64), fatores com
+# 6 casas em inteiro escalado (int64), datas como ordinais (int32) e textos repetidos como
+# categorias. O texto "R$ 1.234,56" só é montado em linhas()/para_dataframe(), na exibição e no
+# PDF, e sai idêntico ao de formatar_moeda/formatar_decimal_str. Os fatores também ficam com a
+# precisão completa, em texto ASCII de largura fixa, para a exportação tipada (ver exportacao).
+
+NULO = np.iinfo(np.int64).min
+ESCALA_FATOR = 10**6
+BLOCO_EXPORTACAO = 50_000
+
+def centavos_int(valor):
+    if valor is None: return NULO
+    return int(valor.quantize(DOIS_DECIMAIS, rounding=ROUND_HALF_UP).scaleb(2))
+
+def fator_int(fator):
+    # Mesmo arredondamento de formatar_decimal_str (f"{fator:.6f}")
+    if fator is None: return NULO
+    return int(f"{fator:.6f}".replace(".", ""))
+
+def formatar_centavos(centavos, nulo="-"):
+    if centavos == NULO: return nulo
+    sinal = "-" if centavos < 0 else ""
+    inteiro, resto = divmod(abs(int(centavos)), 100)
+    return f"R$ {sinal}{inteiro:,}".replace(",", ".") + f",{resto:02d}"
+
+def formatar_fator(valor, nulo="-"):
+    if valor == NULO: return nulo
+    inteiro, resto = divmod(int(valor), ESCALA_FATOR)
+    return f"{inteiro}.{resto:06d}"
+
+def _coluna_centavos(valores):
+    return np.fromiter((centavos_int(v) for v in valores), dtype=np.int64, count=len(valores))
+
+def _coluna_fator(valores):
+    return np.fromiter((fator_int(v) for v in valores), dtype=np.int64, count=len(valores))
+
+def _coluna_exata(valores):
+    # Decimal completo como bytes ASCII (dtype S, sem objetos Python); b"" = sem fator
+    return np.array([b"" if v is None else format(v, "f").encode("ascii") for v in valores], dtype=bytes)
+
+def _centavos_lista(coluna):
+    return [None if v == NULO else v for v in coluna.tolist()]
+
+def _exatos_lista(coluna):
+    return [Decimal(v.decode("ascii")) if v else None for v in coluna.tolist()]
+
+def _datas_lista(coluna):
+    return [date.fromordinal(v) for v in coluna.tolist()]
+
+def _categorias(textos):
+    categorias, codigos = np.unique(np.array(textos, dtype=object), return_inverse=True)
+    return list(categorias), codigos.astype(np.int16)
+
+class ColunasCompactas:
+    def nbytes(self):
+        return sum(v.nbytes for v in vars(self).values() if isinstance(v, np.ndarray))
+
+    def datas(self):
+        return [date.fromordinal(int(d)) for d in self.vencimento]
+
+    def para_dataframe(self):
+        linhas = list(self.linhas())
+        return pd.DataFrame(linhas) if linhas else pd.DataFrame()
+
+    def tabela_grafico(self):
+        # Vencimento x valor atualizado (float), sem passar pelos textos
+        return pd.DataFrame({"Vencimento": self.datas(), "Valor Atualizado": self.total / 100.0}).set_index("Vencimento")
+
+    def blocos(self, tamanho=BLOCO_EXPORTACAO):
+        # Colunas do ESQUEMA (listas, None = vazio) em fatias de até `tamanho` linhas
+        for inicio in range(0, self.n, tamanho):
+            yield self._bloco(slice(inicio, min(inicio + tamanho, self.n)))
+
+class IndenizacaoCompacta(ColunasCompactas):
+    ESQUEMA = [("vencimento", "data"), ("pro_rata", "texto"), ("valor_orig_centavos", "centavos"), ("fator_cm", "decimal"),
+               ("v_corrigido_centavos", "centavos"), ("regra_juros", "texto"), ("dias_juros", "inteiro"),
+               ("juros_centavos", "centavos"), ("subtotal_f1_centavos", "centavos"), ("fator_selic", "decimal"),
+               ("principal_atualizado_centavos", "centavos"), ("total_centavos", "centavos")]
+    REGRAS_JUROS = {JUROS_PERCENTUAL: "1% a.m.", JUROS_VALOR: "1% a.m. (fase 1)", JUROS_ZERADO: "sem dias de juros",
+                    JUROS_DESATIVADO: "desativado"}
+
+    def __init__(self, resultado):
+        # resultado: motor_vetorizado.ResultadoIndenizacao
+        self.n = resultado.n
+        self.vencimento = resultado.vencimento.astype(np.int32)
+        self.categorias_prorata, self.prorata = _categorias(resultado.info_prorata) if self.n else ([], np.zeros(0, dtype=np.int16))
+        self.valor_base = _coluna_centavos(resultado.valor_base)
+        self.fator_cm = _coluna_fator(resultado.fator_cm)
+        self.fator_cm_exato = _coluna_exata(resultado.fator_cm)
+        self.v_corrigido = _coluna_centavos(resultado.v_corrigido)
+        self.dias_juros = resultado.dias_juros.astype(np.int32)
+        self.juros = _coluna_centavos(resultado.juros)
+        self.estado_juros = resultado.estado_juros.copy()
+        self.subtotal_f1 = _coluna_centavos(resultado.subtotal_f1)
+        self.fator_selic = _coluna_fator(resultado.fator_selic)
+        self.fator_selic_exato = _coluna_exata(resultado.fator_selic)
+        self.principal_atualizado = _coluna_centavos(resultado.principal_atualizado)
+        self.total = _coluna_centavos(resultado.total)
+
+    @classmethod
+    def vazia(cls):
+        return cls(ResultadoIndenizacao([]))
+
+    def _bloco(self, f):
+        return [_datas_lista(self.vencimento[f]), [self.categorias_prorata[c] for c in self.prorata[f].tolist()],
+                _centavos_lista(self.valor_base[f]), _exatos_lista(self.fator_cm_exato[f]), _centavos_lista(self.v_corrigido[f]),
+                [self.REGRAS_JUROS.get(e, "") for e in self.estado_juros[f].tolist()],
+                [d if e == JUROS_PERCENTUAL else None for d, e in zip(self.dias_juros[f].tolist(), self.estado_juros[f].tolist())],
+                _centavos_lista(self.juros[f]), _centavos_lista(self.subtotal_f1[f]), _exatos_lista(self.fator_selic_exato[f]),
+                _centavos_lista(self.principal_atualizado[f]), _centavos_lista(self.total[f])]
+
+    def linhas(self):
+        # Mesmas colunas de ResultadoIndenizacao.linhas(); "_num" em centavos arredondados
+        for k in range(self.n):
+            venc = date.fromordinal(int(self.vencimento[k]))
+            estado = self.estado_juros[k]
+            if estado == JUROS_PERCENTUAL:
+                audit_juros = f"{(int(self.dias_juros[k])/30):.1f}%"
+            elif estado == JUROS_VALOR:
+                audit_juros = formatar_centavos(self.juros[k])
+            elif estado == JUROS_ZERADO:
+                audit_juros = "R$ 0,00"
+            elif estado == JUROS_DESATIVADO:
+                audit_juros = "N/A (Desativado)"
+            else:
+                audit_juros = "-"
+            yield {
+                "Vencimento": venc.strftime("%d/%m/%Y"),
+                "Pro-Rata": self.categorias_prorata[self.prorata[k]],
+                "Valor Orig.": formatar_centavos(self.valor_base[k]),
+                "Audit Fator CM": formatar_fator(self.fator_cm[k]),
+                "V. Corrigido Puro": formatar_centavos(self.v_corrigido[k]),
+                "Audit Juros %": audit_juros,
+                "Valor Juros": formatar_centavos(self.juros[k]) if estado == JUROS_PERCENTUAL else "-",
+                "Subtotal F1": formatar_centavos(self.subtotal_f1[k]),
+                "Audit Fator SELIC": formatar_fator(self.fator_selic[k]),
+                "Principal Atualizado": formatar_centavos(self.principal_atualizado[k]),
+                "TOTAL": formatar_centavos(self.total[k]),
+                "_num": Decimal(int(self.total[k])).scaleb(-2),
+                "data_sort": venc
+            }
+
+def linha_pensao_compacta(venc, devido, pago, valores):
+    # valores: motor_calculo.valores_pensao(...) -> tupla de inteiros para PensaoCompacta
+    saldo, fator, atualizado, juros, tot = valores
+    quitada = fator is None
+    return (venc.toordinal(), centavos_int(devido), centavos_int(pago), NULO if quitada else centavos_int(saldo),
+            fator_int(fator), centavos_int(atualizado), centavos_int(juros), centavos_int(tot),
+            b"" if quitada else format(fator, "f").encode("ascii"))
+
+class PensaoCompacta(ColunasCompactas):
+    COLUNAS = ("vencimento", "devido", "pago", "base", "fator", "atualizado", "juros", "total")
+    ESQUEMA = [("vencimento", "data"), ("valor_devido_centavos", "centavos"), ("valor_pago_centavos", "centavos"),
+               ("base_calculo_centavos", "centavos"), ("fator_cm", "decimal"), ("atualizado_centavos", "centavos"),
+               ("juros_centavos", "centavos"), ("total_centavos", "centavos")]
+
+    def __init__(self, linhas):
+        # linhas: [tupla de linha_pensao_compacta]; o último campo é o fator exato
+        self.n = len(linhas)
+        colunas = list(zip(*linhas)) if linhas else [()] * (len(self.COLUNAS) + 1)
+        for nome, valores in zip(self.COLUNAS, colunas):
+            setattr(self, nome, np.array(valores, dtype=np.int64))
+        self.vencimento = self.vencimento.astype(np.int32)
+        self.fator_exato = np.array(colunas[-1], dtype=bytes)
+
+    def _bloco(self, f):
+        # Base vazia = parcela quitada
+        return [_datas_lista(self.vencimento[f]), _centavos_lista(self.devido[f]), _centavos_lista(self.pago[f]),
+                _centavos_lista(self.base[f]), _exatos_lista(self.fator_exato[f]), _centavos_lista(self.atualizado[f]),
+                _centavos_lista(self.juros[f]), _centavos_lista(self.total[f])]
+
+    def linhas(self):
+        # Mesmas colunas de motor_calculo.linha_pensao
+        for k in range(self.n):
+            quitada = self.base[k] == NULO
+            yield {
+                "Vencimento": date.fromordinal(int(self.vencimento[k])).strftime("%d/%m/%Y"),
+                "Valor Devido": formatar_centavos(self.devido[k]),
+                "Valor Pago": formatar_centavos(self.pago[k]),
+                "Base Cálculo": "QUITADO" if quitada else formatar_centavos(self.base[k]),
+                "Fator CM": formatar_fator(self.fator[k]),
+                "Atualizado": formatar_centavos(self.atualizado[k]),
+                "Juros": formatar_centavos(self.juros[k]),
+                "TOTAL": formatar_centavos(self.total[k]),
+                "_num": Decimal(int(self.total[k])).scaleb(-2),
+            }
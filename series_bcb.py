@@ -0,0 +1,478 @@
+import os
+import bisect
+import sqlite3
+import threading
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from decimal import Decimal, localcontext
+
+import numpy as np
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+
+import diagnostico
+
+# --- CONFIGURAÇÃO DO ARMAZÉM LOCAL ---
+DIRETORIO_CACHE = os.environ.get(
+    "CALCJUS_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".calcjus_cache"),
+)
+URL_BASE_SGS = os.environ.get("CALCJUS_SGS_URL", "https://api.bcb.gov.br").rstrip("/")
+URL_SGS = URL_BASE_SGS + "/dados/serie/bcdata.sgs.{codigo}/dados"
+TTL_DADOS_ABERTOS = 3600  # segundos até revalidar o trecho ainda não publicado
+PAUSA_APOS_FALHA = 60  # segundos servindo a cópia local sem nova tentativa após o BCB falhar
+JANELA_MAXIMA_ANOS = 10  # limite do SGS por consulta em séries diárias
+DOWNLOADS_SIMULTANEOS = 8
+CAMINHO_PACOTE = os.environ.get("CALCJUS_PACOTE_SERIES")  # pacote offline (pacote_series) no lugar do BCB
+
+# --- DOWNLOAD SGS ---
+
+def dividir_janelas(data_inicio, data_fim, anos=JANELA_MAXIMA_ANOS):
+    janelas = []
+    inicio = data_inicio
+    while inicio <= data_fim:
+        fim = min(data_fim, inicio + relativedelta(years=anos) - timedelta(days=1))
+        janelas.append((inicio, fim))
+        inicio = fim + timedelta(days=1)
+    return janelas
+
+class ClienteSGS:
+    # Sessão HTTP compartilhada (pool de conexões + retry), janelas baixadas em paralelo
+    # e pedidos idênticos simultâneos agrupados num único download.
+    # requests/urllib3 só são importados quando o primeiro cliente é criado (primeiro download).
+
+    def __init__(self, url_sgs=URL_SGS, trabalhadores=DOWNLOADS_SIMULTANEOS, timeout=10):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        self.url_sgs = url_sgs
+        self.timeout = timeout
+        self.erro_conexao = requests.exceptions.ConnectionError
+        self.session = requests.Session()
+        self.retry = Retry(total=3, backoff_factor=1, status_forcelist=[500, 502, 503, 504])
+        adapter = HTTPAdapter(pool_connections=trabalhadores, pool_maxsize=trabalhadores, max_retries=self.retry)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._pool = ThreadPoolExecutor(max_workers=trabalhadores, thread_name_prefix="sgs")
+        self._em_andamento = {}
+        self._trava = threading.Lock()
+
+    def _baixar_janela(self, codigo_serie, data_inicio, data_fim):
+        params = {
+            "formato": "json",
+            "dataInicial": data_inicio.strftime("%d/%m/%Y"),
+            "dataFinal": data_fim.strftime("%d/%m/%Y"),
+        }
+        diagnostico.contar("http_requisicoes")
+        try:
+            response = self.session.get(self.url_sgs.format(codigo=codigo_serie), params=params, timeout=self.timeout)
+            retries = getattr(getattr(response.raw, 'retries', None), 'history', ())
+            diagnostico.contar("http_retries", len(retries))
+            diagnostico.contar("bytes_baixados", len(response.content))
+            if response.status_code == 200:
+                return response.json() or []
+            # O SGS responde 404 quando não há dados no intervalo
+            if response.status_code == 404:
+                return []
+            return None
+        except self.erro_conexao:
+            diagnostico.contar("http_retries", self.retry.total)
+            return None
+        except Exception:
+            return None
+
+    def _baixar_blocos(self, codigo_serie, data_inicio, data_fim):
+        janelas = dividir_janelas(data_inicio, data_fim)
+        if len(janelas) == 1:
+            return self._baixar_janela(codigo_serie, data_inicio, data_fim)
+        baixar_janela = diagnostico.no_contexto(self._baixar_janela)
+        futuros = [self._pool.submit(baixar_janela, codigo_serie, ini, fim) for ini, fim in janelas]
+        dados = []
+        try:
+            for futuro in futuros:
+                bloco = futuro.result()
+                if bloco is None: return None
+                dados.extend(bloco)
+            return dados
+        finally:
+            # Numa falha, as janelas ainda na fila são canceladas e as já iniciadas terminam aqui:
+            # nenhuma requisição da série continua depois do retorno
+            for futuro in futuros: futuro.cancel()
+            wait(futuros)
+
+    def baixar(self, codigo_serie, data_inicio, data_fim):
+        # Retorna a lista [{'data': 'dd/mm/aaaa', 'valor': '...'}] ou None em caso de falha
+        chave = (codigo_serie, data_inicio, data_fim)
+        with self._trava:
+            futuro = self._em_andamento.get(chave)
+            dono = futuro is None
+            if dono:
+                futuro = Future()
+                self._em_andamento[chave] = futuro
+        if not dono:
+            return futuro.result()
+        try:
+            dados = self._baixar_blocos(codigo_serie, data_inicio, data_fim)
+            futuro.set_result(dados)
+            return dados
+        except BaseException as e:
+            futuro.set_exception(e)
+            raise
+        finally:
+            with self._trava:
+                self._em_andamento.pop(chave, None)
+
+_cliente = None
+_trava_cliente = threading.Lock()
+
+def cliente_padrao():
+    global _cliente
+    with _trava_cliente:
+        if _cliente is None:
+            _cliente = ClienteSGS(url_sgs=URL_SGS)
+        return _cliente
+
+def configurar_sgs(url_base, diretorio_cache=None):
+    # Aponta o cliente e o armazém padrão para outro servidor SGS (ex.: sgs_simulado em testes de
+    # carga), com um diretório de cache próprio para não misturar dados sintéticos aos do BCB.
+    # Chamar antes da primeira consulta.
+    global URL_SGS, DIRETORIO_CACHE, _cliente, _armazem
+    with _trava_cliente:
+        URL_SGS = url_base.rstrip("/") + "/dados/serie/bcdata.sgs.{codigo}/dados"
+        _cliente = None
+    with _trava_armazem:
+        if diretorio_cache: DIRETORIO_CACHE = diretorio_cache
+        _armazem = None
+
+def baixar_serie_sgs(codigo_serie, data_inicio, data_fim):
+    return cliente_padrao().baixar(codigo_serie, data_inicio, data_fim)
+
+def converter_fator(valor):
+    val_str = valor.replace(',', '.') if isinstance(valor, str) else str(valor)
+    return Decimal('1') + (Decimal(val_str) / Decimal('100'))
+
+# --- ÍNDICE DE FATORES ACUMULADOS ---
+
+class IndiceFatorAcumulado:
+    # Produtos acumulados (prefixos) da série: fator entre duas datas = uma divisão.
+    # Como o produto é invertível, o prefixo já responde qualquer intervalo (diário, mensal ou
+    # anual) com duas buscas, sem blocos intermediários; consultas repetidas ficam memorizadas.
+    PRECISAO = 40
+    LIMITE_MEMO = 65536
+
+    def __init__(self, datas, fatores):
+        pares = sorted(zip(datas, fatores), key=lambda p: p[0])
+        self.datas = [p[0] for p in pares]
+        self._arrays = None
+        self._memo = {}
+        self.acumulados = [Decimal('1')]
+        with localcontext() as ctx:
+            ctx.prec = self.PRECISAO
+            acumulado = Decimal('1')
+            for _, fator in pares:
+                acumulado *= fator
+                self.acumulados.append(acumulado)
+
+    def arrays(self):
+        # (ordinais das datas int64, acumulados como array de objetos) para consultas vetorizadas
+        if self._arrays is None:
+            self._arrays = (
+                np.fromiter((d.toordinal() for d in self.datas), dtype=np.int64, count=len(self.datas)),
+                np.array(self.acumulados, dtype=object),
+            )
+        return self._arrays
+
+    def fator_periodo(self, dt_ini, dt_fim):
+        chave = (dt_ini, dt_fim)
+        fator = self._memo.get(chave, False)
+        if fator is not False: return fator
+        i = bisect.bisect_left(self.datas, dt_ini)
+        j = bisect.bisect_right(self.datas, dt_fim)
+        fator = self.acumulados[j] / self.acumulados[i] if j > i else None
+        if len(self._memo) >= self.LIMITE_MEMO: self._memo.clear()
+        self._memo[chave] = fator
+        return fator
+
+# Índice de cada DataFrame de série, fora de df.attrs: o pandas copia attrs (em profundidade) a
+# cada operação que devolve um novo objeto, e o índice com todos os prefixos tornava lento até df['col'].
+# A chave é id(df) (DataFrame não é hashable); a entrada sai quando o DataFrame é coletado.
+_indices_series = {}
+
+def indice_da_serie(df_serie):
+    chave = id(df_serie)
+    indice = _indices_series.get(chave)
+    if indice is None:
+        novo = IndiceFatorAcumulado(df_serie['data_dt'], df_serie['fator_multi'])
+        indice = _indices_series.setdefault(chave, novo)
+        if indice is novo: weakref.finalize(df_serie, _indices_series.pop, chave, None)
+    return indice
+
+def calcular_fator_memoria(df_serie, dt_ini, dt_fim):
+    if df_serie is None or df_serie.empty: return None
+    return indice_da_serie(df_serie).fator_periodo(dt_ini, dt_fim)
+
+def montar_dataframe(pontos):
+    if not pontos: return pd.DataFrame()
+    df = pd.DataFrame(pontos, columns=['data_dt', 'valor'])
+    df['fator_multi'] = df['valor'].apply(converter_fator)
+    df = df[['data_dt', 'fator_multi']].copy()
+    indice_da_serie(df)
+    return df
+
+# --- ARMAZÉM PERSISTENTE (SQLITE) ---
+
+class ArmazemSeries:
+    # Guarda cada série SGS em disco e baixa apenas o trecho que falta (cabeça/cauda).
+    # A marca d'água de cada série é a data do último ponto publicado: o histórico até
+    # ela nunca é baixado de novo; o trecho posterior é revalidado após TTL_DADOS_ABERTOS.
+    # Se o BCB falhar, o que já está em disco é servido como última cópia válida
+    # (marcada como desatualizada) e a revalidação passa para segundo plano.
+
+    def __init__(self, diretorio=DIRETORIO_CACHE, baixar=baixar_serie_sgs, ttl_aberto=TTL_DADOS_ABERTOS,
+                 pausa_falha=PAUSA_APOS_FALHA):
+        self.diretorio = diretorio
+        self.caminho = os.path.join(diretorio, "series.sqlite")
+        self.baixar = baixar
+        self.ttl_aberto = ttl_aberto
+        self.pausa_falha = pausa_falha
+        self.falhou_em = None
+        self.ultima_falha = None
+        self._travas = {}
+        self._trava_global = threading.Lock()
+        self._tentativas = {}
+        self._revalidando = set()
+        self._pool_revalidacao = ThreadPoolExecutor(max_workers=2, thread_name_prefix="revalidar")
+        os.makedirs(diretorio, exist_ok=True)
+        with self._conectar() as con:
+            con.execute("CREATE TABLE IF NOT EXISTS pontos (codigo INTEGER, data TEXT, valor TEXT, PRIMARY KEY (codigo, data))")
+            con.execute("CREATE TABLE IF NOT EXISTS cobertura (codigo INTEGER PRIMARY KEY, inicio TEXT, fim TEXT, verificado_em TEXT)")
+
+    @contextmanager
+    def _conectar(self):
+        con = sqlite3.connect(self.caminho, timeout=30)
+        try:
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    def _trava(self, codigo):
+        with self._trava_global:
+            return self._travas.setdefault(codigo, threading.Lock())
+
+    def _cobertura(self, con, codigo):
+        linha = con.execute("SELECT inicio, fim, verificado_em FROM cobertura WHERE codigo = ?", (codigo,)).fetchone()
+        if linha is None: return None
+        return date.fromisoformat(linha[0]), date.fromisoformat(linha[1]), datetime.fromisoformat(linha[2])
+
+    def marca_dagua(self, codigo):
+        with self._conectar() as con:
+            linha = con.execute("SELECT MAX(data) FROM pontos WHERE codigo = ?", (codigo,)).fetchone()
+        return date.fromisoformat(linha[0]) if linha and linha[0] else None
+
+    def _gravar(self, codigo, dados, inicio, fim, verificado_em):
+        # Pontos e cobertura na mesma transação curta (o download ocorre fora dela)
+        registros = []
+        for item in dados:
+            dt = datetime.strptime(item['data'], "%d/%m/%Y").date()
+            valor = item['valor'].replace(',', '.') if isinstance(item['valor'], str) else str(item['valor'])
+            registros.append((codigo, dt.isoformat(), valor))
+        with self._conectar() as con:
+            con.executemany("INSERT OR REPLACE INTO pontos (codigo, data, valor) VALUES (?, ?, ?)", registros)
+            con.execute("INSERT OR REPLACE INTO cobertura VALUES (?, ?, ?, ?)",
+                        (codigo, inicio.isoformat(), fim.isoformat(), verificado_em.isoformat()))
+
+    def _sincronizar(self, codigo, data_inicio, data_fim):
+        # Número de downloads feitos (0 = atendido só pelo disco) ou None se o BCB falhar
+        agora = datetime.now()
+        with self._conectar() as con:
+            cobertura = self._cobertura(con, codigo)
+        if cobertura is None:
+            dados = self.baixar(codigo, data_inicio, data_fim)
+            if dados is None: return None
+            self._gravar(codigo, dados, data_inicio, data_fim, agora)
+            return 1
+
+        inicio, fim, verificado_em = cobertura
+        downloads = 0
+
+        # Cabeça: período anterior ao já armazenado
+        if data_inicio < inicio:
+            dados = self.baixar(codigo, data_inicio, inicio - timedelta(days=1))
+            if dados is None: return None
+            downloads += 1
+            inicio = data_inicio
+            self._gravar(codigo, dados, inicio, fim, verificado_em)
+
+        # Cauda: tudo após a marca d'água é dado aberto
+        aberto_desde = self._trecho_aberto(codigo, inicio, fim, verificado_em, data_fim, agora)
+        if aberto_desde is not None:
+            novo_fim = max(fim, data_fim)
+            dados = self.baixar(codigo, aberto_desde, novo_fim)
+            if dados is None: return None
+            downloads += 1
+            self._gravar(codigo, dados, inicio, novo_fim, agora)
+        return downloads
+
+    def _trecho_aberto(self, codigo, inicio, fim, verificado_em, data_fim, agora):
+        # Início do trecho a baixar de novo (após a marca d'água), ou None se o disco já atende até data_fim
+        marca = self.marca_dagua(codigo)
+        aberto_desde = max(marca + timedelta(days=1), inicio) if marca else inicio
+        expirado = (agora - verificado_em).total_seconds() > self.ttl_aberto
+        return aberto_desde if data_fim > fim or (data_fim >= aberto_desde and expirado) else None
+
+    def situacao_local(self, codigo, data_inicio, data_fim, offline=False):
+        # A situação que consultar devolveria (sem os pontos) quando o intervalo sai só do disco;
+        # None se consultar ainda iria ao BCB. Permite checar caches de resultado antes do download.
+        data_fim = min(data_fim, date.today())
+        if data_fim < data_inicio:
+            return {"codigo": codigo, "dados_ate": None, "verificado_em": None, "desatualizada": False}
+        with self._conectar() as con:
+            cobertura = self._cobertura(con, codigo)
+        if cobertura is None or cobertura[0] > data_inicio: return None
+        inicio, fim, verificado_em = cobertura
+        desatualizada = offline or self.bcb_fora_do_ar()
+        if not desatualizada and self._trecho_aberto(codigo, inicio, fim, verificado_em, data_fim, datetime.now()) is not None:
+            return None
+        return {"codigo": codigo, "dados_ate": self.marca_dagua(codigo), "verificado_em": verificado_em,
+                "desatualizada": desatualizada}
+
+    def _copia_local(self, codigo, data_inicio, data_fim):
+        # Última cópia válida do intervalo, ou None se o disco não cobre o início pedido
+        with self._conectar() as con:
+            cobertura = self._cobertura(con, codigo)
+            if cobertura is None or cobertura[0] > data_inicio: return None
+            linhas = con.execute(
+                "SELECT data, valor FROM pontos WHERE codigo = ? AND data >= ? AND data <= ? ORDER BY data",
+                (codigo, data_inicio.isoformat(), data_fim.isoformat()),
+            ).fetchall()
+        pontos = [(date.fromisoformat(d), v) for d, v in linhas]
+        return {"codigo": codigo, "pontos": pontos, "dados_ate": self.marca_dagua(codigo),
+                "verificado_em": cobertura[2], "desatualizada": False}
+
+    def bcb_fora_do_ar(self):
+        return self.falhou_em is not None
+
+    def _registrar_tentativa(self, codigo, sucesso):
+        agora = datetime.now()
+        with self._trava_global:
+            self._tentativas[codigo] = agora
+            self.falhou_em = None if sucesso else (self.falhou_em or agora)
+            if not sucesso: self.ultima_falha = agora
+
+    def _pausa_encerrada(self, codigo=None):
+        # Sem código: desde a última falha de qualquer série
+        ultima = self._tentativas.get(codigo) if codigo is not None else self.ultima_falha
+        return ultima is None or (datetime.now() - ultima).total_seconds() >= self.pausa_falha
+
+    def _revalidar_em_segundo_plano(self, codigo, data_inicio, data_fim):
+        # Uma revalidação por série de cada vez, no máximo uma a cada pausa_falha segundos
+        with self._trava_global:
+            if codigo in self._revalidando or not self._pausa_encerrada(codigo):
+                return
+            self._revalidando.add(codigo)
+
+        def revalidar():
+            try:
+                with self._trava(codigo):
+                    downloads = self._sincronizar(codigo, data_inicio, data_fim)
+                self._registrar_tentativa(codigo, downloads is not None)
+            finally:
+                with self._trava_global:
+                    self._revalidando.discard(codigo)
+        self._pool_revalidacao.submit(revalidar)
+
+    def consultar(self, codigo, data_inicio, data_fim, offline=False):
+        # {"pontos": [(date, valor_str)], "dados_ate", "verificado_em", "desatualizada"}, ou None
+        # quando o BCB falha e não há cópia local. Com offline=True a rede não é usada.
+        data_fim = min(data_fim, date.today())
+        if data_fim < data_inicio:
+            return {"codigo": codigo, "pontos": [], "dados_ate": None, "verificado_em": None, "desatualizada": False}
+
+        # BCB fora do ar: responde já com a cópia local, sem esperar retries/timeouts
+        if offline or self.bcb_fora_do_ar():
+            copia = self._copia_local(codigo, data_inicio, data_fim)
+            if copia is not None:
+                if not offline: self._revalidar_em_segundo_plano(codigo, data_inicio, data_fim)
+                diagnostico.contar("cache_hits")
+                return dict(copia, desatualizada=True)
+            # Sem cópia local: só volta a tentar em primeiro plano depois da pausa
+            if offline or not self._pausa_encerrada(): return None
+
+        with self._trava(codigo):
+            downloads = self._sincronizar(codigo, data_inicio, data_fim)
+        self._registrar_tentativa(codigo, downloads is not None)
+        if downloads is None:
+            copia = self._copia_local(codigo, data_inicio, data_fim)
+            return dict(copia, desatualizada=True) if copia else None
+        diagnostico.contar("cache_hits" if downloads == 0 else "cache_misses")
+        return self._copia_local(codigo, data_inicio, data_fim)
+
+    def obter(self, codigo, data_inicio, data_fim, offline=False):
+        # Lista [(date, valor_str)] ordenada no intervalo fechado, ou None se o BCB falhar
+        consulta = self.consultar(codigo, data_inicio, data_fim, offline)
+        return consulta["pontos"] if consulta else None
+
+    def limpar(self):
+        with self._trava_global, self._conectar() as con:
+            con.execute("DELETE FROM pontos")
+            con.execute("DELETE FROM cobertura")
+
+_armazem = None
+_trava_armazem = threading.Lock()
+
+def armazem_padrao():
+    # Com CALCJUS_PACOTE_SERIES as séries do pacote offline vêm dele, sem acesso ao BCB; só um
+    # código fora do pacote recorre ao armazém local
+    global _armazem
+    with _trava_armazem:
+        if _armazem is None:
+            if CAMINHO_PACOTE:
+                import pacote_series
+                _armazem = pacote_series.abrir_pacote(CAMINHO_PACOTE, reserva=ArmazemSeries(diretorio=DIRETORIO_CACHE))
+            else:
+                _armazem = ArmazemSeries(diretorio=DIRETORIO_CACHE)
+        return _armazem
+
+def obter_serie(codigo_serie, data_inicio, data_fim, armazem=None, offline=False):
+    # DataFrame [data_dt, fator_multi] com índice acumulado; None se o BCB falhar sem cópia local.
+    # df.attrs['situacao'] informa a data dos dados e se vieram da cópia desatualizada.
+    consulta = (armazem or armazem_padrao()).consultar(codigo_serie, data_inicio, data_fim, offline)
+    if consulta is None: return None
+    df = montar_dataframe(consulta.pop("pontos"))
+    df.attrs['situacao'] = consulta
+    return df
+
+def obter_series(janelas, armazem=None, offline=False):
+    # Várias séries em paralelo: [(codigo, inicio, fim)] -> [DataFrame ou None], na mesma ordem
+    with diagnostico.etapa("series_bcb"):
+        if len(janelas) <= 1:
+            return [obter_serie(*janela, armazem=armazem, offline=offline) for janela in janelas]
+        obter = diagnostico.no_contexto(lambda janela: obter_serie(*janela, armazem=armazem, offline=offline))
+        with ThreadPoolExecutor(max_workers=len(janelas), thread_name_prefix="series") as pool:
+            return list(pool.map(obter, janelas))
+
+def situacoes_locais(janelas, armazem=None, offline=False):
+    # [situação] de cada janela (codigo, inicio, fim) se todas saem do disco sem rede; None se
+    # alguma ainda seria baixada. A marca d'água (dados_ate) identifica os dados de cada série.
+    armazem = armazem or armazem_padrao()
+    situacoes = [armazem.situacao_local(*janela, offline=offline) for janela in janelas]
+    return None if any(s is None for s in situacoes) else situacoes
+
+def situacao_serie(df_serie):
+    if df_serie is None: return None
+    return df_serie.attrs.get('situacao')
+
+def descrever_situacao(situacao):
+    # Texto para tela e memorial: "dados até dd/mm/aaaa, consultados em dd/mm/aaaa hh:mm"
+    dados_ate = situacao["dados_ate"].strftime("%d/%m/%Y") if situacao.get("dados_ate") else "-"
+    verificado = situacao["verificado_em"].strftime("%d/%m/%Y %H:%M") if situacao.get("verificado_em") else "-"
+    texto = f"dados até {dados_ate}, consultados no BCB em {verificado}"
+    if situacao.get("pacote"):
+        texto += f", pacote offline {situacao['pacote']}"
+    if situacao.get("desatualizada"):
+        texto += " (BCB indisponível: última cópia válida)"
+    return texto
@@ -0,0 +1,143 @@
+import argparse
+import json
+import os
+import random
+import re
+import threading
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from dateutil.relativedelta import relativedelta
+
+# --- SERVIDOR SGS SIMULADO ---
+# Imita o formato JSON de api.bcb.gov.br para rodar app, lote e benchmarks sem rede.
+# Uso: python sgs_simulado.py --porta 8765
+#      CALCJUS_SGS_URL=http://127.0.0.1:8765 streamlit run app.py
+
+SERIES_DIARIAS = {11, 12, 1178}
+INICIO_SINTETICO = date(1995, 1, 1)
+ROTA = re.compile(r"^/dados/serie/bcdata\.sgs\.(\d+)/dados$")
+
+def serie_sintetica(codigo, data_inicio, data_fim, ate=None):
+    # Valores determinísticos por (código, data): mensais no dia 1º, diárias em dias úteis
+    ate = ate or date.today() - timedelta(days=1)
+    data_fim = min(data_fim, ate)
+    diaria = codigo in SERIES_DIARIAS
+    pontos = []
+    if diaria:
+        dt = max(data_inicio, INICIO_SINTETICO)
+    else:
+        dt = max(date(data_inicio.year, data_inicio.month, 1), INICIO_SINTETICO)
+        if dt < data_inicio: dt += relativedelta(months=1)
+    while dt <= data_fim:
+        if not diaria or dt.weekday() < 5:
+            rnd = random.Random(codigo * 1_000_003 + dt.toordinal())
+            valor = rnd.randint(1000, 6000) / 100000 if diaria else rnd.randint(-30, 160) / 100
+            pontos.append({"data": dt.strftime("%d/%m/%Y"), "valor": f"{valor:.6f}" if diaria else f"{valor:.2f}"})
+        dt = dt + timedelta(days=1) if diaria else dt + relativedelta(months=1)
+    return pontos
+
+class ServidorSGSSimulado:
+    def __init__(self, porta=0, host="127.0.0.1", gravacoes=None, limite_anos_diaria=10, atraso=0.0):
+        self.gravacoes = {}
+        self.limite_anos_diaria = limite_anos_diaria
+        self.atraso = atraso
+        self.fora_do_ar = False
+        self.requisicoes = []
+        self._trava = threading.Lock()
+        if gravacoes:
+            for nome in os.listdir(gravacoes):
+                if nome.endswith(".json") and nome[:-5].isdigit():
+                    with open(os.path.join(gravacoes, nome), encoding="utf-8") as f:
+                        self.gravacoes[int(nome[:-5])] = json.load(f)
+        self.httpd = ThreadingHTTPServer((host, porta), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, porta = self.httpd.server_address[:2]
+        return f"http://{host}:{porta}"
+
+    def dados(self, codigo, data_inicio, data_fim):
+        if codigo in self.gravacoes:
+            return [p for p in self.gravacoes[codigo]
+                    if data_inicio <= datetime.strptime(p["data"], "%d/%m/%Y").date() <= data_fim]
+        return serie_sintetica(codigo, data_inicio, data_fim)
+
+    def _handler(self):
+        servidor = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _responder(self, status, corpo):
+                conteudo = json.dumps(corpo).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(conteudo)))
+                self.end_headers()
+                self.wfile.write(conteudo)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                rota = ROTA.match(url.path)
+                if not rota:
+                    return self._responder(404, {"erro": "rota inexistente"})
+                codigo = int(rota.group(1))
+                params = parse_qs(url.query)
+                with servidor._trava:
+                    servidor.requisicoes.append((codigo, params.get("dataInicial", [""])[0], params.get("dataFinal", [""])[0]))
+                if servidor.atraso:
+                    threading.Event().wait(servidor.atraso)
+                if servidor.fora_do_ar:
+                    return self._responder(503, {"erro": "Serviço indisponível"})
+                try:
+                    d1 = datetime.strptime(params["dataInicial"][0], "%d/%m/%Y").date()
+                    d2 = datetime.strptime(params["dataFinal"][0], "%d/%m/%Y").date()
+                except (KeyError, ValueError):
+                    return self._responder(400, {"erro": "dataInicial/dataFinal inválidas"})
+                if codigo in SERIES_DIARIAS and d2 >= d1 + relativedelta(years=servidor.limite_anos_diaria):
+                    return self._responder(406, {"erro": f"O sistema aceita uma janela de consulta de, no máximo, {servidor.limite_anos_diaria} anos em séries de periodicidade diária"})
+                pontos = servidor.dados(codigo, d1, d2)
+                if not pontos:
+                    return self._responder(404, {"erro": "Valor(es) não encontrado(s)"})
+                return self._responder(200, pontos)
+
+        return Handler
+
+    def iniciar(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="sgs-simulado", daemon=True)
+        self._thread.start()
+        return self
+
+    def parar(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.iniciar()
+
+    def __exit__(self, *exc):
+        self.parar()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor local que imita a API SGS do BCB")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--gravacoes", default=None, help="Diretório com <codigo>.json no formato SGS")
+    parser.add_argument("--atraso", type=float, default=0.0, help="Latência artificial por requisição (s)")
+    args = parser.parse_args(argv)
+    servidor = ServidorSGSSimulado(args.porta, args.host, args.gravacoes, atraso=args.atraso)
+    print(f"SGS simulado em {servidor.url}")
+    try:
+        servidor.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.httpd.server_close()
+
+if __name__ == "__main__":
+    main()
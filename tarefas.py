@@ -0,0 +1,197 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+# --- TAREFAS EM SEGUNDO PLANO ---
+# Cálculos longos (pensão grande, SELIC diária, BCB lento) rodam num conjunto fixo de threads
+# do processo, fora do script do Streamlit: um rerun (qualquer widget tocado) não perde o
+# trabalho, porque a sessão só guarda o id da tarefa e volta a consultá-la. A função da tarefa
+# recebe a própria Tarefa e chama tarefa.progresso(feitos, total) a cada bloco de linhas; cada
+# chamada é também o ponto em que um pedido de cancelamento interrompe o cálculo.
+# Justiça entre usuários: cada dono (sessão) tem sua fila e as threads atendem os donos em
+# rodízio, então uma sessão com muitas tarefas não segura o conjunto inteiro. A tarefa que
+# substitui outra ainda em andamento só entra na fila quando a anterior termina: nenhuma
+# thread fica parada esperando.
+
+TRABALHADORES = int(os.environ.get("CALCJUS_TRABALHADORES_TAREFAS", min(4, os.cpu_count() or 1)))
+RETER_SEGUNDOS = 3600
+
+NA_FILA, EXECUTANDO, CONCLUIDA, CANCELADA, FALHOU = "na_fila", "executando", "concluida", "cancelada", "falhou"
+FINALIZADAS = (CONCLUIDA, CANCELADA, FALHOU)
+
+class TarefaCancelada(Exception):
+    pass
+
+class Tarefa:
+    def __init__(self, dono, nome, funcao, args):
+        self.id = uuid.uuid4().hex
+        self.dono = dono
+        self.nome = nome
+        self.funcao = funcao
+        self.args = args
+        self.estado = NA_FILA
+        self.feitos = 0
+        self.total = None
+        self.etapa = None
+        self.criada_em = time.monotonic()
+        self.iniciada_em = None
+        self.finalizada_em = None
+        self.resultado = None
+        self.erro = None
+        self._cancelar = threading.Event()
+        self._fim = threading.Event()
+
+    def progresso(self, feitos, total=None, etapa=None):
+        # Chamado pela função da tarefa; interrompe o cálculo se o cancelamento foi pedido
+        if self._cancelar.is_set():
+            raise TarefaCancelada()
+        self.feitos = feitos
+        if total is not None: self.total = total
+        if etapa is not None: self.etapa = etapa
+
+    def cancelar(self):
+        self._cancelar.set()
+
+    def cancelamento_pedido(self):
+        return self._cancelar.is_set()
+
+    def finalizada(self):
+        return self.estado in FINALIZADAS
+
+    def aguardar(self, timeout=None):
+        return self._fim.wait(timeout)
+
+    def fracao(self):
+        if self.estado == CONCLUIDA: return 1.0
+        if not self.total: return 0.0
+        return min(self.feitos / self.total, 1.0)
+
+    def segundos_restantes(self):
+        # ETA linear pelo ritmo desde o início; None enquanto não há linha feita
+        if self.estado != EXECUTANDO or not self.total or not self.feitos: return None
+        decorrido = time.monotonic() - self.iniciada_em
+        return decorrido / self.feitos * (self.total - self.feitos)
+
+    def descrever(self):
+        if self.estado == NA_FILA: return "Na fila..."
+        if self.estado != EXECUTANDO: return self.estado
+        partes = [self.etapa or "Calculando"]
+        if self.total:
+            partes.append(f"{self.feitos}/{self.total} linhas")
+        restante = self.segundos_restantes()
+        if restante is not None:
+            partes.append(f"~{restante:.0f} s restantes")
+        return " · ".join(partes)
+
+    def _executar(self):
+        if self._cancelar.is_set():
+            self._finalizar(CANCELADA)
+            return
+        self.estado = EXECUTANDO
+        self.iniciada_em = time.monotonic()
+        try:
+            self.resultado = self.funcao(self, *self.args)
+        except TarefaCancelada:
+            self._finalizar(CANCELADA)
+        except Exception as e:
+            self.erro = e
+            self._finalizar(FALHOU)
+        else:
+            self._finalizar(CONCLUIDA)
+
+    def _finalizar(self, estado):
+        self.finalizada_em = time.monotonic()
+        self.estado = estado
+        self.funcao = self.args = None
+        self._fim.set()
+
+class FilaTarefas:
+    # Threads criadas na primeira tarefa; filas por dono atendidas em rodízio
+
+    def __init__(self, trabalhadores=TRABALHADORES, reter_segundos=RETER_SEGUNDOS):
+        self.trabalhadores = max(1, trabalhadores)
+        self.reter_segundos = reter_segundos
+        self._filas = OrderedDict()
+        self._tarefas = {}
+        self._aguardando = {}  # id da tarefa substituída -> tarefas que entram na fila quando ela terminar
+        self._cond = threading.Condition()
+        self._threads = []
+
+    def enviar(self, dono, nome, funcao, *args, substitui=None):
+        # substitui: id de uma tarefa anterior do mesmo dono, cancelada e aguardada antes desta
+        anterior = self.cancelar(substitui) if substitui else None
+        tarefa = Tarefa(dono, nome, funcao, args)
+        with self._cond:
+            self._descartar_antigas()
+            self._tarefas[tarefa.id] = tarefa
+            if anterior is not None and not anterior.finalizada():
+                self._aguardando.setdefault(anterior.id, []).append(tarefa)
+            else:
+                self._enfileirar(tarefa)
+        return tarefa
+
+    def _enfileirar(self, tarefa):
+        # Chamado com self._cond adquirido
+        self._filas.setdefault(tarefa.dono, deque()).append(tarefa)
+        if len(self._threads) < self.trabalhadores:
+            thread = threading.Thread(target=self._trabalhar, name=f"tarefa-{len(self._threads)}", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+        self._cond.notify()
+
+    def obter(self, id_tarefa):
+        with self._cond:
+            return self._tarefas.get(id_tarefa)
+
+    def cancelar(self, id_tarefa):
+        tarefa = self.obter(id_tarefa)
+        if tarefa is not None: tarefa.cancelar()
+        return tarefa
+
+    def aguardar_todas(self, timeout=None):
+        with self._cond:
+            pendentes = [t for t in self._tarefas.values() if not t.finalizada()]
+        return all(t.aguardar(timeout) for t in pendentes)
+
+    def situacao(self):
+        with self._cond:
+            estados = [t.estado for t in self._tarefas.values()]
+            return {"trabalhadores": len(self._threads), "donos_na_fila": len(self._filas),
+                    **{estado: estados.count(estado) for estado in (NA_FILA, EXECUTANDO, CONCLUIDA, CANCELADA, FALHOU)}}
+
+    def _descartar_antigas(self):
+        # Tarefas finalizadas há mais de reter_segundos (resultado já lido ou abandonado) saem da memória
+        limite = time.monotonic() - self.reter_segundos
+        for id_tarefa in [i for i, t in self._tarefas.items() if t.finalizada() and t.finalizada_em < limite]:
+            del self._tarefas[id_tarefa]
+
+    def _proxima(self):
+        with self._cond:
+            while not self._filas:
+                self._cond.wait()
+            dono, fila = next(iter(self._filas.items()))
+            tarefa = fila.popleft()
+            # O dono atendido vai para o fim do rodízio
+            del self._filas[dono]
+            if fila: self._filas[dono] = fila
+            return tarefa
+
+    def _trabalhar(self):
+        while True:
+            tarefa = self._proxima()
+            tarefa._executar()
+            with self._cond:
+                for seguinte in self._aguardando.pop(tarefa.id, []):
+                    self._enfileirar(seguinte)
+
+_fila = None
+_trava_fila = threading.Lock()
+
+def fila_padrao():
+    global _fila
+    with _trava_fila:
+        if _fila is None:
+            _fila = FilaTarefas()
+        return _fila
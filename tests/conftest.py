@@ -0,0 +1,30 @@
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+# Módulos do app ficam na raiz do repositório (sem pacote)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import series_bcb
+from sgs_simulado import ServidorSGSSimulado, serie_sintetica
+
+
+def serie_sintetica_df(codigo, inicio, fim):
+    # Mesmo DataFrame de series_bcb.obter_serie, com os pontos determinísticos do sgs_simulado
+    pontos = [(datetime.strptime(p["data"], "%d/%m/%Y").date(), p["valor"])
+              for p in serie_sintetica(codigo, inicio, fim, ate=fim)]
+    return series_bcb.montar_dataframe(pontos)
+
+
+@pytest.fixture
+def serie_df():
+    return serie_sintetica_df
+
+
+@pytest.fixture
+def sgs():
+    # SGS simulado em porta efêmera; derrubado ao fim do teste
+    with ServidorSGSSimulado() as servidor:
+        yield servidor
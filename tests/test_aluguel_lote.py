@@ -0,0 +1,81 @@
+import os
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+import aluguel_lote
+import motor_calculo as motor
+from calculo_lote import centavos
+
+TABELA_TJSP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tabela_tjsp.csv")
+
+# Vários dias do mesmo mês (inclusive o 1º e o último), 29/02 e um mês ainda sem índice
+CONTRATOS = [
+    ("a", Decimal("2000.00"), 189, date(2024, 3, 1)),
+    ("b", Decimal("3150.50"), 189, date(2024, 3, 15)),
+    ("c", Decimal("1800.00"), 189, date(2024, 3, 31)),
+    ("d", Decimal("2500.00"), 433, date(2024, 3, 10)),
+    ("e", Decimal("2500.00"), 433, date(2024, 2, 29)),
+    ("f", Decimal("990.99"), 188, date(2024, 11, 5)),
+    ("g", Decimal("4100.00"), -1, date(2024, 6, 1)),
+    ("h", Decimal("4100.00"), -1, date(2024, 6, 20)),
+    ("i", Decimal("5000.00"), 11, date(2024, 8, 7)),
+    ("j", Decimal("5000.00"), 11, date(2024, 8, 28)),
+    ("k", Decimal("1200.00"), 189, date(2031, 1, 10)),
+]
+
+
+@pytest.fixture
+def series_sinteticas(monkeypatch, serie_df):
+    # Séries sintéticas no lugar do BCB, registrando as consultas
+    pedidas = []
+
+    def obter_series(janelas, armazem=None, offline=False):
+        pedidas.extend(janelas)
+        return [serie_df(cod, inicio, fim) for cod, inicio, fim in janelas]
+
+    monkeypatch.setattr(aluguel_lote.series_bcb, "obter_series", obter_series)
+    return pedidas
+
+
+def test_grupos_iguais_ao_calculo_por_contrato(series_sinteticas, serie_df):
+    calc_tjsp = motor.CalculadoraTJSP(arquivo_padrao=TABELA_TJSP)
+    linhas, fatores, _ = aluguel_lote.reajustar_contratos(CONTRATOS, calc_tjsp)
+    # Um fator por (índice, mês do reajuste) e uma consulta por série
+    assert len(fatores) == 7
+    assert sorted(cod for cod, _, _ in series_sinteticas) == [11, 188, 189, 433]
+
+    series = {cod: serie_df(cod, date(2022, 1, 1), date(2024, 12, 31)) for cod in (11, 188, 189, 433)}
+    for (caso_id, valor, cod, dt_reaj), linha in zip(CONTRATOS, linhas):
+        caso = {"id": caso_id, "tipo": "aluguel", "valor": valor, "codigo_indice": cod, "data_reajuste": dt_reaj,
+                "data_calculo": dt_reaj, "multa_523": False, "hon_523": False}
+        dados = motor.calcular_caso(caso, series, calc_tjsp)["dados_aluguel"]
+        assert linha["id"] == caso_id and linha["data_reajuste"] == dt_reaj.strftime("%d/%m/%Y")
+        if dados is None:
+            assert (linha["fator"], linha["novo_valor"], linha["erro"]) == ("", "", "índice sem dados para o período")
+            continue
+        assert linha["periodo"] == dados["periodo"]
+        assert linha["fator"] == motor.formatar_decimal_str(dados["fator"])
+        assert linha["novo_valor"] == centavos(dados["novo_valor"]) and linha["erro"] == ""
+    assert [l["erro"] != "" for l in linhas] == [caso_id == "k" for caso_id, *_ in CONTRATOS]
+
+
+def test_blocos_tipados_com_o_fator_exato_do_grupo(series_sinteticas):
+    calc_tjsp = motor.CalculadoraTJSP(arquivo_padrao=TABELA_TJSP)
+    _, fatores, _ = aluguel_lote.reajustar_contratos(CONTRATOS, calc_tjsp)
+    colunas = [c for bloco in aluguel_lote.blocos_tipados(CONTRATOS, fatores, tamanho=4) for c in zip(*bloco)]
+    assert [c[0] for c in colunas] == [caso_id for caso_id, *_ in CONTRATOS]
+    a, b, c = colunas[:3]
+    assert a[5] == b[5] == c[5] == fatores[aluguel_lote.grupo(189, date(2024, 3, 1))]
+    assert a[3] == date(2023, 3, 31) and a[6] == int(centavos(Decimal("2000.00") * a[5]).replace(".", ""))
+    assert colunas[-1][5] is None and colunas[-1][6] is None
+
+
+def test_ler_contratos_no_aniversario():
+    registros = [{"id": "1", "valor": "1.500,00", "indice": "IGP-M", "inicio_contrato": "2020-02-29"},
+                 {"id": "2", "valor": "900", "indice": "IPCA", "data_reajuste": "15/07/2025"},
+                 {"id": "3", "valor": "900", "indice": "IPCA"}]
+    contratos, invalidos = aluguel_lote.ler_contratos(registros, ano=2025)
+    assert contratos == [("1", Decimal("1500.00"), 189, date(2025, 2, 28)), ("2", Decimal("900"), 433, date(2025, 7, 15))]
+    assert invalidos == ["linha 3: informe data_reajuste ou inicio_contrato com o ano do reajuste"]
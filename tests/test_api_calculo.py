@@ -0,0 +1,100 @@
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+from decimal import Decimal
+
+import pytest
+
+import api_calculo
+
+TABELA_TJSP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tabela_tjsp.csv")
+
+
+@pytest.fixture
+def api():
+    servidor = api_calculo.ServidorAPI(("127.0.0.1", 0), api_calculo.Handler)
+    thread = threading.Thread(target=servidor.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{servidor.server_address[1]}"
+    servidor.shutdown()
+    servidor.server_close()
+
+
+def postar(url, corpo):
+    requisicao = urllib.request.Request(url, data=json.dumps(corpo).encode(), method="POST")
+    try:
+        with urllib.request.urlopen(requisicao, timeout=10) as resposta:
+            return resposta.status, json.load(resposta)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+
+@pytest.mark.parametrize("rota", ["/lote", "/calcular", "/calcular/pensao", "/art523"])
+@pytest.mark.parametrize("corpo", [[{"tipo": "pensao"}], "texto", 42, None])
+def test_corpo_que_nao_e_objeto_retorna_400(api, rota, corpo):
+    status, resposta = postar(api + rota, corpo)
+    assert status == 400
+    assert "objeto JSON" in resposta["erro"]
+
+
+def test_lote_sem_lista_de_casos_retorna_400(api):
+    status, resposta = postar(api + "/lote", {"casos": {"tipo": "pensao"}})
+    assert status == 400
+    assert "casos" in resposta["erro"]
+
+
+@pytest.mark.parametrize("periodo", [{}, {"inicio": "2023-01-01"}, {"fim": "2023-06-01"}])
+def test_pensao_sem_periodo_e_caso_invalido(api, periodo):
+    status, resposta = postar(api + "/calcular/pensao", {"valor": "1000", "indice": "433", **periodo})
+    assert status == 400
+    assert resposta["erro"] == "caso inválido: pensão requer inicio e fim"
+
+
+def test_lote_com_casos_invalidos_calcula_os_validos(api, monkeypatch, serie_df):
+    monkeypatch.setitem(api_calculo._estado, "tabela_tjsp", TABELA_TJSP)
+    monkeypatch.setitem(api_calculo._estado, "calc_tjsp", None)
+    pedidas = []
+
+    def obter_series(janelas, armazem=None):
+        pedidas.extend(janelas)
+        return [serie_df(cod, inicio, fim) for cod, inicio, fim in janelas]
+
+    monkeypatch.setattr(api_calculo.series_bcb, "obter_series", obter_series)
+    casos = [
+        {"id": "ind", "tipo": "indenizacao", "indice": "IPCA", "valor": "1500", "inicio": "2021-03-15", "fim": "2022-06-20",
+         "data_calculo": "2024-05-10"},
+        {"id": "sem_fim", "tipo": "indenizacao", "indice": "IPCA", "valor": "1500", "inicio": "2021-03-15"},
+        # Normaliza, mas a janela da série não se monta
+        {"id": "parcela_sem_vencimento", "tipo": "pensao", "indice": "INPC", "parcelas": [{"devido": "100"}]},
+        {"id": "hon", "tipo": "honorarios", "indice": "INPC", "valor": "2500", "data_fixacao": "2020-02-01",
+         "data_calculo": "2024-05-10"},
+    ]
+    status, resposta = postar(api + "/lote", {"casos": casos})
+    assert status == 200 and resposta["erros"] == 2
+    ind, sem_fim, sem_vencimento, hon = resposta["resultados"]
+    assert (ind["id"], hon["id"]) == ("ind", "hon") and "erro" not in ind and "erro" not in hon
+    assert Decimal(ind["total"]) > 0 and Decimal(hon["total"]) > 0
+    assert sem_fim == {"id": "sem_fim", "erro": "caso inválido: indenização requer inicio e fim"}
+    assert sem_vencimento["id"] == "parcela_sem_vencimento" and sem_vencimento["erro"].startswith("caso inválido")
+    # Só as séries dos casos válidos são consultadas (IPCA e INPC)
+    assert sorted(cod for cod, _, _ in pedidas) == [188, 433]
+
+
+def obter(url):
+    with urllib.request.urlopen(url, timeout=10) as resposta:
+        return resposta.status, resposta.read().decode("utf-8")
+
+
+def test_art523_e_metricas_por_rota(api):
+    status, resposta = postar(api + "/art523", {"subtotal": "1000.00", "multa_523": True, "hon_523": True})
+    assert status == 200 and Decimal(resposta["final"]) == Decimal("1200.00")
+    postar(api + "/rota-que-nao-existe", {})
+    status, texto = obter(api + "/metricas")
+    assert status == 200
+    assert 'calcjus_api_latencia_segundos_bucket{rota="/art523",worker="0",le="+Inf"}' in texto
+    assert 'rota="/rota-que-nao-existe"' not in texto and 'rota="outras"' in texto
+    status, texto = obter(api + "/metricas.json")
+    rotas = json.loads(texto)["rotas"]
+    assert rotas["/art523"]["requisicoes"] >= 1 and rotas["/art523"]["p95_ms"] is not None
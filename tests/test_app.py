@@ -0,0 +1,29 @@
+import os
+from datetime import date
+
+from streamlit.testing.v1 import AppTest
+
+import series_bcb
+import tarefas
+
+ARQUIVO_APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.py')
+
+
+def test_pensao_baixa_a_serie_uma_vez(monkeypatch, tmp_path, sgs):
+    # App contra o SGS simulado, com o armazém num diretório temporário
+    monkeypatch.setattr(series_bcb, '_cliente', series_bcb.ClienteSGS(url_sgs=sgs.url + "/dados/serie/bcdata.sgs.{codigo}/dados"))
+    monkeypatch.setattr(series_bcb, '_armazem', series_bcb.ArmazemSeries(str(tmp_path)))
+    at = AppTest.from_file(ARQUIVO_APP, default_timeout=60).run()
+    indice = next(s for s in at.selectbox if s.label == 'Índice Pensão')
+    indice.set_value('INPC (IBGE) - 188')
+    next(d for d in at.date_input if d.label == 'Fim').set_value(date(2024, 12, 1)).run()
+    next(b for b in at.button if b.label == '1. Gerar Tabela').click().run()
+    sgs.requisicoes.clear()
+    next(b for b in at.button if b.label == '2. Calcular Saldo').click().run()
+    # O cálculo roda na fila de tarefas; o rerun seguinte leva o resultado à sessão
+    tarefas.fila_padrao().aguardar_todas(60)
+    at.run()
+    parcelas = len(at.session_state.df_pensao_input)
+    assert parcelas == 24
+    assert [r[0] for r in sgs.requisicoes] == [188]
+    assert len(list(at.session_state.df_pensao_final.linhas())) == parcelas
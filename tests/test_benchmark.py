@@ -0,0 +1,29 @@
+import json
+
+import benchmark
+
+
+def test_main_grava_json_com_todas_as_etapas(tmp_path):
+    saida = tmp_path / "bench.json"
+    assert benchmark.main(["--tamanhos", "12", "--repeticoes", "1", "--saida", str(saida)]) == 0
+    relatorio = json.loads(saida.read_text(encoding="utf-8"))
+    etapas = [r["etapa"] for r in relatorio["resultados"]]
+    assert len(etapas) == len(set(etapas))
+    assert {"cronograma_pro_rata", "indenizacao_misto_decimal", "indenizacao_misto_colunas", "pdf_relatorio"} <= set(etapas)
+    for r in relatorio["resultados"]:
+        assert r["tamanho"] == 12 and 0 <= r["segundos_min"] <= r["segundos_mediana"] and r["pico_memoria_bytes"] > 0
+    assert relatorio["repeticoes"] == 1 and relatorio["pontos_serie_diaria"] > 0
+
+
+def test_filtro_de_etapas():
+    relatorio = benchmark.executar([12, 120], 1, filtro=["tjsp"])
+    assert [(r["etapa"], r["tamanho"]) for r in relatorio["resultados"]] == [
+        ("tjsp_carga_fria", 12), ("tjsp_carga_cache", 12), ("tjsp_carga_fria", 120), ("tjsp_carga_cache", 120)]
+
+
+def test_partida_sem_carregar_pdf_nem_http(tmp_path, monkeypatch):
+    # O app roda num processo novo; o armazém de séries fica no diretório temporário
+    monkeypatch.setenv("CALCJUS_CACHE_DIR", str(tmp_path))
+    medida = benchmark.medir_partida(1)
+    assert medida["modulos_carregados_na_partida"] == {"fpdf": False, "requests": False, "urllib3": False}
+    assert medida["primeira_execucao_segundos"] > 0 and medida["interacao_calculo_segundos"] > 0
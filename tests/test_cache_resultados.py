@@ -0,0 +1,106 @@
+import os
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+
+import cache_resultados
+import motor_calculo as motor
+
+SITUACAO = {"dados_ate": date(2024, 5, 1), "verificado_em": datetime(2024, 6, 2, 10, 0), "desatualizada": False}
+ENTRADAS = dict(inicio=date(2020, 3, 15), fim=date(2023, 6, 20), valor_mensal=Decimal("1500.00"), regime=motor.REGIME_MISTO,
+                indice=433, data_calculo=date(2024, 6, 1), citacao=date(2020, 5, 1), corte=date(2021, 12, 9),
+                juros_fase1=True, hash_tjsp="a" * 64, situacoes={"indice": SITUACAO, "selic": SITUACAO})
+
+
+def chave(**mudancas):
+    return cache_resultados.chave_indenizacao(**dict(ENTRADAS, **mudancas))
+
+
+# --- CHAVE ---
+
+@pytest.mark.parametrize("mudancas", [
+    {"inicio": date(2020, 3, 16)},
+    {"fim": date(2023, 6, 21)},
+    {"valor_mensal": Decimal("1500.01")},
+    {"regime": motor.REGIME_INDICE},
+    {"indice": 188},
+    {"data_calculo": date(2024, 6, 2)},
+    {"citacao": None},
+    {"corte": date(2021, 12, 8)},
+    {"juros_fase1": False},
+    # Nova publicação no BCB (marca d'água), série vinda de um pacote offline ou indisponível
+    {"situacoes": {"indice": dict(SITUACAO, dados_ate=date(2024, 6, 1)), "selic": SITUACAO}},
+    {"situacoes": {"indice": SITUACAO, "selic": dict(SITUACAO, pacote="0123456789abcdef")}},
+    {"situacoes": {"indice": SITUACAO, "selic": None}},
+    {"situacoes": {"indice": SITUACAO}},
+    # Outra Tabela TJSP só importa quando ela é o índice
+    {"indice": -1, "hash_tjsp": "b" * 64},
+], ids=lambda m: "-".join(m))
+def test_mudar_qualquer_parte_da_chave_e_falta(mudancas):
+    cache = cache_resultados.CacheResultados()
+    cache.guardar(chave(), "guardado")
+    assert cache.obter(chave()) == "guardado"
+    assert chave(**mudancas) != chave()
+    assert cache.obter(chave(**mudancas)) is None
+
+
+def test_tabela_tjsp_com_tjsp_como_indice():
+    assert chave(indice=-1, hash_tjsp="b" * 64) != chave(indice=-1)
+    # Com outro índice a tabela não entra no cálculo, nem na chave
+    assert chave(hash_tjsp="b" * 64) == chave()
+
+
+def test_chave_ignora_o_que_nao_muda_o_calculo():
+    # Mesmo valor com outra escala e a hora da última verificação no BCB
+    assert chave(valor_mensal=Decimal("1500")) == chave()
+    assert chave(situacoes={"indice": dict(SITUACAO, verificado_em=datetime(2024, 6, 3)), "selic": SITUACAO}) == chave()
+
+
+# --- LRU EM MEMÓRIA ---
+
+def test_lru_descarta_o_menos_usado():
+    cache = cache_resultados.CacheResultados(max_itens=2)
+    cache.guardar("a", 1)
+    cache.guardar("b", 2)
+    assert cache.obter("a") == 1  # "a" passa a ser o mais recente
+    cache.guardar("c", 3)
+    assert (cache.obter("a"), cache.obter("b"), cache.obter("c")) == (1, None, 3)
+
+
+def test_lru_limitado_por_bytes():
+    grande = "x" * 1000
+    cache = cache_resultados.CacheResultados(max_bytes=2500)
+    for k in range(3):
+        cache.guardar(k, grande)
+    assert cache.obter(0) is None and cache.obter(1) == cache.obter(2) == grande
+    # Um item maior que o limite inteiro não é guardado (nem derruba os outros)
+    cache.guardar("enorme", "x" * 5000)
+    assert cache.obter("enorme") is None and cache.obter(2) == grande
+
+
+# --- NÍVEL EM DISCO ---
+
+def test_disco_sobrevive_a_outro_processo(tmp_path):
+    cache_resultados.CacheResultados(diretorio=str(tmp_path)).guardar(chave(), {"total": Decimal("123.45")})
+    novo = cache_resultados.CacheResultados(diretorio=str(tmp_path))
+    assert novo.obter(chave()) == {"total": Decimal("123.45")}
+    assert novo.obter(chave(juros_fase1=False)) is None
+
+
+def test_disco_poda_os_arquivos_menos_usados(tmp_path):
+    cache = cache_resultados.CacheResultados(diretorio=str(tmp_path), max_itens_disco=2)
+    for k, nome in enumerate(("a", "b")):
+        cache.guardar(nome, nome)
+        os.utime(tmp_path / f"{nome}.pkl", (1_000_000 + k, 1_000_000 + k))
+    # Leitura pelo disco renova o arquivo: "a" fica e "b" sai quando "c" entra
+    assert cache_resultados.CacheResultados(diretorio=str(tmp_path)).obter("a") == "a"
+    cache.guardar("c", "c")
+    assert sorted(os.listdir(tmp_path)) == ["a.pkl", "c.pkl"]
+
+
+def test_limpar_esvazia_memoria_e_disco(tmp_path):
+    cache = cache_resultados.CacheResultados(diretorio=str(tmp_path))
+    cache.guardar("a", 1)
+    cache.limpar()
+    assert cache.obter("a") is None and os.listdir(tmp_path) == []
@@ -0,0 +1,106 @@
+import csv
+import os
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+import calculo_lote
+import motor_calculo as motor
+
+TABELA_TJSP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tabela_tjsp.csv")
+
+CASOS = [
+    {"id": "ind", "tipo": "indenizacao", "regime": "misto", "indice": "IPCA", "valor": "1500", "inicio": "2019-03-15",
+     "fim": "2023-06-20", "data_calculo": "2024-05-10"},
+    {"id": "hon", "tipo": "honorarios", "indice": "INPC", "valor": "2500", "data_fixacao": "2020-02-01", "data_calculo": "2024-05-10"},
+    {"id": "pen", "tipo": "pensao", "indice": "IPCA", "valor": "800", "inicio": "2021-01-05", "fim": "2022-12-05",
+     "data_calculo": "2024-05-10", "pagamentos": [{"data": "2021-06-10", "valor": "1000"}]},
+    {"id": "alu", "tipo": "aluguel", "indice": "IGP-M", "valor": "3200", "data_reajuste": "2024-03-01", "data_calculo": "2024-05-10"},
+]
+
+
+@pytest.fixture
+def lote(serie_df):
+    casos = [motor.normalizar_caso(bruto) for bruto in CASOS]
+    series = {}
+    for caso in casos:
+        for codigo, inicio, fim in motor.janelas_caso(caso):
+            series[codigo] = serie_df(codigo, date(2015, 1, 1), max(fim, date(2024, 6, 1)))
+    return casos, series
+
+
+def test_exatas_tem_as_chaves_das_linhas(lote):
+    casos, series = lote
+    for caso in casos:
+        res = motor.calcular_caso(caso, series, motor.CalculadoraTJSP(arquivo_padrao=TABELA_TJSP), exatas=True)
+        assert res["linhas"], caso["id"]
+        assert len(res["exatas"]) == len(res["linhas"])
+        for linha, exata in zip(res["linhas"], res["exatas"]):
+            assert set(exata) == set(linha) - {"_num", "data_sort"}
+            assert exata["TOTAL"] == linha["_num"]
+    assert "exatas" not in motor.calcular_caso(casos[0], series, motor.CalculadoraTJSP(arquivo_padrao=TABELA_TJSP))
+
+
+def test_parcelas_tipadas_sem_arredondar_fatores(lote):
+    casos, series = lote
+    resultados = list(calculo_lote.calcular_lote(casos, series, TABELA_TJSP, processos=1, exatas=True))
+    (colunas,) = calculo_lote.blocos_parcelas(resultados)
+    por_nome = dict(zip((nome for nome, _ in calculo_lote.ESQUEMA_PARCELAS), colunas))
+
+    exatas = [e for res in resultados for e in res["exatas"]]
+    fatores = [e.get("Audit Fator CM", e.get("Fator CM", e.get("Audit Fator"))) for e in exatas]
+    obtidos = [a or b or c for a, b, c in zip(por_nome["audit_fator_cm"], por_nome["fator_cm"], por_nome["audit_fator"])]
+    assert obtidos == fatores
+    # Fatores com mais de 6 casas chegam inteiros à exportação
+    assert any(f is not None and -f.as_tuple().exponent > 6 for f in obtidos)
+    assert por_nome["valor_num"] == [e["TOTAL"] for e in exatas]
+    assert por_nome["total_centavos"] == [int(l["TOTAL"].replace("R$ ", "").replace(".", "").replace(",", ""))
+                                          for res in resultados for l in res["linhas"]]
+    assert por_nome["vencimento"][0] == date(2019, 3, 15)
+
+
+def test_escrever_resultados_parquet(lote, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    casos, series = lote
+    resultados = calculo_lote.calcular_lote(casos, series, TABELA_TJSP, processos=1, exatas=True)
+    parcelas, totais = tmp_path / "parcelas.parquet", tmp_path / "totais.csv"
+    assert calculo_lote.escrever_resultados(resultados, str(parcelas), str(totais), "parquet") == (len(casos), 0)
+    tabela = pq.read_table(parcelas)
+    assert set(tabela.column("id").to_pylist()) == {"ind", "hon", "pen", "alu"}
+    assert all(v is None or isinstance(v, Decimal) for v in tabela.column("audit_fator").to_pylist())
+
+
+def test_main_ignora_caso_invalido_sem_parar_o_lote(tmp_path, monkeypatch, serie_df):
+    # Séries sintéticas no lugar do BCB: uma por janela pedida
+    monkeypatch.setattr(calculo_lote.series_bcb, "obter_series",
+                        lambda janelas, armazem=None: [serie_df(cod, inicio, fim) for cod, inicio, fim in janelas])
+    casos = tmp_path / "casos.csv"
+    casos.write_text("id,tipo,indice,valor,inicio,fim,data_fixacao,data_calculo\n"
+                     "ok,indenizacao,IPCA,1500,2021-03-15,2022-06-20,,2024-05-10\n"
+                     "sem_fim,indenizacao,IPCA,1500,2021-03-15,,,2024-05-10\n"
+                     "sem_data,honorarios,INPC,2500,,,,2024-05-10\n"
+                     "hon,honorarios,INPC,2500,,,2020-02-01,2024-05-10\n", encoding="utf-8")
+    totais = tmp_path / "totais.csv"
+    codigo = calculo_lote.main([str(casos), "--parcelas", str(tmp_path / "parcelas.csv"), "--totais", str(totais),
+                                "--processos", "1", "--tabela-tjsp", TABELA_TJSP, "--pacote", ""])
+    assert codigo == 1  # casos ignorados contam como falha do lote
+    with open(totais, encoding="utf-8") as f:
+        linhas = list(csv.DictReader(f))
+    assert [(l["id"], l["erro"]) for l in linhas] == [("ok", ""), ("hon", "")]
+    assert all(Decimal(l["total"]) > 0 for l in linhas)
+
+
+def test_pre_carregar_uma_consulta_por_serie(monkeypatch, serie_df):
+    consultas = []
+
+    def obter_series(janelas, armazem=None):
+        consultas.extend(janelas)
+        return [serie_df(codigo, inicio, fim) for codigo, inicio, fim in janelas]
+
+    monkeypatch.setattr(calculo_lote.series_bcb, "obter_series", obter_series)
+    series = calculo_lote.pre_carregar_series([[(433, date(2020, 1, 1), date(2022, 1, 1))],
+                                               [(433, date(2019, 6, 1), date(2021, 1, 1)), (188, date(2021, 1, 1), date(2023, 1, 1))],
+                                               [(433, date(2021, 1, 1), date(2023, 5, 1))]])
+    assert sorted(consultas) == [(188, date(2021, 1, 1), date(2023, 1, 1)), (433, date(2019, 6, 1), date(2023, 5, 1))]
+    assert set(series) == {188, 433}
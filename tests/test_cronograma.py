@@ -0,0 +1,149 @@
+import os
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+
+import cronograma
+import motor_calculo as motor
+
+TABELA_TJSP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tabela_tjsp.csv")
+DATA_CALCULO = date(2024, 12, 10)
+
+
+def vencimentos(cron):
+    return [d["vencimento"] for d in cron.datas_calc()]
+
+
+# --- GERAÇÃO ---
+
+def test_diaria_um_periodo_por_dia():
+    cron = cronograma.gerar_cronograma(date(2024, 2, 27), date(2024, 3, 2), Decimal("500"))
+    assert vencimentos(cron) == [date(2024, 2, 27) + timedelta(days=k) for k in range(5)]
+    assert all(v == Decimal("500") for v in cron.valor_base)
+    assert {d["info_prorata"] for d in cron.datas_calc()} == {"Diária"}
+
+
+def test_semanal_com_ultima_semana_parcial():
+    cron = cronograma.gerar_cronograma(date(2023, 1, 2), date(2023, 1, 20), Decimal("700"), "semanal")
+    assert vencimentos(cron) == [date(2023, 1, 2), date(2023, 1, 9), date(2023, 1, 16)]
+    assert cron.dias.tolist() == [7, 7, 5]
+    assert list(cron.valor_base) == [Decimal("700"), Decimal("700"), Decimal("500")]
+    assert cron.datas_calc()[-1]["info_prorata"] == "Pro-rata (5/7 dias)"
+
+
+def test_mensal_igual_ao_pro_rata_do_motor():
+    inicio, fim = date(2023, 1, 15), date(2024, 3, 10)
+    cron = cronograma.gerar_cronograma(inicio, fim, Decimal("3100"), "mensal")
+    assert cron.datas_calc() == motor.gerar_cronograma_pro_rata(inicio, fim, Decimal("3100"))
+
+
+def test_suspensoes_tiram_dias_e_movem_o_vencimento():
+    suspensoes = [(date(2023, 1, 10), date(2023, 1, 11)), (date(2023, 1, 16), date(2023, 1, 17))]
+    semanal = cronograma.gerar_cronograma(date(2023, 1, 2), date(2023, 1, 22), Decimal("700"), "semanal", suspensoes)
+    assert semanal.dias.tolist() == [7, 5, 5]
+    # O vencimento da semana é o primeiro dia ativo dela
+    assert vencimentos(semanal) == [date(2023, 1, 2), date(2023, 1, 9), date(2023, 1, 18)]
+    assert list(semanal.valor_base)[1:] == [Decimal("500"), Decimal("500")]
+
+    diaria = cronograma.gerar_cronograma(date(2023, 1, 8), date(2023, 1, 18), Decimal("100"), suspensoes=suspensoes)
+    assert date(2023, 1, 10) not in vencimentos(diaria) and date(2023, 1, 17) not in vencimentos(diaria)
+    assert diaria.n == 7
+
+
+def test_periodo_inteiro_suspenso_sai_do_cronograma():
+    cron = cronograma.gerar_cronograma(date(2023, 1, 15), date(2023, 3, 10), Decimal("3100"), "mensal",
+                                       [(date(2023, 2, 1), date(2023, 2, 28))])
+    assert vencimentos(cron) == [date(2023, 1, 15), date(2023, 3, 1)]
+
+
+def test_suspensao_invertida_e_rejeitada():
+    with pytest.raises(ValueError, match="Suspensão com fim"):
+        cronograma.gerar_cronograma(date(2023, 1, 1), date(2023, 1, 31), Decimal("1"),
+                                    suspensoes=[(date(2023, 1, 20), date(2023, 1, 10))])
+
+
+def test_limite_de_dias_conta_so_dias_ativos():
+    cron = cronograma.gerar_cronograma(date(2023, 1, 1), date(2023, 12, 31), Decimal("100"), limite_dias=10,
+                                       suspensoes=[(date(2023, 1, 3), date(2023, 1, 4))])
+    assert cron.n == 10
+    assert vencimentos(cron)[-1] == date(2023, 1, 12)
+    mensal = cronograma.gerar_cronograma(date(2023, 1, 1), date(2023, 12, 31), Decimal("3100"), "mensal", limite_dias=40)
+    assert mensal.dias.tolist() == [31, 9]
+    assert mensal.valor_nominal() == Decimal("3100") + Decimal("3100") * Decimal(9) / Decimal(28)
+
+
+def test_teto_corta_a_soma_nominal():
+    cron = cronograma.gerar_cronograma(date(2023, 1, 1), date(2023, 12, 31), Decimal("300"), teto=Decimal("1000"))
+    assert cron.n == 4
+    assert list(cron.valor_base) == [Decimal("300")] * 3 + [Decimal("100")]
+    assert cron.valor_nominal() == Decimal("1000")
+    assert cron.limitado_teto and cron.datas_calc()[-1]["info_prorata"] == "Limitado ao teto"
+
+
+def test_teto_acima_do_total_nao_limita():
+    cron = cronograma.gerar_cronograma(date(2023, 1, 1), date(2023, 1, 10), Decimal("300"), teto=Decimal("5000"))
+    assert cron.n == 10 and not cron.limitado_teto
+
+
+# --- CÁLCULO POR GRUPO DE FATOR x LAÇO DECIMAL ---
+
+@pytest.fixture(scope="module")
+def contexto():
+    from conftest import serie_sintetica_df
+    return {
+        "series": {cod: serie_sintetica_df(cod, date(2017, 1, 1), date(2024, 6, 1)) for cod in (433, 11, motor.COD_SELIC)},
+        "tjsp": motor.CalculadoraTJSP(arquivo_padrao=TABELA_TJSP),
+    }
+
+
+CRONOGRAMAS = {
+    "diaria": dict(inicio=date(2020, 5, 4), fim=date(2024, 8, 20), valor_periodo=Decimal("500")),
+    "diaria_suspensa_com_teto": dict(inicio=date(2020, 5, 4), fim=date(2024, 8, 20), valor_periodo=Decimal("500"),
+                                     suspensoes=[(date(2021, 3, 1), date(2021, 6, 30))], teto=Decimal("400000")),
+    "semanal_com_limite": dict(inicio=date(2019, 9, 18), fim=date(2024, 8, 20), valor_periodo=Decimal("2100.35"),
+                               periodicidade="semanal", limite_dias=900),
+    "mensal": dict(inicio=date(2019, 9, 18), fim=date(2024, 8, 20), valor_periodo=Decimal("9000"), periodicidade="mensal",
+                   suspensoes=[(date(2022, 1, 10), date(2022, 2, 5))]),
+}
+
+
+@pytest.mark.parametrize("nome", CRONOGRAMAS)
+@pytest.mark.parametrize("regime", motor.REGIMES)
+@pytest.mark.parametrize("cod", [433, 11, -1])
+def test_total_agrupado_igual_ao_laco_decimal(contexto, nome, regime, cod):
+    cron = cronograma.gerar_cronograma(**CRONOGRAMAS[nome])
+    series = contexto["series"]
+    args = (regime, DATA_CALCULO, cod, series.get(cod), series[motor.COD_SELIC], contexto["tjsp"],
+            date(2020, 1, 1), date(2021, 12, 9), True)
+    resultado = cronograma.calcular_cronograma(cron, *args)
+    referencia = motor.calcular_indenizacao(cron.datas_calc(), *args)
+    # Os grupos somam na ordem do grupo: iguais até a 20ª casa, não bit a bit
+    assert abs(resultado.soma_total() - sum((l["_num"] for l in referencia), Decimal("0"))) < Decimal("1e-20")
+    assert resultado.soma_nominal() == cron.valor_nominal()
+    assert sum(resultado.periodos) == cron.n
+
+
+def test_misto_sem_juros_na_fase1(contexto):
+    cron = cronograma.gerar_cronograma(**CRONOGRAMAS["diaria"])
+    series = contexto["series"]
+    args = (motor.REGIME_MISTO, DATA_CALCULO, 433, series[433], series[motor.COD_SELIC], contexto["tjsp"],
+            date(2020, 1, 1), date(2021, 12, 9), False)
+    referencia = sum((l["_num"] for l in motor.calcular_indenizacao(cron.datas_calc(), *args)), Decimal("0"))
+    resultado = cronograma.calcular_cronograma(cron, *args)
+    assert abs(resultado.soma_total() - referencia) < Decimal("1e-20")
+    assert all(j == 0 for j in resultado.juros)
+
+
+def test_cinco_anos_de_astreinte_diaria_em_menos_de_um_segundo(contexto):
+    import time
+    cron = cronograma.gerar_cronograma(date(2019, 11, 1), date(2024, 10, 31), Decimal("500"))
+    series = contexto["series"]
+    inicio = time.perf_counter()
+    for regime in motor.REGIMES:
+        resultado = cronograma.calcular_cronograma(cron, regime, DATA_CALCULO, 433, series[433], series[motor.COD_SELIC],
+                                                   contexto["tjsp"], date(2020, 1, 1), date(2021, 12, 9), True)
+        # Série mensal: um grupo por mês, não por dia
+        assert resultado.n <= 61
+    assert cron.n == 1827
+    assert time.perf_counter() - inicio < 1.0
@@ -0,0 +1,66 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import diagnostico
+import series_bcb
+
+
+def test_sem_calculo_ativo_nao_registra_nada():
+    with diagnostico.etapa("fatores"):
+        diagnostico.contar("linhas_processadas", 10)
+    with diagnostico.medir_calculo("teste") as diag:
+        pass
+    assert diag.etapas == {} and diag.contadores["linhas_processadas"] == 0
+
+
+def test_etapas_e_contadores_chegam_pelas_threads_do_pool():
+    def trabalho(k):
+        with diagnostico.etapa("calculo_linhas"):
+            diagnostico.contar("linhas_processadas", k)
+
+    with diagnostico.medir_calculo("teste") as diag:
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            list(pool.map(diagnostico.no_contexto(trabalho), range(1, 9)))
+        # Sem no_contexto a thread não enxerga o cálculo
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            pool.submit(trabalho, 100).result()
+    dados = diag.como_dict()
+    assert dados["etapas"]["calculo_linhas"]["chamadas"] == 8
+    assert dados["contadores"]["linhas_processadas"] == 36
+    assert dados["segundos"] >= dados["etapas"]["calculo_linhas"]["segundos"] / 8
+
+
+def test_exporta_jsonl_e_prometheus(tmp_path, monkeypatch):
+    jsonl, prom = tmp_path / "metricas.jsonl", tmp_path / "calcjus.prom"
+    monkeypatch.setattr(diagnostico, "CAMINHO_JSONL", str(jsonl))
+    monkeypatch.setattr(diagnostico, "CAMINHO_PROM", str(prom))
+    for _ in range(2):
+        with diagnostico.medir_calculo("exportacao_teste"):
+            with diagnostico.etapa("formatacao"):
+                diagnostico.contar("bytes_baixados", 5)
+    linhas = [json.loads(l) for l in jsonl.read_text(encoding="utf-8").splitlines()]
+    assert [l["calculo"] for l in linhas] == ["exportacao_teste"] * 2
+    assert linhas[-1]["contadores"]["bytes_baixados"] == 5
+    texto = prom.read_text(encoding="utf-8")
+    assert 'calcjus_calculos_total{calculo="exportacao_teste"} 2' in texto
+    assert "# TYPE calcjus_bytes_baixados_total counter" in texto
+    # A escrita atômica não deixa o .tmp para trás
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["calcjus.prom", "metricas.jsonl"]
+
+
+def test_requisicoes_e_cache_do_armazem(tmp_path, sgs):
+    cliente = series_bcb.ClienteSGS(url_sgs=sgs.url + "/dados/serie/bcdata.sgs.{codigo}/dados")
+    armazem = series_bcb.ArmazemSeries(str(tmp_path), baixar=cliente.baixar)
+    janelas = [(433, date(2015, 1, 1), date(2020, 12, 31)), (11, date(2000, 1, 1), date(2020, 12, 31))]
+    with diagnostico.medir_calculo("teste") as diag:
+        series_bcb.obter_series(janelas, armazem=armazem)
+        series_bcb.obter_series(janelas, armazem=armazem)
+    contadores = diag.como_dict()["contadores"]
+    # A série diária de 21 anos vai em 3 janelas
+    assert contadores["http_requisicoes"] == len(sgs.requisicoes) == 4
+    assert contadores["cache_misses"] == 2 and contadores["cache_hits"] == 2
+    assert contadores["bytes_baixados"] > 0 and contadores["http_retries"] == 0
+    assert diag.etapas["series_bcb"]["chamadas"] == 2
+    cliente.session.close()
+    cliente._pool.shutdown()
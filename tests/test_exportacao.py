@@ -0,0 +1,100 @@
+import io
+import tracemalloc
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+import exportacao
+
+ESQUEMA = [("vencimento", "data"), ("total_centavos", "centavos"), ("fator", "decimal"), ("valor_num", "valor")]
+
+@pytest.fixture
+def pa():
+    return pytest.importorskip("pyarrow")
+
+def ler_parquet(caminho):
+    import pyarrow.parquet as pq
+    return pq.read_table(caminho)
+
+def test_parquet_valores_com_muitos_digitos_inteiros(tmp_path, pa):
+    # 12 dígitos inteiros com 28 casas estouravam o quantize sob precisão 38
+    valor = Decimal("123456789012.3456789012345678")
+    fator = Decimal("1.234567890123456789012345678")
+    bloco = [[date(2024, 1, 10)], [12345678901235], [fator], [valor]]
+    caminho = tmp_path / "saida.parquet"
+    assert exportacao.exportar("parquet", ESQUEMA, [bloco], str(caminho)) == 1
+
+    tabela = ler_parquet(caminho)
+    assert tabela.schema.field("fator").type == pa.decimal128(38, exportacao.ESCALA_FATOR)
+    assert tabela.schema.field("valor_num").type == pa.decimal128(38, exportacao.ESCALA_VALOR)
+    assert tabela.column("valor_num")[0].as_py() == Decimal("123456789012.3456789012")
+    assert tabela.column("fator")[0].as_py() == Decimal("1.234567890123456789")
+
+def test_parquet_nulos_e_valores_no_limite(tmp_path, pa):
+    maior_valor = Decimal(10) ** (38 - exportacao.ESCALA_VALOR) - 1
+    bloco = [[date(2024, 1, 10), date(2024, 2, 10)], [None, 1], [None, Decimal("0.5")], [maior_valor, None]]
+    caminho = tmp_path / "saida.parquet"
+    exportacao.exportar("parquet", ESQUEMA, [bloco], str(caminho))
+    tabela = ler_parquet(caminho)
+    assert tabela.column("valor_num").to_pylist() == [maior_valor, None]
+    assert tabela.column("fator").to_pylist() == [None, Decimal("0.5")]
+
+@pytest.mark.parametrize("coluna, valor", [
+    ("fator", Decimal(10) ** (38 - exportacao.ESCALA_FATOR)),
+    ("valor_num", Decimal(10) ** (38 - exportacao.ESCALA_VALOR)),
+    ("valor_num", Decimal("Infinity")),
+])
+def test_parquet_valor_que_nao_cabe_indica_a_coluna(tmp_path, pa, coluna, valor):
+    bloco = [[date(2024, 1, 10)], [1], [Decimal("1")], [Decimal("1")]]
+    bloco[[nome for nome, _ in ESQUEMA].index(coluna)] = [valor]
+    with pytest.raises(ValueError, match=f"coluna {coluna}"):
+        exportacao.exportar("parquet", ESQUEMA, [bloco], str(tmp_path / "saida.parquet"))
+
+def test_csv_mantem_decimais_completos(tmp_path):
+    valor = Decimal("123456789012.3456789012345678")
+    bloco = [[date(2024, 1, 10)], [5], [Decimal("1.5")], [valor]]
+    caminho = tmp_path / "saida.csv"
+    exportacao.exportar("csv", ESQUEMA, [bloco], str(caminho))
+    assert caminho.read_text(encoding="utf-8").splitlines()[1] == "2024-01-10,5,1.5,123456789012.3456789012345678"
+
+def blocos_grandes(linhas, tamanho=10_000):
+    for inicio in range(0, linhas, tamanho):
+        n = min(tamanho, linhas - inicio)
+        yield [[date(2024, 1, 10)] * n, list(range(inicio, inicio + n)), [Decimal("1.234567890123")] * n,
+               [Decimal("98765.4321")] * n]
+
+@pytest.mark.parametrize("formato", ["csv", "xlsx"])
+def test_exportar_arquivo_devolve_o_mesmo_conteudo(formato):
+    esperado = io.BytesIO()
+    exportacao.exportar(formato, ESQUEMA, blocos_grandes(25_000), esperado)
+    with exportacao.exportar_arquivo(formato, ESQUEMA, blocos_grandes(25_000)) as arquivo:
+        assert isinstance(arquivo, io.BufferedReader)
+        assert arquivo.read() == esperado.getvalue()
+
+def test_xlsx_reproduzivel(tmp_path):
+    import zipfile
+    caminho = tmp_path / "saida.xlsx"
+    exportacao.exportar("xlsx", ESQUEMA, blocos_grandes(10), str(caminho))
+    # Sem a hora da gravação nos membros, duas exportações em segundos diferentes têm os mesmos bytes
+    with zipfile.ZipFile(caminho) as pacote:
+        assert {m.date_time for m in pacote.infolist()} == {(1980, 1, 1, 0, 0, 0)}
+        assert {m.compress_type for m in pacote.infolist()} == {zipfile.ZIP_DEFLATED}
+
+def pico_exportacao(linhas):
+    tracemalloc.start()
+    try:
+        with exportacao.exportar_arquivo("csv", ESQUEMA, blocos_grandes(linhas)):
+            return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def test_exportar_arquivo_nao_monta_o_arquivo_em_memoria():
+    # O pico acompanha o tamanho do bloco, não o do arquivo (~9 MB com 200 mil linhas)
+    assert pico_exportacao(200_000) < 2 * pico_exportacao(20_000)
+
+def test_exportar_arquivo_aceito_pelo_download_button():
+    botao = pytest.importorskip("streamlit.elements.widgets.button")
+    with exportacao.exportar_arquivo("csv", ESQUEMA, blocos_grandes(10)) as arquivo:
+        dados, _ = botao.convert_data_to_bytes_and_infer_mime(arquivo, unsupported_error=TypeError())
+    assert dados.decode("utf-8").splitlines()[0] == "vencimento,total_centavos,fator,valor_num"
@@ -0,0 +1,110 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+import imputacao
+import motor_calculo as motor
+import series_bcb
+
+DATA_CALCULO = date(2023, 6, 30)
+MIL = Decimal("1000.00")
+
+
+@pytest.fixture
+def indice_plano():
+    # Índice sem variação (fator 1 em todo mês): só os juros de 1% a.m. mexem nos valores
+    return series_bcb.montar_dataframe([(date(2022 + k // 12, k % 12 + 1, 1), "0") for k in range(36)])
+
+
+def imputar(parcelas, extrato, df, data_calculo=DATA_CALCULO):
+    # parcelas: [(vencimento, devido)]; mesma chamada de calcular_caso, índice 433
+    return imputacao.imputar_parcelas([(venc, devido, Decimal("0.00")) for venc, devido in parcelas], extrato, 433, df, None,
+                                      data_calculo, montar_linha=lambda venc, devido, pago, valores: (venc, pago, valores))
+
+
+def test_pagamento_parcial_so_cobre_juros(indice_plano):
+    juros_ate_pagamento = motor.juros_mora(MIL, 60)
+    resultado = imputar([(date(2023, 1, 10), MIL)], [(date(2023, 3, 11), Decimal("15.00"))], indice_plano)
+
+    (registro,) = resultado.pagamentos
+    assert (registro["juros"], registro["principal"], registro["credito"]) == (Decimal("15.00"), 0, 0)
+    assert registro["primeira"] == registro["ultima"] == date(2023, 1, 10)
+    # Principal intacto; o resto dos juros fica pendente, sem juros sobre ele
+    (_, pago, (saldo, fator, atualizado, juros, total)), = resultado.linhas
+    assert pago == Decimal("15.00") and saldo == MIL and atualizado == MIL and fator == 1
+    assert juros == juros_ate_pagamento - Decimal("15.00") + motor.juros_mora(MIL, (DATA_CALCULO - date(2023, 3, 11)).days)
+    assert total == resultado.total == atualizado + juros
+
+
+def test_pagamento_quita_varias_parcelas_mais_antigas_primeiro(indice_plano):
+    vencimentos = [date(2023, 1, 10), date(2023, 2, 10), date(2023, 3, 10)]
+    resultado = imputar([(v, MIL) for v in vencimentos], [(date(2023, 3, 10), Decimal("2500.00"))], indice_plano)
+
+    (registro,) = resultado.pagamentos
+    juros_1, juros_2 = motor.juros_mora(MIL, 59), motor.juros_mora(MIL, 28)
+    assert registro["juros"] == juros_1 + juros_2
+    assert registro["principal"] == Decimal("2500.00") - juros_1 - juros_2
+    assert (registro["primeira"], registro["ultima"], registro["credito"]) == (date(2023, 1, 10), date(2023, 3, 10), 0)
+    assert registro["situacao"] == ""
+
+    primeira, segunda, terceira = resultado.linhas
+    assert primeira[2][1] is None and segunda[2][1] is None  # quitadas
+    saldo_3 = MIL - registro["principal"] + 2 * MIL
+    assert terceira[2][0] == saldo_3
+    assert terceira[2][4] == saldo_3 + motor.juros_mora(saldo_3, (DATA_CALCULO - date(2023, 3, 10)).days)
+    assert resultado.soma_imputada() == Decimal("2500.00")
+
+
+def test_sobra_vira_credito_na_parcela_seguinte(indice_plano):
+    # Pagamento antecipado maior que a parcela: a sobra é imputada no vencimento da próxima
+    resultado = imputar([(date(2023, 1, 10), MIL), (date(2023, 2, 10), MIL)], [(date(2023, 1, 10), Decimal("1500.00"))],
+                        indice_plano)
+    (registro,) = resultado.pagamentos
+    assert registro["principal"] == Decimal("1500.00") and registro["juros"] == 0
+    assert (registro["ultima"], registro["credito"]) == (date(2023, 2, 10), 0)
+    (_, pago_1, valores_1), (_, pago_2, valores_2) = resultado.linhas
+    assert (pago_1, valores_1[1]) == (MIL, None)
+    assert pago_2 == Decimal("500.00") and valores_2[0] == Decimal("500.00")
+
+
+def test_credito_sem_parcela_a_imputar(indice_plano):
+    resultado = imputar([(date(2023, 1, 10), MIL)], [(date(2023, 1, 10), Decimal("1200.00")),
+                                                     (date(2023, 8, 1), Decimal("50.00"))], indice_plano)
+    sobra, depois = resultado.pagamentos
+    assert sobra["credito"] == Decimal("200.00") and sobra["situacao"] == "crédito sem parcela a imputar"
+    assert depois["situacao"] == "após a data do cálculo" and depois["principal"] == depois["juros"] == 0
+    assert resultado.total == 0
+
+
+def test_sem_pagamentos_igual_a_valores_pensao(serie_df):
+    df = serie_df(433, date(2019, 1, 1), date(2024, 12, 31))
+    parcelas = motor.gerar_parcelas_pensao(Decimal("850.00"), date(2019, 3, 5), date(2023, 12, 5))
+    resultado = imputacao.imputar_parcelas(parcelas, [], 433, df, None, date(2024, 6, 30),
+                                           montar_linha=lambda venc, devido, pago, valores: valores)
+    esperado = [motor.valores_pensao(*p, 433, df, None, date(2024, 6, 30)) for p in parcelas]
+    assert resultado.linhas == esperado
+    assert resultado.total == sum(v[4] for v in esperado)
+
+
+EXTRATO = """Data Pagamento;Valor Pago;Observação
+05/02/2023;R$ 1.234,56;pix
+2023-03-10;800,00;
+10/04/2023;abc;estorno
+;100,00;
+31/02/2023;10,00;
+15/05/2023;1500.5;
+"""
+
+
+def test_ler_extrato_do_banco():
+    pagamentos, invalidos = imputacao.ler_extrato(EXTRATO)
+    assert pagamentos == [(date(2023, 2, 5), Decimal("1234.56")), (date(2023, 3, 10), Decimal("800.00")),
+                          (date(2023, 5, 15), Decimal("1500.5"))]
+    assert invalidos == ["linha 4: valor inválido: 'abc'", "linha 5: data vazia", "linha 6: data inválida: '31/02/2023'"]
+
+
+def test_ler_extrato_sem_colunas():
+    assert imputacao.ler_extrato("dia,quantia\n01/01/2023,10\n") == ([], ["o extrato precisa das colunas data e valor"])
+    pagamentos, invalidos = imputacao.ler_extrato("data,valor\n01/01/2023,-10\n")
+    assert pagamentos == [] and invalidos == ["linha 2: valor deve ser positivo: '-10'"]
@@ -0,0 +1,83 @@
+import csv
+import io
+import os
+import zipfile
+from datetime import date
+
+import pytest
+
+import calculo_lote
+import laudos_lote
+import motor_calculo as motor
+
+TABELA_TJSP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tabela_tjsp.csv")
+
+CASOS = [
+    {"id": "ind/1", "tipo": "indenizacao", "regime": "misto", "indice": "IPCA", "valor": "1500", "inicio": "2021-03-15",
+     "fim": "2022-06-20", "data_calculo": "2024-05-10", "multa_523": "sim"},
+    {"id": "hon", "tipo": "honorarios", "indice": "INPC", "valor": "2500", "data_fixacao": "2020-02-01", "data_calculo": "2024-05-10"},
+    {"id": "pen", "tipo": "pensao", "indice": "IPCA", "valor": "800", "inicio": "2022-01-05", "fim": "2022-12-05",
+     "data_calculo": "2024-05-10"},
+    {"id": "alu", "tipo": "aluguel", "indice": "IGP-M", "valor": "3200", "data_reajuste": "2024-03-01", "data_calculo": "2024-05-10"},
+    {"id": "hon", "tipo": "honorarios", "indice": "INPC", "valor": "100", "data_fixacao": "2021-02-01", "data_calculo": "2024-05-10"},
+]
+
+
+@pytest.fixture
+def pares(serie_df):
+    casos = [motor.normalizar_caso(bruto) for bruto in CASOS]
+    series = {}
+    for caso in casos:
+        for codigo, inicio, fim in motor.janelas_caso(caso):
+            series[codigo] = serie_df(codigo, date(2015, 1, 1), max(fim, date(2024, 6, 1)))
+    return list(zip(casos, calculo_lote.calcular_lote(casos, series, TABELA_TJSP, processos=1)))
+
+
+def ler_resumo(texto):
+    return list(csv.DictReader(io.StringIO(texto)))
+
+
+NOMES = ["Laudo_ind_1_indenizacao.pdf", "Laudo_hon_honorarios.pdf", "Laudo_pen_pensao.pdf", "Laudo_alu_aluguel.pdf",
+         "Laudo_hon_honorarios-2.pdf"]
+
+
+def test_zip_com_um_pdf_por_caso(pares, tmp_path):
+    progresso = []
+    destino = tmp_path / "laudos.zip"
+    assert laudos_lote.exportar_laudos(pares, str(destino), processos=2, progresso=lambda *a: progresso.append(a)) == []
+    with zipfile.ZipFile(destino) as pacote:
+        assert sorted(pacote.namelist()) == sorted(NOMES + ["resumo.csv"])
+        assert all(pacote.read(nome).startswith(b"%PDF") for nome in NOMES)
+        resumo = ler_resumo(pacote.read("resumo.csv").decode("utf-8"))
+    assert [(l["id"], l["arquivo"], l["erro"]) for l in resumo] == [(c["id"], n, "") for c, n in zip(CASOS, NOMES)]
+    assert resumo[0]["total_geral"] != resumo[0]["total"]  # multa do art. 523 no primeiro caso
+    assert progresso[-1] == (len(CASOS), len(CASOS))
+
+
+def test_diretorio_com_um_pdf_por_caso(pares, tmp_path):
+    destino = tmp_path / "laudos"
+    assert laudos_lote.exportar_laudos(pares, str(destino), processos=2) == []
+    assert sorted(os.listdir(destino)) == sorted(NOMES + ["resumo.csv"])
+    for nome in NOMES:
+        assert (destino / nome).read_bytes().startswith(b"%PDF")
+    assert len(ler_resumo((destino / "resumo.csv").read_text(encoding="utf-8"))) == len(CASOS)
+
+
+@pytest.mark.parametrize("destino", ["laudos.zip", "laudos"])
+def test_caso_com_falha_nao_interrompe_o_pool(pares, tmp_path, destino):
+    # Um caso já calculado com erro e outro que quebra na montagem do PDF (dentro do worker)
+    pares[1] = (pares[1][0], dict(pares[1][1], erro="índice sem dados"))
+    pares[3] = ({k: v for k, v in pares[3][0].items() if k != "data_calculo"}, pares[3][1])
+    falhas = laudos_lote.exportar_laudos(pares, str(tmp_path / destino), processos=2)
+    assert falhas == [("hon", "índice sem dados"), ("alu", "KeyError: 'data_calculo'")]
+
+    if destino.endswith(".zip"):
+        with zipfile.ZipFile(tmp_path / destino) as pacote:
+            gerados = set(pacote.namelist())
+            resumo = ler_resumo(pacote.read("resumo.csv").decode("utf-8"))
+    else:
+        gerados = set(os.listdir(tmp_path / destino))
+        resumo = ler_resumo((tmp_path / destino / "resumo.csv").read_text(encoding="utf-8"))
+    assert gerados == {NOMES[0], NOMES[2], NOMES[4], "resumo.csv"}
+    assert [l["arquivo"] for l in resumo] == [NOMES[0], "", NOMES[2], "", NOMES[4]]
+    assert [l["erro"] for l in resumo] == ["", "índice sem dados", "", "KeyError: 'data_calculo'", ""]
@@ -0,0 +1,143 @@
+import threading
+import time
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+import motor_calculo as motor
+
+
+def test_pensao_sem_inicio_ou_fim_e_rejeitada():
+    with pytest.raises(ValueError, match="pensão requer inicio e fim"):
+        motor.normalizar_caso({"tipo": "pensao", "valor": "1000", "inicio": "2023-01-01"})
+
+
+@pytest.mark.parametrize("bruto, mensagem", [
+    ({"tipo": "indenizacao", "valor": "1000", "inicio": "2023-01-01", "fim": ""}, "indenização requer inicio e fim"),
+    ({"tipo": "indenizacao", "valor": "1000", "fim": "2023-06-01"}, "indenização requer inicio e fim"),
+    ({"tipo": "honorarios", "valor": "1000"}, "honorários requerem data_fixacao"),
+])
+def test_caso_sem_datas_e_rejeitado(bruto, mensagem):
+    with pytest.raises(ValueError, match=mensagem):
+        motor.normalizar_caso(bruto)
+
+
+def test_pensao_com_parcelas_dispensa_periodo():
+    caso = motor.normalizar_caso({"tipo": "pensao", "parcelas": [{"vencimento": "2023-01-01", "devido": "1000"}]})
+    assert len(caso["parcelas"]) == 1
+
+
+# --- TABELA TJSP ---
+
+def test_tabela_tjsp_valida_em_qualquer_ordem():
+    conteudo = "mes_ano,fator\n02/2023,90,5\n\n01/2023,90.1\n03/2023,91\n".encode("utf-8-sig")
+    primeiro, fatores = motor.validar_tabela_tjsp(conteudo.replace(b"90,5", b'"90,5"'))
+    assert primeiro == motor.mes_absoluto(date(2023, 1, 1))
+    assert fatores == (Decimal("90.1"), Decimal("90.5"), Decimal("91"))
+    assert motor.validar_tabela_tjsp(b"mes_ano,fator\n") == (0, ())
+
+
+@pytest.mark.parametrize("linhas, mensagem", [
+    (["01/2023,90", "03/2023,91"], "Meses ausentes na tabela: 02/2023"),
+    (["01/2022,90"] + [f"{m:02d}/2023,91" for m in range(9, 13)],
+     "Meses ausentes na tabela: 02/2022, 03/2022, 04/2022, 05/2022, 06/2022, 07/2022..."),
+    (["01/2023,90", "02/2023,91", "01/2023,90.5"], "Linha 4: mês 01/2023 repetido."),
+    (["01/2023,90", "13/2023,91"], "Linha 3 malformada: '13/2023', '91'."),
+    (["2023-01,90"], "Linha 2 malformada: '2023-01', '90'."),
+    (["01/2023,noventa"], "Linha 2 malformada: '01/2023', 'noventa'."),
+    (["01/2023,"], "Linha 2 malformada: '01/2023', ''."),
+    (["01/2023,0"], r"Linha 2: fator deve ser positivo \(0\)."),
+    (["01/2023,-1.5"], r"Linha 2: fator deve ser positivo \(-1.5\)."),
+    (["01/2023,NaN"], r"Linha 2: fator deve ser positivo \(NaN\)."),
+])
+def test_tabela_tjsp_invalida(linhas, mensagem):
+    conteudo = "\n".join(["mes_ano,fator"] + linhas).encode("utf-8")
+    with pytest.raises(motor.ErroTabelaTJSP, match=f"^{mensagem}$"):
+        motor.validar_tabela_tjsp(conteudo)
+
+
+@pytest.mark.parametrize("conteudo, mensagem", [
+    (b"mes,valor\n01/2023,90\n", "Cabeçalho deve conter as colunas 'mes_ano' e 'fator'."),
+    (b"", "Cabeçalho deve conter as colunas 'mes_ano' e 'fator'."),
+    ("mes_ano,fator\n01/2023,90\n".encode("latin-1") + b"\xe7", "Arquivo não está em UTF-8."),
+])
+def test_tabela_tjsp_arquivo_invalido(conteudo, mensagem):
+    with pytest.raises(motor.ErroTabelaTJSP, match=f"^{mensagem}$"):
+        motor.validar_tabela_tjsp(conteudo)
+
+
+def test_upload_de_tabela_invalida_levanta_o_mesmo_erro_de_novo():
+    import io
+    arquivo = io.BytesIO(b"mes_ano,fator\n01/2023,90\n01/2023,91\n")
+    for _ in range(2):  # a segunda vez sai do cache de tabelas validadas
+        with pytest.raises(motor.ErroTabelaTJSP, match="mês 01/2023 repetido"):
+            motor.CalculadoraTJSP(arquivo_prioritario=arquivo)
+
+
+def test_tabela_tjsp_lida_uma_vez_por_conteudo():
+    import os
+    padrao = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tabela_tjsp.csv")
+    a, b = motor.CalculadoraTJSP(arquivo_padrao=padrao), motor.CalculadoraTJSP(arquivo_padrao=padrao)
+    assert a.fatores is b.fatores
+    assert a.obter_fator(date(2023, 2, 15)) == Decimal("90.251545")
+    assert a.calcular_fator_composto(date(2023, 1, 1), date(2025, 1, 31)) == Decimal("97.669945") / Decimal("89.838289")
+    assert a.obter_fator(date(1990, 1, 1)) is None
+
+
+# --- PENSÃO INCREMENTAL ---
+
+def recalculo_do_zero(parcelas, cod, df, data_calculo):
+    valores = [motor.valores_pensao(*p, cod, df, None, data_calculo) for p in parcelas]
+    return [motor.formatar_linha_pensao(*p, v) for p, v in zip(parcelas, valores) if v], sum(v[4] for v in valores if v)
+
+
+def test_pensao_incremental_igual_ao_recalculo_do_zero(serie_df):
+    df = serie_df(433, date(2018, 1, 1), date(2024, 6, 1))
+    outro_indice = serie_df(188, date(2018, 1, 1), date(2024, 6, 1))
+    base = motor.gerar_parcelas_pensao(Decimal("950.00"), date(2019, 1, 10), date(2023, 12, 10))
+    recalculadas = []
+    incremental = motor.PensaoIncremental(
+        montar_linha=lambda *args: recalculadas.append(args[0]) or motor.formatar_linha_pensao(*args))
+
+    editada = list(base)
+    editada[5] = (editada[5][0], editada[5][1], Decimal("400.00"))       # pagamento lançado
+    editada[20] = (editada[20][0], Decimal("1200.00"), editada[20][2])    # devido corrigido
+    acrescida = editada + [(date(2024, 1, 10), Decimal("950.00"), Decimal("0.00")),
+                           (date(2024, 12, 10), Decimal("950.00"), Decimal("0.00")),  # sem fator: fora do total
+                           editada[3]]                                                # parcela repetida
+    removida = acrescida[:10] + acrescida[15:]
+
+    for parcelas, cod, serie, recalcular in ((base, 433, df, len(base)), (editada, 433, df, 2), (acrescida, 433, df, 1),
+                                             (removida, 433, df, 0), (base, 433, df, 7), (base, 188, outro_indice, len(base))):
+        recalculadas.clear()
+        linhas, total = incremental.calcular(parcelas, cod, serie, None, date(2024, 6, 30))
+        esperadas, esperado = recalculo_do_zero(parcelas, cod, serie, date(2024, 6, 30))
+        assert linhas == esperadas
+        assert abs(total - esperado) < Decimal("1e-20")
+        # Só as parcelas novas ou alteradas (e com fator) chegam a montar_linha
+        assert len(recalculadas) == recalcular
+
+
+def test_pensao_incremental_serializa_calculos_concorrentes(serie_df):
+    # Duas tarefas com o mesmo objeto da sessão: cada cálculo vê a memória coerente
+    df = serie_df(433, date(2015, 1, 1), date(2025, 1, 1))
+    base = motor.gerar_parcelas_pensao(Decimal("1000"), date(2015, 1, 1), date(2024, 12, 1))
+    outra = base[:60] + [(venc, devido, Decimal("300")) for venc, devido, _ in base[60:]]
+    incremental = motor.PensaoIncremental()
+    totais = {}
+
+    def calcular(nome, parcelas):
+        for _ in range(10):
+            # progresso cede a vez à outra thread no meio do cálculo, como numa tarefa longa
+            total = incremental.calcular(parcelas, 433, df, None, date(2025, 1, 1), progresso=lambda *_: time.sleep(0.002))[1]
+            totais.setdefault(nome, []).append(total)
+
+    threads = [threading.Thread(target=calcular, args=(nome, parcelas)) for nome, parcelas in (("base", base), ("outra", outra))]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    esperado = {nome: sum(v[4] for v in (motor.valores_pensao(*p, 433, df, None, date(2025, 1, 1)) for p in parcelas) if v)
+                for nome, parcelas in (("base", base), ("outra", outra))}
+    assert {nome: len(obtidos) for nome, obtidos in totais.items()} == {"base": 10, "outra": 10}
+    for nome, obtidos in totais.items():
+        assert all(abs(total - esperado[nome]) < Decimal("1e-20") for total in obtidos)
@@ -0,0 +1,102 @@
+import os
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+import motor_calculo as motor
+import motor_vetorizado
+
+TABELA_TJSP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tabela_tjsp.csv")
+DATA_CALCULO = date(2024, 12, 10)
+CODIGOS = list(motor.mapa_indices_completo.values())
+
+
+@pytest.fixture(scope="module")
+def contexto():
+    # Séries sintéticas só até junho de 2024: as últimas parcelas ficam sem fator (e, com a
+    # Tabela TJSP, que começa em 2023, as anteriores a ela)
+    from conftest import serie_sintetica_df
+    series = {cod: serie_sintetica_df(cod, date(2017, 1, 1), date(2024, 6, 1)) for cod in CODIGOS if cod != -1}
+    return {
+        "series": series,
+        "tjsp": motor.CalculadoraTJSP(arquivo_padrao=TABELA_TJSP),
+        # Pro-rata no primeiro e no último mês, vencimentos dos dois lados da citação e do corte
+        "cronograma": motor.gerar_cronograma_pro_rata(date(2018, 3, 15), date(2024, 8, 20), Decimal("1234.56")),
+    }
+
+
+def argumentos(contexto, regime, cod, juros_fase1=True):
+    series = contexto["series"]
+    return (contexto["cronograma"], regime, DATA_CALCULO, cod, series.get(cod), series[motor.COD_SELIC], contexto["tjsp"],
+            date(2019, 6, 1), date(2021, 12, 9), juros_fase1)
+
+
+def comparar(args):
+    referencia = motor.calcular_indenizacao(*args)
+    vetorizado = motor_vetorizado.calcular_indenizacao_vetorizada(*args)
+    assert vetorizado.n == len(referencia)
+    assert list(vetorizado.linhas()) == referencia
+    assert vetorizado.soma_total() == sum((l["_num"] for l in referencia), Decimal("0.00"))
+    return referencia
+
+
+@pytest.mark.parametrize("cod", CODIGOS)
+@pytest.mark.parametrize("regime", motor.REGIMES)
+def test_igual_ao_laco_decimal(contexto, regime, cod):
+    referencia = comparar(argumentos(contexto, regime, cod))
+    # O caso exercita linhas com e sem fator
+    sem_fator = [l["Audit Fator CM"] == l["Audit Fator SELIC"] == "-" for l in referencia]
+    assert any(sem_fator) and not all(sem_fator)
+
+
+@pytest.mark.parametrize("cod", [188, 433])
+def test_misto_sem_juros_na_fase1(contexto, cod):
+    referencia = comparar(argumentos(contexto, motor.REGIME_MISTO, cod, juros_fase1=False))
+    assert any(l["Audit Juros %"] == "N/A (Desativado)" for l in referencia)
+
+
+def test_em_blocos_igual_ao_calculo_inteiro(contexto):
+    args = argumentos(contexto, motor.REGIME_MISTO, 188)
+    inteiro = motor_vetorizado.calcular_indenizacao_vetorizada(*args)
+    em_blocos = motor_vetorizado.calcular_indenizacao_em_blocos(args[0], *args[1:], bloco=7)
+    assert list(em_blocos.linhas()) == list(inteiro.linhas())
+    assert em_blocos.soma_total() == inteiro.soma_total()
+
+
+def test_cronograma_vazio(contexto):
+    args = argumentos(contexto, motor.REGIME_INDICE, 433)
+    resultado = motor_vetorizado.calcular_indenizacao_vetorizada([], *args[1:])
+    assert resultado.n == 0 and list(resultado.linhas()) == [] and resultado.soma_total() == 0
+
+
+# --- COMPARAÇÃO DE ÍNDICES LADO A LADO ---
+
+@pytest.mark.parametrize("regime", motor.REGIMES)
+def test_comparar_indenizacao_igual_ao_calculo_de_cada_indice(contexto, regime):
+    args = argumentos(contexto, regime, 433)
+    comparacao = motor_vetorizado.comparar_indenizacao(args[0], regime, DATA_CALCULO, contexto["series"], contexto["tjsp"],
+                                                       *args[7:])
+    assert list(comparacao) == CODIGOS
+    for cod, resultado in comparacao.items():
+        referencia = motor.calcular_indenizacao(*argumentos(contexto, regime, cod))
+        assert list(resultado.linhas()) == referencia, cod
+        assert resultado.soma_total() == sum((l["_num"] for l in referencia), Decimal("0.00"))
+
+
+def test_comparar_pensao_igual_ao_calculo_de_cada_indice(contexto):
+    parcelas = motor.gerar_parcelas_pensao(Decimal("950.00"), date(2018, 2, 10), date(2024, 8, 10))
+    # Quitada, paga em parte e paga a mais
+    parcelas[1] = (parcelas[1][0], parcelas[1][1], parcelas[1][1])
+    parcelas[2] = (parcelas[2][0], parcelas[2][1], Decimal("400.00"))
+    parcelas[3] = (parcelas[3][0], parcelas[3][1], Decimal("1200.00"))
+    comparacao = motor_vetorizado.comparar_pensao(parcelas, DATA_CALCULO, contexto["series"], contexto["tjsp"])
+    assert list(comparacao) == CODIGOS
+    for cod, totais in comparacao.items():
+        series = contexto["series"].get(cod)
+        esperado = [motor.valores_pensao(*p, cod, series, contexto["tjsp"], DATA_CALCULO) for p in parcelas]
+        assert list(totais) == [v[4] if v else None for v in esperado], cod
+        # Mesmo total da aba Pensão com esse índice (parcelas sem fator ficam de fora)
+        linhas = motor.calcular_pensao(parcelas, cod, series, contexto["tjsp"], DATA_CALCULO)
+        assert sum(t for t in totais if t is not None) == sum(l["_num"] for l in linhas)
+        assert any(t is None for t in totais) and not all(t is None for t in totais)
@@ -0,0 +1,109 @@
+import os
+from datetime import date, datetime
+
+import pytest
+
+import pacote_series
+import series_bcb
+from sgs_simulado import serie_sintetica
+
+TABELA_TJSP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tabela_tjsp.csv")
+INICIO, FIM = date(2015, 1, 1), date(2024, 6, 30)
+
+
+def pontos_sinteticos(codigo):
+    return [(datetime.strptime(p["data"], "%d/%m/%Y").date(), p["valor"]) for p in serie_sintetica(codigo, INICIO, FIM)]
+
+
+def armazem_sintetico(diretorio, chamadas=None):
+    # Armazém local alimentado pelas séries sintéticas do sgs_simulado, sem rede
+    def baixar(codigo, data_inicio, data_fim):
+        if chamadas is not None: chamadas.append(codigo)
+        return serie_sintetica(codigo, data_inicio, data_fim, ate=FIM)
+    return series_bcb.ArmazemSeries(str(diretorio), baixar=baixar)
+
+
+@pytest.fixture
+def pacote(tmp_path):
+    armazem = armazem_sintetico(tmp_path / "armazem")
+    caminho = tmp_path / "series.calcjus"
+    pacote_series.gerar_pacote(str(caminho), armazem, INICIO, FIM, TABELA_TJSP)
+    return caminho, armazem
+
+
+@pytest.mark.parametrize("codigo", pacote_series.codigos_pacote())
+def test_gravar_e_ler_devolve_os_mesmos_pontos(pacote, codigo):
+    caminho, armazem = pacote
+    lido = pacote_series.PacoteSeries(str(caminho))
+    esperado = armazem.obter(codigo, INICIO, FIM)
+    assert esperado and lido.obter(codigo, INICIO, FIM) == esperado
+    # Recortes e o texto original do SGS (ex.: "-0.30", "0.012340")
+    assert lido.pontos(codigo, date(2019, 3, 10), date(2020, 2, 1)) == armazem.obter(codigo, date(2019, 3, 10), date(2020, 2, 1))
+    consulta = lido.consultar(codigo, INICIO, FIM)
+    assert consulta["pacote"] == lido.id and consulta["dados_ate"] == esperado[-1][0]
+
+
+def test_tabela_tjsp_e_id_do_pacote(pacote):
+    caminho, _ = pacote
+    lido = pacote_series.PacoteSeries(str(caminho))
+    with open(TABELA_TJSP, "rb") as f:
+        assert lido.conteudo_tjsp() == f.read()
+    assert sorted(lido.codigos()) == pacote_series.codigos_pacote()
+    assert lido.id == lido.cabecalho["sha256"][:16]
+    assert lido.calculadora_tjsp().calcular_fator_composto(date(2023, 1, 1), date(2025, 1, 1)) is not None
+
+
+def test_byte_trocado_e_rejeitado_pelo_checksum(pacote):
+    caminho, _ = pacote
+    conteudo = bytearray(caminho.read_bytes())
+    conteudo[-100] ^= 0x01
+    caminho.write_bytes(bytes(conteudo))
+    with pytest.raises(pacote_series.ErroPacote, match="Checksum"):
+        pacote_series.PacoteSeries(str(caminho))
+    # Sem verificação o arquivo abre (uso de quem já conferiu o pacote)
+    assert pacote_series.PacoteSeries(str(caminho), verificar=False).codigos()
+
+
+def test_arquivo_que_nao_e_pacote(tmp_path):
+    caminho = tmp_path / "outro.bin"
+    caminho.write_bytes(b"PK\x03\x04" + b"\0" * 64)
+    with pytest.raises(pacote_series.ErroPacote, match="não é um pacote"):
+        pacote_series.PacoteSeries(str(caminho))
+
+
+def test_codigo_fora_do_pacote_vai_para_a_reserva(tmp_path):
+    caminho = tmp_path / "series.calcjus"
+    pacote_series.gerar_pacote(str(caminho), armazem_sintetico(tmp_path / "origem"), INICIO, FIM, TABELA_TJSP, codigos=[433])
+    sem_reserva = pacote_series.PacoteSeries(str(caminho))
+    assert sem_reserva.consultar(188, INICIO, FIM) is None and sem_reserva.situacao_local(188, INICIO, FIM) is None
+
+    chamadas = []
+    lido = pacote_series.PacoteSeries(str(caminho), reserva=armazem_sintetico(tmp_path / "reserva", chamadas))
+    consulta = lido.consultar(188, INICIO, FIM)
+    assert consulta["pontos"] == pontos_sinteticos(188) and "pacote" not in consulta
+    assert lido.situacao_local(188, INICIO, FIM)["dados_ate"] == consulta["dados_ate"]
+    # A série do pacote continua saindo dele, sem tocar a reserva
+    assert lido.consultar(433, INICIO, FIM)["pacote"] == lido.id
+    assert chamadas == [188]
+    df = series_bcb.obter_serie(188, INICIO, FIM, armazem=lido)
+    assert len(df) == len(consulta["pontos"])
+
+
+
+def test_lote_igual_com_e_sem_pacote(pacote, tmp_path):
+    import calculo_lote
+    import motor_calculo as motor
+    caminho, armazem = pacote
+    casos = [motor.normalizar_caso(bruto) for bruto in (
+        {"id": "ind", "tipo": "indenizacao", "regime": "misto", "indice": "IPCA", "valor": "1500", "inicio": "2019-03-15",
+         "fim": "2023-06-20", "data_calculo": "2024-05-10"},
+        {"id": "pen", "tipo": "pensao", "indice": "INPC", "valor": "800", "inicio": "2021-01-05", "fim": "2022-12-05",
+         "data_calculo": "2024-05-10"},
+    )]
+    janelas = [motor.janelas_caso(caso) for caso in casos]
+    # Pacote sem reserva: qualquer tentativa de download falharia
+    lido = pacote_series.PacoteSeries(str(caminho))
+    pelo_pacote = list(calculo_lote.calcular_lote(casos, calculo_lote.pre_carregar_series(janelas, armazem=lido), TABELA_TJSP, processos=1))
+    pelo_armazem = list(calculo_lote.calcular_lote(casos, calculo_lote.pre_carregar_series(janelas, armazem=armazem), TABELA_TJSP, processos=1))
+    assert [r["linhas"] for r in pelo_pacote] == [r["linhas"] for r in pelo_armazem]
+    assert all(r["linhas"] and not r.get("erro") for r in pelo_pacote)
@@ -0,0 +1,91 @@
+import io
+import re
+import tracemalloc
+import zlib
+from datetime import date
+from decimal import Decimal
+
+import pandas as pd
+
+from relatorio_pdf import gerar_pdf_relatorio
+
+LINHA = {"Vencimento": "01/01/2020", "Valor Orig.": "R$ 1.000,00", "Audit Fator CM": "1.234567",
+         "V. Corrigido Puro": "R$ 1.234,57", "Audit Juros %": "12%", "Valor Juros": "R$ 10,00", "TOTAL": "R$ 1.244,57"}
+TOTAIS = {'indenizacao': Decimal('1244.57'), 'honorarios': Decimal('0'), 'pensao': Decimal('0'),
+          'multa': Decimal('0'), 'hon_exec': Decimal('0'), 'final': Decimal('1244.57')}
+CONFIG = {'data_calculo': date(2025, 1, 1), 'tipo_regime': 'Padrão'}
+
+
+def gerar(linhas, destino=None):
+    df = pd.DataFrame([dict(LINHA, Vencimento=f"{k:06d}") for k in range(linhas)])
+    return gerar_pdf_relatorio(df, pd.DataFrame(), pd.DataFrame(), None, TOTAIS, CONFIG, destino=destino)
+
+
+def objetos(pdf):
+    # {número: bytes do objeto}, conferindo cada offset da tabela xref
+    inicio_xref = int(re.search(rb"startxref\n(\d+)\n%%EOF\n$", pdf).group(1))
+    cabecalho = re.match(rb"xref\n0 (\d+)\n", pdf[inicio_xref:])
+    entradas = inicio_xref + cabecalho.end()
+    encontrados = {}
+    for numero in range(1, int(cabecalho.group(1))):
+        offset = int(pdf[entradas + 20 * numero:entradas + 20 * numero + 10])
+        assert pdf[offset:].startswith(f"{numero} 0 obj".encode())
+        encontrados[numero] = pdf[offset:pdf.index(b"endobj", offset)]
+    return encontrados
+
+
+def paginas(pdf):
+    # Conteúdo descomprimido de cada página, na ordem de /Kids
+    todos = objetos(pdf)
+    kids = re.findall(rb"(\d+) 0 R", re.search(rb"/Kids \[(.*?)\]", todos[1]).group(1))
+    textos = []
+    for kid in kids:
+        pagina = todos[int(kid)]
+        assert b"/Type /Page" in pagina
+        conteudo = b""
+        for ref in re.findall(rb"(\d+) 0 R", re.search(rb"/Contents (\[.*?\]|\d+ 0 R)", pagina).group(1)):
+            stream = todos[int(ref)]
+            conteudo += zlib.decompress(stream[stream.index(b"stream\n") + 7:stream.rindex(b"\nendstream")])
+        textos.append(conteudo)
+    return textos
+
+
+def test_pdf_valido_com_total_de_paginas_no_rodape():
+    pdf = gerar(400)
+    assert pdf.startswith(b"%PDF-1.3\n")
+    textos = paginas(pdf)
+    assert len(textos) > 10
+    for numero, texto in enumerate(textos, start=1):
+        assert f"(Pagina {numero}/{len(textos)} |".encode() in texto
+        assert b"{nb}" not in texto
+    corpo = b"".join(textos)
+    assert all(f"({k:06d})".encode() in corpo for k in range(400))
+
+
+def test_destino_recebe_o_mesmo_pdf():
+    arquivo = io.BytesIO()
+    assert gerar(50, destino=arquivo) is None
+    assert len(paginas(arquivo.getvalue())) == len(paginas(gerar(50)))
+
+
+def test_memoria_nao_cresce_com_o_numero_de_linhas(tmp_path):
+    def pico(linhas):
+        df = pd.DataFrame([LINHA] * linhas)
+        tracemalloc.start()
+        gerar_pdf_relatorio(df, pd.DataFrame(), pd.DataFrame(), None, TOTAIS, CONFIG, destino=str(tmp_path / "r.pdf"))
+        atual_pico = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return atual_pico
+
+    # 10x mais linhas: só o rodapé e o offset de cada página crescem
+    assert pico(8000) < 2 * pico(800)
+
+
+def test_secoes_de_aluguel_e_art523():
+    aluguel = {'valor_antigo': Decimal('2000'), 'novo_valor': Decimal('2100'), 'indice': 'IGP-M', 'periodo': '01/2024 a 01/2025',
+               'fator': Decimal('1.05')}
+    totais = dict(TOTAIS, multa=Decimal('124.46'), hon_exec=Decimal('124.46'), final=Decimal('1493.49'))
+    df = pd.DataFrame([LINHA] * 3)
+    corpo = b"".join(paginas(gerar_pdf_relatorio(df, pd.DataFrame(), pd.DataFrame(), aluguel, totais, CONFIG)))
+    assert b"5. REAJUSTE DE ALUGUEL" in corpo and b"1.050000" in corpo
+    assert b"6. PENALIDADES" in corpo and b"R$ 124,46" in corpo
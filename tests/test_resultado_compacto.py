@@ -0,0 +1,83 @@
+import os
+from datetime import date
+from decimal import Decimal, ROUND_HALF_UP
+
+import pytest
+
+import motor_calculo as motor
+import motor_vetorizado
+import resultado_compacto as rc
+
+TABELA_TJSP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tabela_tjsp.csv")
+DATA_CALCULO = date(2024, 12, 10)
+
+
+def sem_num(linha):
+    return {k: v for k, v in linha.items() if k != "_num"}
+
+
+def centavos(valor):
+    return valor.quantize(motor.DOIS_DECIMAIS, rounding=ROUND_HALF_UP)
+
+
+@pytest.mark.parametrize("valor", ["0", "0.004", "0.005", "-0.005", "-0.001", "1234.565", "-1234.56", "999999999.995", "1e-30",
+                                   "12345678901234.5"])
+def test_centavos_formatados_iguais_a_formatar_moeda(valor):
+    assert rc.formatar_centavos(rc.centavos_int(Decimal(valor))) == motor.formatar_moeda(Decimal(valor))
+
+
+@pytest.mark.parametrize("fator", ["1", "0.9999995", "1.0000004999", "1.23456789", "12.5", "0.000001"])
+def test_fator_formatado_igual_a_formatar_decimal_str(fator):
+    assert rc.formatar_fator(rc.fator_int(Decimal(fator))) == motor.formatar_decimal_str(Decimal(fator))
+
+
+def test_nulos_viram_traco():
+    assert rc.formatar_centavos(rc.centavos_int(None)) == rc.formatar_fator(rc.fator_int(None)) == "-"
+
+
+@pytest.fixture(scope="module")
+def contexto():
+    from conftest import serie_sintetica_df
+    # Séries só até junho de 2024: as últimas parcelas ficam sem fator ("-")
+    series = {cod: serie_sintetica_df(cod, date(2017, 1, 1), date(2024, 6, 1)) for cod in (433, motor.COD_SELIC)}
+    return {"series": series, "tjsp": motor.CalculadoraTJSP(arquivo_padrao=TABELA_TJSP),
+            "cronograma": motor.gerar_cronograma_pro_rata(date(2018, 3, 15), date(2024, 8, 20), Decimal("1234.56"))}
+
+
+@pytest.mark.parametrize("juros_fase1", [True, False])
+@pytest.mark.parametrize("regime", motor.REGIMES)
+def test_indenizacao_compacta_igual_as_linhas_formatadas(contexto, regime, juros_fase1):
+    series = contexto["series"]
+    resultado = motor_vetorizado.calcular_indenizacao_vetorizada(
+        contexto["cronograma"], regime, DATA_CALCULO, 433, series[433], series[motor.COD_SELIC], contexto["tjsp"],
+        date(2019, 6, 1), date(2021, 12, 9), juros_fase1)
+    antigas = list(resultado.linhas())
+    compacta = rc.IndenizacaoCompacta(resultado)
+    novas = list(compacta.linhas())
+    assert [sem_num(l) for l in novas] == [sem_num(l) for l in antigas]
+    assert [l["_num"] for l in novas] == [centavos(l["_num"]) for l in antigas]
+    assert any(l["Audit Fator CM"] == "-" or l["Audit Fator SELIC"] == "-" for l in novas)
+    # Exportação: fatores exatos, não os 6 dígitos da tela
+    (bloco,) = compacta.blocos()
+    fator_cm = bloco[[nome for nome, _ in rc.IndenizacaoCompacta.ESQUEMA].index("fator_cm")]
+    assert fator_cm == list(resultado.fator_cm)
+
+
+def test_indenizacao_compacta_vazia():
+    assert list(rc.IndenizacaoCompacta.vazia().linhas()) == [] and list(rc.IndenizacaoCompacta.vazia().blocos()) == []
+
+
+def test_pensao_compacta_igual_as_linhas_formatadas(serie_df):
+    df = serie_df(433, date(2019, 1, 1), date(2024, 6, 1))
+    parcelas = motor.gerar_parcelas_pensao(Decimal("850.33"), date(2019, 3, 5), date(2024, 11, 5))
+    # Parcelas quitadas, pagas em parte e com pagamento acima do devido
+    parcelas[2] = (parcelas[2][0], parcelas[2][1], parcelas[2][1])
+    parcelas[3] = (parcelas[3][0], parcelas[3][1], Decimal("300.005"))
+    parcelas[4] = (parcelas[4][0], parcelas[4][1], Decimal("1000"))
+    antigas = motor.calcular_pensao(parcelas, 433, df, None, DATA_CALCULO)
+    compacta = rc.PensaoCompacta(motor.calcular_pensao(parcelas, 433, df, None, DATA_CALCULO, rc.linha_pensao_compacta))
+    novas = list(compacta.linhas())
+    assert len(novas) < len(parcelas)  # parcelas sem fator ficam de fora nos dois
+    assert [sem_num(l) for l in novas] == [sem_num(l) for l in antigas]
+    assert [l["_num"] for l in novas] == [centavos(l["_num"]) for l in antigas]
+    assert sum(l["Base Cálculo"] == "QUITADO" and l["Fator CM"] == l["Juros"] == "-" for l in novas) == 2
@@ -0,0 +1,307 @@
+import gc
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+import pandas as pd
+import pytest
+
+import series_bcb
+from sgs_simulado import ServidorSGSSimulado, serie_sintetica
+
+
+def serie_mensal(meses=120):
+    datas = [date(2010, 1, 1) + timedelta(days=31 * i) for i in range(meses)]
+    datas = [d.replace(day=1) for d in datas]
+    fatores = [Decimal('1') + Decimal(str((i % 13) * 7 + 11)) / Decimal('10000') for i in range(meses)]
+    return pd.DataFrame({'data_dt': datas, 'fator_multi': fatores})
+
+
+def produto_sequencial(df, dt_ini, dt_fim):
+    # Cálculo antigo: máscara sobre a série e laço Decimal
+    fator = Decimal('1')
+    for d, f in zip(df['data_dt'], df['fator_multi']):
+        if dt_ini <= d <= dt_fim: fator *= f
+    return fator
+
+
+def seis_casas(valor):
+    return valor.quantize(Decimal('0.000001'), rounding=ROUND_HALF_UP)
+
+
+def test_fator_por_prefixos_igual_ao_produto_sequencial():
+    df = serie_mensal()
+    datas = list(df['data_dt'])
+    for i in range(0, len(datas), 7):
+        for j in range(i, len(datas), 11):
+            esperado = produto_sequencial(df, datas[i], datas[j])
+            assert seis_casas(series_bcb.calcular_fator_memoria(df, datas[i], datas[j])) == seis_casas(esperado)
+
+
+def test_fator_aceita_datas_fora_dos_pontos():
+    df = serie_mensal()
+    ini, fim = date(2011, 3, 15), date(2014, 7, 20)
+    assert seis_casas(series_bcb.calcular_fator_memoria(df, ini, fim)) == seis_casas(produto_sequencial(df, ini, fim))
+
+
+def test_intervalo_sem_pontos_e_none():
+    df = serie_mensal()
+    assert series_bcb.calcular_fator_memoria(df, date(2030, 1, 1), date(2031, 1, 1)) is None
+    assert series_bcb.calcular_fator_memoria(df, date(2012, 5, 2), date(2012, 5, 20)) is None
+    assert series_bcb.calcular_fator_memoria(pd.DataFrame(), date(2010, 1, 1), date(2011, 1, 1)) is None
+
+
+def test_indice_fica_fora_de_attrs(serie_df):
+    df = serie_df(11, date(2020, 1, 1), date(2024, 12, 31))
+    indice = series_bcb.indice_da_serie(df)
+    for k in range(20000):
+        indice.fator_periodo(date(2020, 1, 1), date(2020, 1, 1 + k % 28))
+    assert "indice_acumulado" not in df.attrs
+    assert series_bcb.indice_da_serie(df) is indice
+    # Acesso a coluna não copia o índice nem o memo
+    inicio = time.perf_counter()
+    for _ in range(50):
+        df["data_dt"]
+        df.iloc[0]
+    assert time.perf_counter() - inicio < 0.5
+
+
+def test_consultas_repetidas_saem_da_memoria(serie_df, monkeypatch):
+    df = serie_df(11, date(2020, 1, 1), date(2024, 12, 31))
+    indice = series_bcb.indice_da_serie(df)
+    fator = indice.fator_periodo(date(2021, 3, 1), date(2024, 6, 30))
+    assert indice.fator_periodo(date(2021, 3, 1), date(2024, 6, 30)) is fator
+    # Intervalo sem pontos também fica memorizado
+    assert indice.fator_periodo(date(2030, 1, 1), date(2030, 2, 1)) is None
+    assert (date(2030, 1, 1), date(2030, 2, 1)) in indice._memo
+    # A memória não cresce sem limite
+    monkeypatch.setattr(series_bcb.IndiceFatorAcumulado, "LIMITE_MEMO", 10)
+    for k in range(25):
+        indice.fator_periodo(date(2020, 1, 1), date(2020, 1, 1) + timedelta(days=k))
+    assert len(indice._memo) <= 10
+    assert indice.fator_periodo(date(2021, 3, 1), date(2024, 6, 30)) == fator
+
+
+def test_indice_liberado_com_o_dataframe(serie_df):
+    df = serie_df(433, date(2020, 1, 1), date(2024, 12, 31))
+    series_bcb.indice_da_serie(df)
+    chave = id(df)
+    assert chave in series_bcb._indices_series
+    del df
+    gc.collect()
+    assert chave not in series_bcb._indices_series
+
+
+def test_recorte_da_serie_tem_indice_proprio(serie_df):
+    df = serie_df(433, date(2020, 1, 1), date(2024, 12, 31))
+    recorte = df[df["data_dt"] >= date(2023, 1, 1)].reset_index(drop=True)
+    fator_total = series_bcb.calcular_fator_memoria(df, date(2020, 1, 1), date(2024, 12, 31))
+    fator_recorte = series_bcb.calcular_fator_memoria(recorte, date(2020, 1, 1), date(2024, 12, 31))
+    assert fator_recorte == series_bcb.calcular_fator_memoria(df, date(2023, 1, 1), date(2024, 12, 31))
+    assert fator_recorte != fator_total
+
+
+def baixar_sintetica(chamadas):
+    def baixar(codigo, data_inicio, data_fim):
+        chamadas.append((codigo, data_inicio, data_fim))
+        return serie_sintetica(codigo, data_inicio, data_fim, ate=date(2024, 6, 30))
+    return baixar
+
+
+def test_situacao_local_antecipa_consultar_sem_rede(tmp_path):
+    chamadas = []
+    armazem = series_bcb.ArmazemSeries(str(tmp_path), baixar=baixar_sintetica(chamadas))
+    janela = (433, date(2020, 1, 1), date(2024, 1, 1))
+    assert armazem.situacao_local(*janela) is None
+
+    consulta = armazem.consultar(*janela)
+    consulta.pop("pontos")
+    assert armazem.situacao_local(*janela) == consulta
+    assert armazem.situacao_local(433, date(2019, 1, 1), date(2024, 1, 1)) is None  # falta a cabeça
+    assert armazem.situacao_local(433, date(2020, 1, 1), date(2024, 12, 1)) is None  # falta a cauda
+    assert armazem.situacao_local(*janela, offline=True)["desatualizada"] is True
+    assert len(chamadas) == 1
+
+
+def test_situacao_local_exige_revalidar_trecho_aberto(tmp_path):
+    armazem = series_bcb.ArmazemSeries(str(tmp_path), baixar=baixar_sintetica([]), ttl_aberto=0)
+    armazem.consultar(433, date(2020, 1, 1), date(2024, 12, 1))
+    # Antes da marca d'água o histórico é fechado; depois dela o TTL expirado pede nova consulta
+    assert armazem.situacao_local(433, date(2020, 1, 1), date(2024, 6, 1))["dados_ate"] == date(2024, 6, 1)
+    assert armazem.situacao_local(433, date(2020, 1, 1), date(2024, 12, 1)) is None
+
+
+# --- CLIENTE SGS (contra o sgs_simulado) ---
+
+@contextmanager
+def cliente_sgs(servidor, trabalhadores=series_bcb.DOWNLOADS_SIMULTANEOS):
+    cliente = series_bcb.ClienteSGS(url_sgs=servidor.url + "/dados/serie/bcdata.sgs.{codigo}/dados", trabalhadores=trabalhadores)
+    # Sem espera entre as tentativas (o retry de 5xx continua valendo, só não dorme)
+    cliente.retry.backoff_factor = 0
+    try:
+        yield cliente
+    finally:
+        cliente.session.close()
+        cliente._pool.shutdown()
+
+
+@pytest.fixture
+def cliente(sgs):
+    with cliente_sgs(sgs) as cliente:
+        yield cliente
+
+
+def test_dividir_janelas_contiguas_de_dez_anos():
+    janelas = series_bcb.dividir_janelas(date(1995, 1, 2), date(2024, 12, 31))
+    assert janelas == [(date(1995, 1, 2), date(2005, 1, 1)), (date(2005, 1, 2), date(2015, 1, 1)),
+                       (date(2015, 1, 2), date(2024, 12, 31))]
+    assert series_bcb.dividir_janelas(date(2020, 2, 29), date(2021, 1, 1)) == [(date(2020, 2, 29), date(2021, 1, 1))]
+    assert series_bcb.dividir_janelas(date(2020, 1, 1), date(2019, 12, 31)) == []
+    # Sem buracos nem sobreposição, em qualquer tamanho de janela
+    janelas = series_bcb.dividir_janelas(date(2000, 2, 29), date(2031, 3, 1), anos=3)
+    assert all(fim + timedelta(days=1) == prox for (_, fim), (prox, _) in zip(janelas, janelas[1:]))
+    assert janelas[0][0] == date(2000, 2, 29) and janelas[-1][1] == date(2031, 3, 1)
+
+
+def test_serie_diaria_longa_baixada_em_janelas(sgs, cliente):
+    dados = cliente.baixar(11, date(1995, 1, 2), date(2024, 12, 31))
+    assert dados == serie_sintetica(11, date(1995, 1, 2), date(2024, 12, 31))
+    # Nenhuma janela passa do limite do SGS (o simulado responderia 406)
+    assert sorted(sgs.requisicoes) == [(11, "02/01/1995", "01/01/2005"), (11, "02/01/2005", "01/01/2015"),
+                                       (11, "02/01/2015", "31/12/2024")]
+
+
+def test_406_nao_e_repetido_e_vira_falha():
+    # SGS com limite menor que o do cliente: toda janela de 10 anos recebe 406. Com a latência,
+    # as duas janelas do segundo pedido já estão no servidor quando a primeira falha
+    with ServidorSGSSimulado(limite_anos_diaria=5, atraso=0.2) as servidor, cliente_sgs(servidor) as cliente:
+        assert cliente.baixar(11, date(2000, 1, 1), date(2009, 12, 31)) is None
+        # 406 é erro do pedido: sem retry, uma requisição por janela
+        assert len(servidor.requisicoes) == 1
+        assert cliente.baixar(11, date(2000, 1, 1), date(2019, 12, 31)) is None
+        assert len(servidor.requisicoes) == 3
+        # Dentro do limite, o mesmo cliente segue funcionando
+        assert cliente.baixar(11, date(2000, 1, 1), date(2003, 12, 31)) == serie_sintetica(11, date(2000, 1, 1), date(2003, 12, 31))
+
+
+def test_falha_cancela_as_janelas_na_fila():
+    # Um trabalhador só: quando a primeira janela falha, as seguintes ainda estão na fila e são
+    # canceladas; a que já tiver começado termina antes do retorno
+    with ServidorSGSSimulado(limite_anos_diaria=5, atraso=0.1) as servidor, cliente_sgs(servidor, trabalhadores=1) as cliente:
+        assert cliente.baixar(11, date(1985, 1, 1), date(2024, 12, 31)) is None
+        feitas = len(servidor.requisicoes)
+        assert feitas <= 2
+        time.sleep(0.3)
+        assert len(servidor.requisicoes) == feitas
+
+
+def test_404_e_serie_vazia(cliente):
+    assert cliente.baixar(433, date(1980, 1, 1), date(1990, 1, 1)) == []
+
+
+def test_pedidos_identicos_simultaneos_viram_um_download():
+    with ServidorSGSSimulado(atraso=0.3) as servidor, cliente_sgs(servidor) as cliente:
+        largada = threading.Barrier(8)
+        resultados = []
+
+        def pedir(codigo, fim):
+            largada.wait()
+            resultados.append(cliente.baixar(codigo, date(2020, 1, 1), fim))
+
+        pedidos = [(4390, date(2024, 1, 1))] * 6 + [(433, date(2024, 1, 1)), (4390, date(2023, 1, 1))]
+        threads = [threading.Thread(target=pedir, args=p) for p in pedidos]
+        for t in threads: t.start()
+        for t in threads: t.join()
+
+        assert len(resultados) == 8
+        assert sorted(servidor.requisicoes) == [(433, "01/01/2020", "01/01/2024"), (4390, "01/01/2020", "01/01/2023"),
+                                                (4390, "01/01/2020", "01/01/2024")]
+        esperado = serie_sintetica(4390, date(2020, 1, 1), date(2024, 1, 1))
+        assert sum(r == esperado for r in resultados) == 6
+        # Terminado o download, um novo pedido vai de novo ao SGS (o agrupamento não é cache)
+        cliente.baixar(4390, date(2020, 1, 1), date(2024, 1, 1))
+        assert len(servidor.requisicoes) == 4
+
+
+# --- ARMAZÉM PERSISTENTE (SQLite temporário + sgs_simulado) ---
+
+def pontos_sinteticos(codigo, inicio, fim):
+    return [(datetime.strptime(p["data"], "%d/%m/%Y").date(), p["valor"]) for p in serie_sintetica(codigo, inicio, fim)]
+
+
+def test_armazem_carga_inicial_e_subintervalos_sem_rede(tmp_path, sgs, cliente):
+    armazem = series_bcb.ArmazemSeries(str(tmp_path), baixar=cliente.baixar)
+    consulta = armazem.consultar(433, date(2015, 1, 1), date(2020, 12, 31))
+    assert consulta["pontos"] == pontos_sinteticos(433, date(2015, 1, 1), date(2020, 12, 31))
+    assert consulta["dados_ate"] == date(2020, 12, 1) and consulta["desatualizada"] is False
+    assert sgs.requisicoes == [(433, "01/01/2015", "31/12/2020")]
+
+    # Subintervalo e o mesmo intervalo: só o disco, inclusive num novo processo (nova instância)
+    assert armazem.obter(433, date(2017, 3, 1), date(2018, 2, 1)) == pontos_sinteticos(433, date(2017, 3, 1), date(2018, 2, 1))
+    novo = series_bcb.ArmazemSeries(str(tmp_path), baixar=cliente.baixar)
+    assert novo.obter(433, date(2015, 1, 1), date(2020, 12, 31)) == consulta["pontos"]
+    assert len(sgs.requisicoes) == 1
+
+
+def test_armazem_baixa_so_cabeca_e_cauda(tmp_path, sgs, cliente):
+    armazem = series_bcb.ArmazemSeries(str(tmp_path), baixar=cliente.baixar)
+    armazem.consultar(433, date(2015, 1, 1), date(2020, 12, 31))
+    # Cauda: a partir do dia seguinte à marca d'água (último ponto publicado)
+    consulta = armazem.consultar(433, date(2015, 1, 1), date(2022, 6, 30))
+    assert sgs.requisicoes[-1] == (433, "02/12/2020", "30/06/2022")
+    assert consulta["dados_ate"] == date(2022, 6, 1)
+    # Cabeça: só o período anterior ao armazenado
+    consulta = armazem.consultar(433, date(2012, 1, 1), date(2022, 6, 30))
+    assert sgs.requisicoes[-1] == (433, "01/01/2012", "31/12/2014")
+    assert consulta["pontos"] == pontos_sinteticos(433, date(2012, 1, 1), date(2022, 6, 30))
+    assert len(sgs.requisicoes) == 3
+
+
+def test_armazem_revalida_so_o_trecho_aberto(tmp_path, sgs, cliente):
+    # TTL vencido: o histórico até a marca d'água não é baixado de novo, só o que vem depois dela
+    armazem = series_bcb.ArmazemSeries(str(tmp_path), baixar=cliente.baixar, ttl_aberto=0)
+    armazem.consultar(433, date(2015, 1, 1), date(2020, 12, 31))
+    armazem.consultar(433, date(2015, 1, 1), date(2020, 12, 31))
+    assert sgs.requisicoes[-1] == (433, "02/12/2020", "31/12/2020")
+    # Consulta que termina antes da marca d'água: nada aberto, nada baixado
+    armazem.consultar(433, date(2016, 1, 1), date(2020, 6, 30))
+    assert len(sgs.requisicoes) == 2
+
+
+def test_armazem_serve_copia_desatualizada_com_bcb_fora_do_ar(tmp_path, sgs, cliente):
+    armazem = series_bcb.ArmazemSeries(str(tmp_path), baixar=cliente.baixar)
+    guardados = armazem.obter(433, date(2015, 1, 1), date(2020, 12, 31))
+    sgs.fora_do_ar = True
+
+    consulta = armazem.consultar(433, date(2015, 1, 1), date(2022, 6, 30))
+    assert consulta["desatualizada"] is True and consulta["pontos"] == guardados
+    assert armazem.bcb_fora_do_ar()
+    assert len(sgs.requisicoes) == 1 + 4  # 503 com 3 retries
+
+    # Enquanto o BCB está fora, a cópia sai na hora, sem nova tentativa dentro da pausa
+    assert armazem.consultar(433, date(2015, 1, 1), date(2022, 6, 30))["desatualizada"] is True
+    assert armazem.consultar(189, date(2015, 1, 1), date(2022, 6, 30)) is None  # sem cópia local
+    assert len(sgs.requisicoes) == 5
+
+
+def test_armazem_revalida_em_segundo_plano_quando_o_bcb_volta(tmp_path, sgs, cliente):
+    armazem = series_bcb.ArmazemSeries(str(tmp_path), baixar=cliente.baixar, pausa_falha=0)
+    armazem.consultar(433, date(2015, 1, 1), date(2020, 12, 31))
+    sgs.fora_do_ar = True
+    assert armazem.consultar(433, date(2015, 1, 1), date(2022, 6, 30))["desatualizada"] is True
+    sgs.fora_do_ar = False
+
+    # Com o BCB marcado fora do ar, a consulta responde do disco e agenda a revalidação
+    assert armazem.consultar(433, date(2015, 1, 1), date(2022, 6, 30))["desatualizada"] is True
+    armazem._pool_revalidacao.shutdown(wait=True)
+    assert not armazem.bcb_fora_do_ar()
+    consulta = armazem.consultar(433, date(2015, 1, 1), date(2022, 6, 30))
+    assert consulta["desatualizada"] is False and consulta["dados_ate"] == date(2022, 6, 1)
+
+
+def test_falha_do_bcb_vira_none(tmp_path):
+    armazem = series_bcb.ArmazemSeries(str(tmp_path), baixar=lambda codigo, inicio, fim: None)
+    assert armazem.obter(433, date(2015, 1, 1), date(2020, 12, 31)) is None
+    assert series_bcb.obter_serie(433, date(2015, 1, 1), date(2020, 12, 31), armazem=armazem) is None
@@ -0,0 +1,74 @@
+import threading
+
+import tarefas
+
+
+def test_substituta_nao_ocupa_trabalhador_enquanto_espera():
+    # Um trabalhador só: a tarefa substituta não pode travá-lo esperando a anterior,
+    # senão a tarefa de outro dono nunca rodaria
+    fila = tarefas.FilaTarefas(trabalhadores=1)
+    liberar = threading.Event()
+    ordem = []
+
+    def longa(tarefa):
+        ordem.append("a")
+        liberar.wait(5)
+        return "a"
+
+    def registrar(nome):
+        def funcao(tarefa):
+            ordem.append(nome)
+            return nome
+        return funcao
+
+    a = fila.enviar("sessao1", "pensao", longa)
+    while a.estado != tarefas.EXECUTANDO:
+        threading.Event().wait(0.01)
+    b = fila.enviar("sessao1", "pensao", registrar("b"), substitui=a.id)
+    outra = fila.enviar("sessao2", "pensao", registrar("outra"))
+    assert b.estado == tarefas.NA_FILA
+    liberar.set()
+    assert fila.aguardar_todas(5)
+    assert ordem == ["a", "outra", "b"] or ordem == ["a", "b", "outra"]
+    assert a.estado == tarefas.CONCLUIDA  # cancelamento só é visto em progresso()
+    assert b.resultado == "b" and outra.resultado == "outra"
+
+
+def test_substituta_espera_a_anterior_terminar():
+    fila = tarefas.FilaTarefas(trabalhadores=4)
+    liberar = threading.Event()
+    eventos = []
+
+    def anterior(tarefa):
+        liberar.wait(5)
+        eventos.append("anterior")
+        tarefa.progresso(1, 1)
+
+    def seguinte(tarefa):
+        eventos.append("seguinte")
+
+    a = fila.enviar("dono", "pensao", anterior)
+    while a.estado != tarefas.EXECUTANDO:
+        threading.Event().wait(0.01)
+    b = fila.enviar("dono", "pensao", seguinte, substitui=a.id)
+    c = fila.enviar("dono", "pensao", seguinte, substitui=b.id)
+    threading.Event().wait(0.1)
+    assert eventos == []
+    liberar.set()
+    assert fila.aguardar_todas(5)
+    assert a.estado == tarefas.CANCELADA
+    assert b.estado == tarefas.CANCELADA and c.estado == tarefas.CONCLUIDA
+    assert eventos == ["anterior", "seguinte"]
+
+
+def test_anterior_cancelada_na_fila_nao_executa():
+    fila = tarefas.FilaTarefas(trabalhadores=1)
+    liberar = threading.Event()
+    executadas = []
+    bloqueio = fila.enviar("outro", "pensao", lambda tarefa: liberar.wait(5))
+    a = fila.enviar("dono", "pensao", lambda tarefa: executadas.append("a"))
+    b = fila.enviar("dono", "pensao", lambda tarefa: executadas.append("b"), substitui=a.id)
+    liberar.set()
+    assert fila.aguardar_todas(5)
+    assert bloqueio.estado == tarefas.CONCLUIDA
+    assert a.estado == tarefas.CANCELADA and executadas == ["b"]